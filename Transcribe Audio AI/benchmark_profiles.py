@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Decoding Profile Benchmark
+Transcribes a sample file with every model/profile combination so the
+real-time factors reported by /api/models reflect this host. Decoding runs
+in this process on every pass, bypassing the window cache and the model
+server, so repeat runs time the models rather than cache hits.
+"""
+
+import sys
+import argparse
+
+from transcribe_audio import transcribe_waveform, DECODE_PROFILES
+from compact_audio import load_audio
+from performance import get_rtf, RTF_STATS_FILE
+
+def benchmark(audio_file_path, model_sizes, decode_profiles):
+    """
+    Run each model/profile combination once and print its real-time factor
+    """
+    audio = load_audio(audio_file_path)
+    for model_size in model_sizes:
+        for decode_profile in decode_profiles:
+            print(f"Benchmarking model={model_size} profile={decode_profile}")
+            transcribe_waveform(audio, model_size, decode_profile=decode_profile)
+            rtf = get_rtf(model_size, decode_profile)
+            print(f"  Real-time factor: {rtf:.3f}" if rtf is not None else "  Real-time factor: -")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Whisper decoding profiles on this host")
+    parser.add_argument("audio_file", help="Sample audio file to transcribe")
+    parser.add_argument("--models", "-m", nargs="+", default=["tiny", "base"],
+                       choices=["tiny", "base", "small", "medium", "large"],
+                       help="Whisper model sizes to benchmark (default: tiny base)")
+    parser.add_argument("--profiles", "-p", nargs="+", default=list(DECODE_PROFILES),
+                       choices=list(DECODE_PROFILES),
+                       help="Decoding profiles to benchmark (default: all)")
+    
+    args = parser.parse_args()
+    
+    try:
+        benchmark(args.audio_file, args.models, args.profiles)
+        print(f"\nResults saved to: {RTF_STATS_FILE}")
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Cooperative Cancellation for ConvertAnything
+Long-running transcription steps check a CancelToken between units of work
+(each 30 second Whisper window, each pyannote step) and stop by raising
+TranscriptionCancelled.
+"""
+
+import time
+import threading
+
+class TranscriptionCancelled(Exception):
+    """Raised when a transcription is cancelled before it finishes"""
+
+class DeadlineExceeded(TranscriptionCancelled):
+    """Raised when a transcription runs past its deadline"""
+
+class CancelToken:
+    """
+    Cancellation flag with an optional deadline
+
+    Args:
+        timeout (float): Seconds from now after which work should stop
+    """
+
+    def __init__(self, timeout=None):
+        self._event = threading.Event()
+        self.reason = None
+        self.deadline = time.monotonic() + timeout if timeout else None
+
+    def cancel(self, reason='cancelled'):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def is_cancelled(self):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.cancel('deadline exceeded')
+        return self._event.is_set()
+
+    def remaining(self):
+        """Seconds left before the deadline, or None without one"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        """Raise if the work should stop"""
+        if self.is_cancelled():
+            if self.reason == 'deadline exceeded':
+                raise DeadlineExceeded("Transcription deadline exceeded")
+            raise TranscriptionCancelled(f"Transcription {self.reason}")
+
+class CancellableModel:
+    """
+    Whisper model wrapper that checks a CancelToken before every window
+
+    whisper.transcribe() calls model.decode() once per 30 second window (and
+    once per temperature fallback), so checking there gives a cancellation
+    point inside the decode loop without modifying Whisper.
+    """
+
+    def __init__(self, model, token):
+        self._model = model
+        self._token = token
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    def __call__(self, *args, **kwargs):
+        return self._model(*args, **kwargs)
+
+    def decode(self, *args, **kwargs):
+        self._token.check()
+        return self._model.decode(*args, **kwargs)
+
+    def detect_language(self, *args, **kwargs):
+        self._token.check()
+        return self._model.detect_language(*args, **kwargs)
+
+    def transcribe(self, audio, **options):
+        # Run Whisper's transcribe loop with this wrapper as the model
+        self._token.check()
+        return type(self._model).transcribe(self, audio, **options)
+
+def cancellable(model, token):
+    """Wrap a Whisper model with cancellation points when a token is given"""
+    if token is None:
+        return model
+    return CancellableModel(model, token)
+
+class CancellableHook:
+    """
+    pyannote pipeline hook that checks a CancelToken at every pipeline step
+    """
+
+    def __init__(self, token, hook=None):
+        self._token = token
+        self._hook = hook
+
+    def __call__(self, *args, **kwargs):
+        self._token.check()
+        if self._hook is not None:
+            return self._hook(*args, **kwargs)
@@ -0,0 +1,119 @@
+"""
+Compact Audio Uploads for ConvertAnything
+Whisper wants 16 kHz mono samples, which is what the web UI now sends when
+the browser can downmix and resample. A WAV file already in that shape is
+read straight into memory here instead of going through an ffmpeg process;
+everything else is decoded by ffmpeg as before.
+"""
+
+import os
+import struct
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+# WAV headers are searched for the data chunk within this many bytes
+HEADER_SEARCH_BYTES = 4096
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+def compact_format(head):
+    """
+    Check whether a file starts like a 16 kHz mono WAV
+
+    Args:
+        head (bytes): The first bytes of the file (HEADER_SEARCH_BYTES is enough)
+
+    Returns:
+        tuple: (data offset, data length in bytes or None if unknown, numpy dtype),
+            or None if the file needs ffmpeg
+    """
+    if len(head) < 12 or head[:4] != b'RIFF' or head[8:12] != b'WAVE':
+        return None
+
+    dtype = None
+    position = 12
+    while position + 8 <= len(head):
+        chunk_id = head[position:position + 4]
+        chunk_size, = struct.unpack('<I', head[position + 4:position + 8])
+        body = position + 8
+
+        if chunk_id == b'fmt ':
+            if body + 16 > len(head):
+                return None
+            audio_format, channels, rate, _, _, bits = struct.unpack('<HHIIHH', head[body:body + 16])
+            if audio_format == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40 and body + 26 <= len(head):
+                # The real format is the start of the sub-format GUID
+                audio_format, = struct.unpack('<H', head[body + 24:body + 26])
+            if channels != 1 or rate != SAMPLE_RATE:
+                return None
+            if audio_format == WAVE_FORMAT_PCM and bits == 16:
+                dtype = np.dtype('<i2')
+            elif audio_format == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+                dtype = np.dtype('<f4')
+            else:
+                return None
+
+        elif chunk_id == b'data':
+            if dtype is None:
+                return None
+            # Streaming writers leave the size at 0 or 0xFFFFFFFF: the data runs to the end
+            length = chunk_size if 0 < chunk_size < 0xFFFFFFFF else None
+            return body, length, dtype
+
+        position = body + chunk_size + (chunk_size & 1)
+    return None
+
+def _layout(path):
+    with open(path, 'rb') as f:
+        return compact_format(f.read(HEADER_SEARCH_BYTES))
+
+def read_compact(path):
+    """
+    Read a 16 kHz mono WAV without ffmpeg
+
+    Returns:
+        numpy.ndarray: float32 samples in [-1, 1], or None if the file is not compact
+    """
+    try:
+        layout = _layout(path)
+    except OSError:
+        return None
+    if layout is None:
+        return None
+
+    offset, length, dtype = layout
+    count = length // dtype.itemsize if length is not None else -1
+    samples = np.fromfile(path, dtype=dtype, count=count, offset=offset)
+    if dtype.kind == 'i':
+        return samples.astype(np.float32) / 32768.0
+    return samples.astype(np.float32, copy=False)
+
+def compact_duration(path):
+    """Duration of a 16 kHz mono WAV from its header, or None if the file is not compact"""
+    try:
+        layout = _layout(path)
+        if layout is None:
+            return None
+        offset, length, dtype = layout
+        if length is None:
+            length = os.path.getsize(path) - offset
+    except OSError:
+        return None
+    return length / dtype.itemsize / SAMPLE_RATE
+
+def load_audio(path):
+    """
+    Load a file as 16 kHz mono float32 samples, as whisper.load_audio() does
+
+    Compact WAV files are read directly; anything else is decoded by ffmpeg.
+    """
+    samples = read_compact(path)
+    if samples is not None:
+        return samples
+
+    import whisper
+    return whisper.load_audio(path)
@@ -0,0 +1,339 @@
+"""
+Transcript Exports for ConvertAnything
+Renders a transcription result as TXT, SRT, VTT, JSON or PDF. Every format
+is a generator of byte chunks, so an export can be written to a file or an
+HTTP response as it is produced, in memory that does not grow with the
+length of the recording.
+"""
+
+import os
+import json
+import time
+import zlib
+import textwrap
+from datetime import datetime
+from pathlib import Path
+
+# Content type of each export format
+EXPORT_FORMATS = {
+    'txt': 'text/plain; charset=utf-8',
+    'srt': 'application/x-subrip; charset=utf-8',
+    'vtt': 'text/vtt; charset=utf-8',
+    'json': 'application/json',
+    'pdf': 'application/pdf',
+}
+
+# Text is handed out in chunks of about this many bytes
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# Rendered exports of finished jobs, kept for repeat downloads
+EXPORT_CACHE_DIR = os.getenv(
+    'EXPORT_CACHE_DIR',
+    str(Path.home() / '.cache' / 'convertanything' / 'exports')
+)
+EXPORT_CACHE_SECONDS = int(os.getenv('EXPORT_CACHE_SECONDS', '3600'))
+
+def format_time(seconds):
+    """Format seconds to MM:SS format"""
+    minutes = int(seconds // 60)
+    secs = int(seconds % 60)
+    return f"{minutes:02d}:{secs:02d}"
+
+def format_timestamp_srt(seconds, separator=','):
+    """Format timestamp for SRT subtitle format (VTT uses '.' before the milliseconds)"""
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    millisecs = int((seconds % 1) * 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millisecs:03d}"
+
+def has_speakers(result):
+    return any('speaker' in segment for segment in result.get('segments', []))
+
+def _render_txt(result, source, model):
+    if not has_speakers(result):
+        yield "AUDIO TRANSCRIPTION\n"
+        yield "=" * 50 + "\n\n"
+        yield f"Source File: {source}\n"
+        yield f"Transcribed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+        yield f"Model Used: {model or 'Whisper AI'}\n\n"
+        yield "TRANSCRIPT:\n"
+        yield "-" * 20 + "\n\n"
+        text = result["text"]
+        for start in range(0, len(text), EXPORT_CHUNK_BYTES):
+            yield text[start:start + EXPORT_CHUNK_BYTES]
+        return
+
+    yield "AUDIO TRANSCRIPTION WITH SPEAKER SEPARATION\n"
+    yield "=" * 60 + "\n\n"
+    yield f"Source File: {source}\n"
+    yield f"Transcribed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+    yield f"Model Used: {model or 'Whisper AI'} + Speaker Diarization\n"
+    yield f"Language: {result.get('language', 'unknown')}\n\n"
+    yield "TRANSCRIPT BY SPEAKER:\n"
+    yield "-" * 30 + "\n\n"
+
+    current_speaker = None
+    for segment in result['segments']:
+        speaker = segment.get('speaker', 'Unknown')
+        # Add speaker header when speaker changes
+        if speaker != current_speaker:
+            yield f"\n[{speaker}] ({format_time(segment['start'])} - {format_time(segment['end'])}):\n"
+            current_speaker = speaker
+        yield f"{segment['text'].strip()} "
+
+    yield "\n\n" + "=" * 60 + "\n"
+    yield "DETAILED TIMELINE:\n"
+    yield "-" * 20 + "\n\n"
+    for segment in result['segments']:
+        speaker = segment.get('speaker', 'Unknown')
+        yield f"[{format_time(segment['start'])} - {format_time(segment['end'])}] {speaker}: {segment['text'].strip()}\n"
+
+def _render_srt(result, source, model):
+    for i, segment in enumerate(result['segments'], 1):
+        text = segment['text'].strip()
+        if 'speaker' in segment:
+            text = f"[{segment['speaker']}] {text}"
+        yield f"{i}\n"
+        yield f"{format_timestamp_srt(segment['start'])} --> {format_timestamp_srt(segment['end'])}\n"
+        yield f"{text}\n\n"
+
+def _render_vtt(result, source, model):
+    yield "WEBVTT\n\n"
+    for segment in result['segments']:
+        text = segment['text'].strip()
+        if 'speaker' in segment:
+            # Voice span, so players can show or style the speaker
+            text = f"<v {segment['speaker']}>{text}"
+        yield f"{format_timestamp_srt(segment['start'], '.')} --> {format_timestamp_srt(segment['end'], '.')}\n"
+        yield f"{text}\n\n"
+
+def _render_json(result, source, model):
+    # The result's own fields, then the export details, then one segment at a time
+    yield "{"
+    for key, value in result.items():
+        if key == 'segments':
+            continue
+        yield f"\n  {json.dumps(key)}: "
+        if isinstance(value, str):
+            # The full text of a long recording is encoded a slice at a time
+            yield '"'
+            for start in range(0, len(value), EXPORT_CHUNK_BYTES):
+                yield json.dumps(value[start:start + EXPORT_CHUNK_BYTES], ensure_ascii=False)[1:-1]
+            yield '",'
+        else:
+            yield json.dumps(value, ensure_ascii=False) + ","
+    yield "\n  \"export\": " + json.dumps({
+        'source_file': source,
+        'model': model,
+        'exported_at': datetime.now().isoformat(),
+        'speaker_count': len({segment.get('speaker') for segment in result.get('segments', [])
+                              if 'speaker' in segment}),
+    }, ensure_ascii=False) + ","
+    yield "\n  \"segments\": ["
+    for i, segment in enumerate(result.get('segments', [])):
+        yield ("," if i else "") + "\n    " + json.dumps(segment, ensure_ascii=False)
+    yield "\n  ]\n}\n"
+
+def _chunked(pieces):
+    """Encode text pieces and hand them out in chunks of EXPORT_CHUNK_BYTES"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        data = piece.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+# PDF page layout, in points (A4)
+PDF_PAGE_SIZE = (595, 842)
+PDF_MARGIN = 56
+PDF_LINE_CHARACTERS = 95
+
+def _pdf_escape(text):
+    # The standard fonts only cover WinAnsi; other characters become '?'
+    data = text.encode('cp1252', errors='replace')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+def _pdf_lines(result, source, model):
+    """(font, size, text, space after) for each line of the PDF"""
+    yield 'F2', 20, 'Audio Transcription', 16
+    yield 'F1', 12, f"Source: {source}", 6
+    yield 'F1', 12, f"Date: {datetime.now().strftime('%Y-%m-%d')}", 6
+    yield 'F1', 12, f"Duration: {format_time(result.get('duration') or 0)}", 6
+    if has_speakers(result):
+        speakers = len({segment.get('speaker') for segment in result['segments']})
+        yield 'F1', 12, f"Speakers: {speakers}", 6
+    yield 'F1', 12, '', 12
+
+    for segment in result.get('segments', []):
+        heading = f"[{format_time(segment['start'])}]"
+        if 'speaker' in segment:
+            heading += f" {segment['speaker']}:"
+        yield 'F2', 10, heading, 4
+        lines = textwrap.wrap(segment['text'].strip(), PDF_LINE_CHARACTERS) or ['']
+        for i, line in enumerate(lines):
+            yield 'F1', 10, line, 10 if i == len(lines) - 1 else 4
+
+def _render_pdf(result, source, model):
+    """Write a PDF page by page, keeping only the object offsets"""
+    width, height = PDF_PAGE_SIZE
+    offsets = {}
+    position = 0
+    page_ids = []
+    next_id = 5
+
+    def emit(object_id, body):
+        nonlocal position
+        offsets[object_id] = position
+        data = f"{object_id} 0 obj\n".encode('ascii') + body + b"\nendobj\n"
+        position += len(data)
+        return data
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    position = len(header)
+    yield header
+    yield emit(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    yield emit(4, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+
+    def page(commands):
+        nonlocal next_id
+        content_id, page_id = next_id, next_id + 1
+        next_id += 2
+        stream = zlib.compress(b"BT\n" + b"".join(commands) + b"ET")
+        chunk = emit(content_id, b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream)
+                     + stream + b"\nendstream")
+        chunk += emit(page_id, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+                                f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> "
+                                f"/Contents {content_id} 0 R >>").encode('ascii'))
+        page_ids.append(page_id)
+        return chunk
+
+    commands = []
+    y = height - PDF_MARGIN
+    for font, size, text, space_after in _pdf_lines(result, source, model):
+        if y - size < PDF_MARGIN and commands:
+            yield page(commands)
+            commands = []
+            y = height - PDF_MARGIN
+        y -= size
+        commands.append(b"/%s %d Tf 1 0 0 1 %d %.1f Tm (%s) Tj\n" % (
+            font.encode('ascii'), size, PDF_MARGIN, y, _pdf_escape(text)))
+        y -= space_after
+    yield page(commands)
+
+    kids = ' '.join(f"{page_id} 0 R" for page_id in page_ids)
+    yield emit(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode('ascii'))
+    yield emit(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    xref = [f"xref\n0 {next_id}\n0000000000 65535 f \n"]
+    for object_id in range(1, next_id):
+        xref.append(f"{offsets[object_id]:010d} 00000 n \n")
+    xref.append(f"trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{position}\n%%EOF\n")
+    yield ''.join(xref).encode('ascii')
+
+RENDERERS = {
+    'txt': _render_txt,
+    'srt': _render_srt,
+    'vtt': _render_vtt,
+    'json': _render_json,
+}
+
+def render_export(result, output_format, source='', model=None):
+    """
+    Render a transcription result as a stream of bytes
+
+    Args:
+        result (dict): Transcription result with 'text' and 'segments'
+        output_format (str): One of EXPORT_FORMATS
+        source (str): Source file name shown in the export
+        model (str): Model name shown in the export
+
+    Returns:
+        generator: Chunks of the rendered file
+    """
+    if output_format == 'pdf':
+        return _render_pdf(result, source, model)
+    if output_format not in RENDERERS:
+        raise ValueError(f"Unsupported export format: {output_format}")
+    return _chunked(RENDERERS[output_format](result, source, model))
+
+def write_export(result, output_format, output_file, source='', model=None):
+    """Render a transcription result into a file"""
+    with open(output_file, 'wb') as f:
+        for chunk in render_export(result, output_format, source, model):
+            f.write(chunk)
+    return output_file
+
+class ExportCache:
+    """
+    Rendered exports on disk, one file per result and format
+
+    Args:
+        root (str): Directory holding the rendered files
+    """
+
+    def __init__(self, root=EXPORT_CACHE_DIR):
+        self.root = root
+
+    def path(self, key, output_format):
+        return os.path.join(self.root, f'{key}.{output_format}')
+
+    def get(self, key, output_format):
+        """Path of a cached export, or None"""
+        path = self.path(key, output_format)
+        return path if os.path.exists(path) else None
+
+    def stream(self, key, output_format, chunks):
+        """
+        Pass chunks through while saving them, keeping the file once all have gone out
+
+        A download that stops early leaves nothing behind.
+        """
+        path = self.path(key, output_format)
+        temp_path = f'{path}.{os.getpid()}.{id(chunks)}.tmp'
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            f = open(temp_path, 'wb')
+        except OSError as e:
+            print(f"Warning: Could not cache export {key}.{output_format}: {e}")
+            yield from chunks
+            return
+
+        complete = False
+        try:
+            with f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(temp_path, path)
+            complete = True
+        finally:
+            if not complete:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def expire(self):
+        """Remove exports older than EXPORT_CACHE_SECONDS"""
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+        now = time.time()
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                if now - os.path.getmtime(path) > EXPORT_CACHE_SECONDS:
+                    os.remove(path)
+            except OSError:
+                pass
+
+# Shared by all requests in this process
+export_cache = ExportCache()
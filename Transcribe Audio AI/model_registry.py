@@ -0,0 +1,137 @@
+"""
+Model Registry for ConvertAnything
+Keeps loaded Whisper models and the diarization pipeline in memory so
+repeated transcriptions reuse them instead of reloading from disk.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import whisper
+
+# Number of Whisper models kept loaded at once (least recently used is evicted;
+# models being decoded with are kept until they are done)
+MAX_CACHED_MODELS = int(os.getenv('MAX_CACHED_MODELS', '2'))
+
+_whisper_models = OrderedDict()
+_diarization_pipeline = None
+_diarization_loaded = False
+_lock = threading.RLock()
+
+# Whisper keeps its KV cache in forward hooks on the model's decoder modules,
+# so each model object decodes one request at a time
+_inference_locks = {}
+
+# Requests decoding with, or waiting to decode with, each model
+_pins = {}
+
+def _evict():
+    """Unload least recently used models over the limit that nobody is using"""
+    for model_size in list(_whisper_models):
+        if len(_whisper_models) <= MAX_CACHED_MODELS:
+            break
+        if not _pins.get(model_size):
+            del _whisper_models[model_size]
+            print(f"Unloading Whisper model: {model_size}")
+
+def get_whisper_model(model_size):
+    """
+    Return a loaded Whisper model, loading it on first use
+
+    Args:
+        model_size (str): Whisper model size (tiny, base, small, medium, large)
+
+    Returns:
+        Loaded Whisper model
+    """
+    with _lock:
+        if model_size in _whisper_models:
+            _whisper_models.move_to_end(model_size)
+            return _whisper_models[model_size]
+
+        print(f"Loading Whisper model: {model_size}")
+        print("This may take a moment on first run as the model needs to be downloaded...")
+        model = whisper.load_model(model_size)
+
+        _whisper_models[model_size] = model
+        _evict()
+        return model
+
+@contextmanager
+def model_in_use(model_size, cancel_token=None):
+    """
+    Hold a cached Whisper model for decoding
+
+    Requests for the same model take turns; different models still run in
+    parallel. A cancelled request stops waiting for its turn. The model is
+    not evicted while requests use it or wait for it, since a request would
+    otherwise keep decoding with weights the cache no longer counts and the
+    next one would load a second copy.
+
+    Args:
+        model_size (str): Whisper model size about to decode
+        cancel_token (CancelToken): Checked while waiting for the model
+    """
+    with _lock:
+        lock = _inference_locks.setdefault(model_size, threading.Lock())
+        _pins[model_size] = _pins.get(model_size, 0) + 1
+    try:
+        while not lock.acquire(timeout=0.5):
+            if cancel_token is not None:
+                cancel_token.check()
+        try:
+            yield
+        finally:
+            lock.release()
+    finally:
+        with _lock:
+            _pins[model_size] -= 1
+            if not _pins[model_size]:
+                del _pins[model_size]
+            # Models loaded while this one was pinned may have left the cache over the limit
+            _evict()
+
+def get_diarization_pipeline():
+    """
+    Return the pyannote diarization pipeline, or None if it cannot be loaded
+    """
+    global _diarization_pipeline, _diarization_loaded
+
+    with _lock:
+        if _diarization_loaded:
+            return _diarization_pipeline
+
+        from pyannote.audio import Pipeline
+
+        print("Loading speaker diarization model...")
+        print("Note: This requires a Hugging Face token for pyannote models.")
+        print("You can get one free at: https://huggingface.co/settings/tokens")
+
+        try:
+            _diarization_pipeline = Pipeline.from_pretrained(
+                "pyannote/speaker-diarization-3.1",
+                use_auth_token=None  # Will use HF_TOKEN environment variable if set
+            )
+        except Exception as e:
+            print(f"Warning: Could not load speaker diarization model: {e}")
+            print("Falling back to simple speaker detection...")
+            _diarization_pipeline = None
+
+        _diarization_loaded = True
+        return _diarization_pipeline
+
+def loaded_models():
+    """Return the sizes of the Whisper models currently in memory"""
+    with _lock:
+        return list(_whisper_models)
+
+def unload_all():
+    """Drop every cached model so the next use loads fresh weights"""
+    global _diarization_pipeline, _diarization_loaded
+
+    with _lock:
+        _whisper_models.clear()
+        _diarization_pipeline = None
+        _diarization_loaded = False
@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Local Model Server for ConvertAnything
+A long-lived daemon that owns the model registry and runs transcription and
+diarization for every caller on the host over a Unix socket, so the web app
+and batch scripts share one warm copy of each model and one scheduler.
+
+Protocol: each message is a frame of
+    FRAME_HEADER (magic, JSON length, PCM length) + JSON header + PCM payload
+where the payload is raw 16 kHz mono float32 little-endian samples. A
+request carries {'op': ..., 'params': {...}}; the server answers with zero
+or more {'type': 'update'} frames and one 'result' or 'error' frame.
+Closing the connection mid-request cancels the work.
+"""
+
+import os
+import sys
+import json
+import time
+import stat
+import struct
+import select
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+import traceback
+import socketserver
+
+import numpy as np
+
+from cancellation import CancelToken, TranscriptionCancelled, DeadlineExceeded
+from performance import record_metric
+
+# Socket shared by the daemon and its clients
+MODEL_SERVER_SOCKET = os.getenv(
+    'MODEL_SERVER_SOCKET',
+    os.path.join(tempfile.gettempdir(), 'convertanything-models.sock')
+)
+
+# Model runs executed at once; the rest wait in the scheduler
+MODEL_SERVER_CONCURRENCY = int(os.getenv('MODEL_SERVER_CONCURRENCY', '1'))
+
+# Idle connections each client process keeps open for reuse
+MODEL_SERVER_POOL_SIZE = int(os.getenv('MODEL_SERVER_POOL_SIZE', '4'))
+
+FRAME_MAGIC = b'CAMS'
+FRAME_HEADER = struct.Struct('!4sII')
+PCM_DTYPE = np.dtype('<f4')
+
+# Seconds between cancellation checks while waiting on the other side
+POLL_SECONDS = 0.5
+
+# Set in the daemon so library code there runs models itself
+SERVING = False
+
+class ModelServerError(Exception):
+    """Raised when the model server reports a failure or drops the connection"""
+
+class StaleConnection(Exception):
+    """A pooled connection was closed before the server answered"""
+
+def _json_default(value):
+    # Whisper results can carry numpy scalars and arrays
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def send_frame(sock, header, audio=None):
+    """Send a JSON header and an optional waveform as one frame"""
+    body = json.dumps(header, default=_json_default).encode('utf-8')
+    pcm = b'' if audio is None else np.ascontiguousarray(audio, dtype=PCM_DTYPE).tobytes()
+    sock.sendall(FRAME_HEADER.pack(FRAME_MAGIC, len(body), len(pcm)) + body)
+    if pcm:
+        sock.sendall(pcm)
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Connection closed mid-frame")
+        received += count
+    return buffer
+
+def recv_frame(sock):
+    """
+    Receive one frame
+
+    Returns:
+        tuple: (header dict, waveform or None), or (None, None) if the peer
+        closed the connection between frames
+    """
+    first = sock.recv(FRAME_HEADER.size, socket.MSG_WAITALL)
+    if not first:
+        return None, None
+    if len(first) < FRAME_HEADER.size:
+        first += _recv_exact(sock, FRAME_HEADER.size - len(first))
+    magic, body_length, pcm_length = FRAME_HEADER.unpack(first)
+    if magic != FRAME_MAGIC:
+        raise ModelServerError("Bad frame from model server peer")
+
+    header = json.loads(_recv_exact(sock, body_length).decode('utf-8'))
+    audio = None
+    if pcm_length:
+        # A bytearray keeps the array writable for torch.from_numpy()
+        audio = np.frombuffer(_recv_exact(sock, pcm_length), dtype=PCM_DTYPE)
+    return header, audio
+
+# ---------------------------------------------------------------------------
+# Daemon
+# ---------------------------------------------------------------------------
+
+class Scheduler:
+    """
+    Limits concurrent model runs across every client of the daemon
+    """
+
+    def __init__(self, concurrency=MODEL_SERVER_CONCURRENCY):
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.waiting = 0
+
+    def run(self, func, cancel_token):
+        with self._lock:
+            self.waiting += 1
+        start_time = time.perf_counter()
+        try:
+            # Wait for a slot, giving up if the caller goes away meanwhile
+            while not self._slots.acquire(timeout=POLL_SECONDS):
+                cancel_token.check()
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        record_metric('model_server_queue_seconds', time.perf_counter() - start_time)
+
+        with self._lock:
+            self.running += 1
+        try:
+            cancel_token.check()
+            return func()
+        finally:
+            with self._lock:
+                self.running -= 1
+            self._slots.release()
+
+    def status(self):
+        with self._lock:
+            return {'running': self.running, 'waiting': self.waiting}
+
+def _watch_connection(sock, cancel_token, done):
+    """Cancel the request's work once its client disconnects"""
+    while not done.is_set():
+        try:
+            readable, _, _ = select.select([sock], [], [], POLL_SECONDS)
+            if readable and sock.recv(1, socket.MSG_PEEK) == b'':
+                cancel_token.cancel('client disconnected')
+                return
+        except (OSError, ValueError):
+            cancel_token.cancel('client disconnected')
+            return
+
+class ModelRequestHandler(socketserver.BaseRequestHandler):
+    """
+    Serves requests from one client connection until it closes
+    """
+
+    def handle(self):
+        while True:
+            try:
+                header, audio = recv_frame(self.request)
+            except (OSError, ModelServerError, ValueError):
+                return
+            if header is None:
+                return
+            try:
+                self.dispatch(header, audio)
+            except OSError:
+                # The client went away while we were answering
+                return
+
+    def dispatch(self, header, audio):
+        op = header.get('op')
+        params = header.get('params') or {}
+        cancel_token = CancelToken(params.pop('timeout', None))
+        done = threading.Event()
+        watcher = threading.Thread(target=_watch_connection,
+                                   args=(self.request, cancel_token, done), daemon=True)
+        watcher.start()
+
+        start_time = time.perf_counter()
+        try:
+            handler = getattr(self, f'op_{op}', None)
+            if handler is None:
+                raise ValueError(f"Unknown model server operation: {op}")
+            result = handler(params, audio, cancel_token)
+            done.set()
+            send_frame(self.request, {'type': 'result', 'result': result})
+        except TranscriptionCancelled as e:
+            done.set()
+            send_frame(self.request, {'type': 'error', 'error': str(e), 'cancelled': cancel_token.reason})
+        except OSError:
+            raise
+        except Exception as e:
+            done.set()
+            print(f"Model server {op} failed: {str(e)}")
+            print(traceback.format_exc())
+            send_frame(self.request, {'type': 'error', 'error': str(e)})
+        finally:
+            done.set()
+            record_metric(f'model_server_{op}_seconds', time.perf_counter() - start_time)
+
+    def op_ping(self, params, audio, cancel_token):
+        from model_registry import loaded_models
+
+        return {'models': loaded_models(), 'scheduler': self.server.scheduler.status(), 'pid': os.getpid()}
+
+    def op_transcribe(self, params, audio, cancel_token):
+        from transcribe_audio import transcribe_waveform
+
+        return self.server.scheduler.run(
+            lambda: transcribe_waveform(audio, cancel_token=cancel_token, **params), cancel_token
+        )
+
+    def op_draft(self, params, audio, cancel_token):
+        from progressive import draft_then_refine
+
+        def on_update(stage, partial, progress):
+            send_frame(self.request, {'type': 'update', 'stage': stage,
+                                      'partial': partial, 'progress': progress})
+
+        return self.server.scheduler.run(
+            lambda: draft_then_refine(audio, on_update=on_update, cancel_token=cancel_token, **params),
+            cancel_token
+        )
+
+    def op_diarize(self, params, audio, cancel_token):
+        from transcribe_with_speakers import diarize_waveform
+
+        return self.server.scheduler.run(
+            lambda: diarize_waveform(audio, cancel_token=cancel_token, **params), cancel_token
+        )
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, concurrency=MODEL_SERVER_CONCURRENCY):
+        self.scheduler = Scheduler(concurrency)
+        super().__init__(socket_path, ModelRequestHandler)
+
+def serve(socket_path=MODEL_SERVER_SOCKET, preload=(), preload_diarization=False,
+          concurrency=MODEL_SERVER_CONCURRENCY):
+    """
+    Run the model server until interrupted
+
+    Args:
+        socket_path (str): Unix socket to listen on
+        preload (list): Whisper model sizes to load before accepting requests
+        preload_diarization (bool): Also load the pyannote pipeline up front
+        concurrency (int): Model runs executed at the same time
+    """
+    global SERVING
+    import model_registry
+
+    SERVING = True
+    for model_size in preload:
+        model_registry.get_whisper_model(model_size)
+    if preload_diarization:
+        model_registry.get_diarization_pipeline()
+
+    # Replace a socket left behind by a previous daemon that did not shut down
+    if os.path.exists(socket_path):
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            raise RuntimeError(f"{socket_path} exists and is not a socket")
+        if ModelServerClient(socket_path).ping() is not None:
+            raise RuntimeError(f"A model server is already listening on {socket_path}")
+        os.remove(socket_path)
+
+    server = ModelServer(socket_path, concurrency)
+    # shutdown() waits for serve_forever() to return, so it must run on another thread
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    print(f"Model server listening on {socket_path} (concurrency {concurrency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nModel server stopped")
+    finally:
+        server.server_close()
+        try:
+            os.remove(socket_path)
+        except OSError:
+            pass
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+class ModelServerClient:
+    """
+    Thin client for the model server with a pool of reusable connections
+    """
+
+    def __init__(self, socket_path=MODEL_SERVER_SOCKET, pool_size=MODEL_SERVER_POOL_SIZE):
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _checkout(self):
+        with self._lock:
+            # Connections inherited across fork() belong to the parent
+            if self._pid != os.getpid():
+                self._idle = []
+                self._pid = os.getpid()
+            if self._idle:
+                return self._idle.pop(), True
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock, False
+
+    def _checkin(self, sock):
+        with self._lock:
+            if len(self._idle) < self.pool_size and self._pid == os.getpid():
+                self._idle.append(sock)
+                return
+        sock.close()
+
+    def _read_response(self, sock, on_update, cancel_token):
+        """Read frames until the result or error frame, forwarding updates"""
+        first = True
+        while True:
+            if cancel_token is not None:
+                readable, _, _ = select.select([sock], [], [], POLL_SECONDS)
+                if not readable:
+                    if cancel_token.is_cancelled():
+                        # Closing the connection tells the server to stop
+                        sock.close()
+                        cancel_token.check()
+                    continue
+            header, _ = recv_frame(sock)
+            if header is None:
+                raise StaleConnection() if first else ModelServerError("Model server closed the connection")
+            first = False
+            if header['type'] != 'update':
+                return header
+            if on_update is not None:
+                on_update(header['stage'], header['partial'], header['progress'])
+
+    def request(self, op, params=None, audio=None, on_update=None, cancel_token=None):
+        """
+        Run one operation on the server
+
+        Args:
+            op (str): Operation name (ping, transcribe, draft, diarize)
+            params (dict): Keyword arguments for the operation
+            audio: 16 kHz mono waveform sent as PCM, if the operation needs one
+            on_update (callable): Receives (stage, partial, progress) update frames
+            cancel_token (CancelToken): Closing the connection cancels the work
+
+        Returns:
+            The operation's result
+        """
+        params = dict(params or {})
+        if cancel_token is not None:
+            cancel_token.check()
+            remaining = cancel_token.remaining()
+            # The server reads a timeout of 0 as no deadline at all
+            if remaining is not None and remaining <= 0:
+                cancel_token.cancel('deadline exceeded')
+                cancel_token.check()
+            params['timeout'] = remaining
+
+        for attempt in range(2):
+            sock, reused = self._checkout()
+            try:
+                send_frame(sock, {'op': op, 'params': params}, audio)
+                header = self._read_response(sock, on_update, cancel_token)
+            except (OSError, StaleConnection):
+                sock.close()
+                # A pooled connection the server closed (e.g. it was restarted)
+                if reused and attempt == 0:
+                    continue
+                raise ModelServerError("Model server closed the connection")
+            except BaseException:
+                sock.close()
+                raise
+            break
+
+        self._checkin(sock)
+        if header['type'] == 'error':
+            if header.get('cancelled') == 'deadline exceeded':
+                raise DeadlineExceeded(header['error'])
+            if header.get('cancelled'):
+                raise TranscriptionCancelled(header['error'])
+            raise ModelServerError(header['error'])
+        return header['result']
+
+    def ping(self):
+        """Return the server status, or None if it is not reachable"""
+        try:
+            return self.request('ping')
+        except (OSError, ModelServerError):
+            return None
+
+    def transcribe(self, audio, model_size="base", decode_profile="balanced", language=None,
+                   no_speech_threshold=None, refine_model_size=None, cancel_token=None, initial_prompt=None):
+        """Whisper transcription; see transcribe_audio.transcribe_waveform()"""
+        params = {'model_size': model_size, 'decode_profile': decode_profile, 'language': language,
+                  'no_speech_threshold': no_speech_threshold, 'refine_model_size': refine_model_size,
+                  'initial_prompt': initial_prompt}
+        return self.request('transcribe', params, audio, cancel_token=cancel_token)
+
+    def draft_then_refine(self, audio, model_size="base", decode_profile="balanced", language=None,
+                          no_speech_threshold=None, on_update=None, cancel_token=None):
+        """Draft-then-refine transcription; see progressive.draft_then_refine()"""
+        params = {'model_size': model_size, 'decode_profile': decode_profile, 'language': language,
+                  'no_speech_threshold': no_speech_threshold}
+        return self.request('draft', params, audio, on_update=on_update, cancel_token=cancel_token)
+
+    def diarize(self, audio, cancel_token=None, with_embeddings=False):
+        """Speaker turns; see transcribe_with_speakers.diarize_waveform()"""
+        return self.request('diarize', {'with_embeddings': with_embeddings}, audio, cancel_token=cancel_token)
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_model_server():
+    """
+    Return a client for the local model server, or None to run models in process
+
+    The daemon itself always gets None, as do hosts where no server is running.
+    """
+    global _client
+
+    if SERVING or not os.path.exists(MODEL_SERVER_SOCKET):
+        return None
+
+    with _client_lock:
+        if _client is None:
+            _client = ModelServerClient(MODEL_SERVER_SOCKET)
+        client = _client
+
+    # Connecting also primes the pool, so the request that follows reuses it
+    try:
+        client._checkin(client._checkout()[0])
+    except OSError as e:
+        print(f"Model server at {MODEL_SERVER_SOCKET} is not reachable ({e}), running models in process")
+        return None
+    return client
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared model server for ConvertAnything")
+    parser.add_argument("--socket", default=MODEL_SERVER_SOCKET,
+                       help=f"Unix socket to listen on (default: {MODEL_SERVER_SOCKET})")
+    parser.add_argument("--preload", nargs="*", default=['base'],
+                       choices=["tiny", "base", "small", "medium", "large"],
+                       help="Whisper models to load at startup (default: base)")
+    parser.add_argument("--preload-diarization", action="store_true",
+                       help="Also load the pyannote pipeline at startup")
+    parser.add_argument("--concurrency", type=int, default=MODEL_SERVER_CONCURRENCY,
+                       help=f"Model runs executed at once (default: {MODEL_SERVER_CONCURRENCY})")
+
+    args = parser.parse_args()
+
+    # Run through the importable module so library code imported by the
+    # handlers sees SERVING set and never calls back into this server
+    import model_server
+
+    try:
+        model_server.serve(args.socket, args.preload, args.preload_diarization, args.concurrency)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+"""
+Stored Ownership for ConvertAnything
+Transcripts and speaker identities belong to the client that created them.
+The stores record a digest of the client id rather than the id itself, so
+their files never hold API keys.
+"""
+
+import hashlib
+
+def owner_key(client_id):
+    """Stored owner of a client's data"""
+    if client_id is None:
+        # Command line runs, which have no client
+        return ''
+    return hashlib.sha256(str(client_id).encode('utf-8')).hexdigest()
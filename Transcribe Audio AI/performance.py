@@ -0,0 +1,108 @@
+"""
+Host Performance Statistics for ConvertAnything
+Tracks the measured real-time factor (processing seconds per second of audio)
+of each Whisper model and decoding profile on this machine.
+"""
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+
+# Where measured real-time factors are kept between runs
+RTF_STATS_FILE = os.getenv(
+    'CONVERTANYTHING_RTF_STATS',
+    str(Path.home() / '.cache' / 'convertanything' / 'rtf_stats.json')
+)
+
+# Weight of the newest measurement in the running average
+RTF_SMOOTHING = 0.3
+
+_lock = threading.Lock()
+_rtf_stats = None
+
+def _load_stats():
+    """Load persisted statistics (called with the lock held)"""
+    global _rtf_stats
+    if _rtf_stats is None:
+        try:
+            with open(RTF_STATS_FILE, 'r', encoding='utf-8') as f:
+                _rtf_stats = json.load(f)
+        except (OSError, ValueError):
+            _rtf_stats = {}
+    return _rtf_stats
+
+def _save_stats():
+    """Write statistics atomically (called with the lock held)"""
+    try:
+        os.makedirs(os.path.dirname(RTF_STATS_FILE), exist_ok=True)
+        temp_file = f"{RTF_STATS_FILE}.{os.getpid()}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(_rtf_stats, f, indent=2)
+        os.replace(temp_file, RTF_STATS_FILE)
+    except OSError as e:
+        print(f"Warning: Could not save performance statistics: {e}")
+
+def record_rtf(model_size, decode_profile, audio_seconds, elapsed_seconds):
+    """
+    Record one measured transcription run
+
+    Args:
+        model_size (str): Whisper model size
+        decode_profile (str): Decoding profile used
+        audio_seconds (float): Duration of the transcribed audio
+        elapsed_seconds (float): Wall-clock time spent decoding
+    """
+    if not audio_seconds or audio_seconds <= 0:
+        return
+
+    rtf = elapsed_seconds / audio_seconds
+    with _lock:
+        stats = _load_stats()
+        entry = stats.setdefault(decode_profile, {}).setdefault(model_size, {'rtf': rtf, 'runs': 0})
+        entry['rtf'] = rtf if entry['runs'] == 0 else \
+            (1 - RTF_SMOOTHING) * entry['rtf'] + RTF_SMOOTHING * rtf
+        entry['runs'] += 1
+        entry['updated_at'] = time.time()
+        _save_stats()
+
+def get_rtf(model_size, decode_profile):
+    """Return the measured real-time factor, or None if never benchmarked"""
+    with _lock:
+        entry = _load_stats().get(decode_profile, {}).get(model_size)
+    return entry['rtf'] if entry else None
+
+def get_rtf_table():
+    """Return {decode_profile: {model_size: rtf}} for everything measured"""
+    with _lock:
+        stats = _load_stats()
+        return {
+            profile: {model: entry['rtf'] for model, entry in models.items()}
+            for profile, models in stats.items()
+        }
+
+# In-process counters and timings exposed through /api/metrics
+_metrics = {}
+
+def record_metric(name, value=1.0):
+    """
+    Record one observation of a named metric
+
+    Counters are recorded with the default value of 1; timings pass seconds.
+    """
+    with _lock:
+        metric = _metrics.setdefault(name, {'count': 0, 'total': 0.0, 'min': value, 'max': value})
+        metric['count'] += 1
+        metric['total'] += value
+        metric['min'] = min(metric['min'], value)
+        metric['max'] = max(metric['max'], value)
+        metric['last'] = value
+
+def get_metrics():
+    """Return a snapshot of all recorded metrics"""
+    with _lock:
+        return {
+            name: dict(metric, mean=metric['total'] / metric['count'])
+            for name, metric in _metrics.items()
+        }
@@ -0,0 +1,125 @@
+"""
+Draft-then-Refine Transcription
+Produces a quick draft with the tiny model, then re-transcribes the same
+waveform window by window with the requested model, replacing the draft
+segments as each window becomes ready.
+"""
+
+import os
+import time
+
+import whisper
+
+from transcribe_audio import build_decode_options, resolve_language
+from model_registry import get_whisper_model, model_in_use
+from performance import record_rtf, record_metric
+from cancellation import cancellable
+
+DRAFT_MODEL = os.getenv('DRAFT_MODEL', 'tiny')
+DRAFT_DECODE_PROFILE = 'fast'
+
+# Refinement windows are cut at draft segment boundaries near this length,
+# which matches the 30 second window Whisper decodes at a time
+REFINE_WINDOW_SECONDS = 30.0
+
+def plan_windows(segments, duration, window_seconds=REFINE_WINDOW_SECONDS):
+    """
+    Split the audio into contiguous windows that start on draft segment boundaries
+
+    Returns:
+        list: (start, end) pairs in seconds covering [0, duration]
+    """
+    boundaries = [0.0]
+    for segment in segments:
+        if segment['start'] - boundaries[-1] >= window_seconds:
+            boundaries.append(segment['start'])
+    if duration - boundaries[-1] < window_seconds / 4 and len(boundaries) > 1:
+        # Fold a short tail into the previous window
+        boundaries.pop()
+    boundaries.append(duration)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def _join_text(segments):
+    return ''.join(segment['text'] for segment in segments)
+
+def draft_then_refine(audio, model_size="base", decode_profile="balanced", language=None,
+                      no_speech_threshold=None, on_update=None, cancel_token=None):
+    """
+    Transcribe a decoded waveform with an early draft and progressive refinement
+
+    Args:
+        audio: Decoded 16 kHz waveform shared by both passes
+        model_size (str): Whisper model for the refined result
+        decode_profile (str): Decoding profile for the refined result
+        language (str): Language code; detected once by the draft model if None
+        no_speech_threshold (float): Override for Whisper's silence threshold
+        on_update (callable): Called with (stage, partial_result, progress_percent)
+        cancel_token (CancelToken): Stops decoding at the next window when cancelled
+
+    Returns:
+        dict: Whisper-style result from the requested model
+    """
+    duration = len(audio) / whisper.audio.SAMPLE_RATE
+    notify = on_update or (lambda stage, partial, progress: None)
+
+    # Draft pass with the smallest model and greedy decoding
+    start_time = time.perf_counter()
+    draft_model = cancellable(get_whisper_model(DRAFT_MODEL), cancel_token)
+    with model_in_use(DRAFT_MODEL, cancel_token):
+        language, detection = resolve_language(draft_model, audio, language)
+        draft = draft_model.transcribe(
+            audio, **build_decode_options(DRAFT_DECODE_PROFILE, language, no_speech_threshold)
+        )
+    record_metric('draft_seconds', time.perf_counter() - start_time)
+
+    segments = draft['segments']
+    for segment in segments:
+        segment['draft'] = True
+    notify('draft', {'text': draft['text'], 'segments': segments, 'language': language,
+                     'duration': duration, 'refined_until': 0.0}, 10)
+
+    if model_size == DRAFT_MODEL:
+        draft['duration'] = duration
+        draft['language_detection'] = detection
+        for segment in segments:
+            segment.pop('draft', None)
+        return draft
+
+    # Refine window by window, conditioning each window on the refined text so far
+    model = cancellable(get_whisper_model(model_size), cancel_token)
+    options = build_decode_options(decode_profile, language, no_speech_threshold)
+    windows = plan_windows(segments, duration)
+    refined_text = ''
+
+    start_time = time.perf_counter()
+    for i, (window_start, window_end) in enumerate(windows):
+        clip = audio[int(window_start * whisper.audio.SAMPLE_RATE):int(window_end * whisper.audio.SAMPLE_RATE)]
+        if refined_text:
+            options['initial_prompt'] = refined_text[-200:]
+        with model_in_use(model_size, cancel_token):
+            window_segments = model.transcribe(clip, **options).get('segments', [])
+        for segment in window_segments:
+            segment['start'] = min(segment['start'] + window_start, window_end)
+            segment['end'] = min(segment['end'] + window_start, window_end)
+        refined_text += _join_text(window_segments)
+
+        # Splice: draft segments that start inside this window are replaced
+        before = [s for s in segments if s['start'] < window_start]
+        after = [s for s in segments if s['start'] >= window_end]
+        segments = before + window_segments + after
+
+        progress = 10 + int(90 * (i + 1) / len(windows))
+        notify('refining', {'text': _join_text(segments), 'segments': segments, 'language': language,
+                            'duration': duration, 'refined_until': window_end}, progress)
+
+    record_rtf(model_size, decode_profile, duration, time.perf_counter() - start_time)
+
+    for i, segment in enumerate(segments):
+        segment['id'] = i
+    return {
+        'text': _join_text(segments),
+        'segments': segments,
+        'language': language,
+        'language_detection': detection,
+        'duration': duration,
+    }
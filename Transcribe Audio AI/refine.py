@@ -0,0 +1,150 @@
+"""
+Confidence-Driven Selective Re-decoding
+Re-transcribes only the low-confidence spans of a fast first pass with a
+larger Whisper model and splices the results back into the segment list.
+"""
+
+import os
+import time
+
+import whisper
+
+from model_registry import get_whisper_model, model_in_use
+from performance import record_metric
+from cancellation import cancellable
+
+# Segments below any of these limits are re-decoded (Whisper's own fallback limits)
+REFINE_THRESHOLDS = {
+    'avg_logprob': float(os.getenv('REFINE_MIN_AVG_LOGPROB', '-1.0')),
+    'compression_ratio': float(os.getenv('REFINE_MAX_COMPRESSION_RATIO', '2.4')),
+    'no_speech_prob': float(os.getenv('REFINE_NO_SPEECH_PROB', '0.6')),
+}
+
+# Neighbouring weak segments closer than this are re-decoded together (seconds)
+REFINE_MERGE_GAP = 1.0
+
+def needs_refinement(segment, thresholds=REFINE_THRESHOLDS):
+    """Check whether a Whisper segment falls below the confidence thresholds"""
+    avg_logprob = segment.get('avg_logprob', 0.0)
+    compression_ratio = segment.get('compression_ratio', 0.0)
+    no_speech_prob = segment.get('no_speech_prob', 0.0)
+
+    # Whisper treats low-confidence windows with a high no-speech probability as
+    # silence; re-decoding them with a larger model would only add hallucinations
+    if no_speech_prob > thresholds['no_speech_prob'] and avg_logprob < thresholds['avg_logprob']:
+        return False
+
+    return avg_logprob < thresholds['avg_logprob'] or \
+        compression_ratio > thresholds['compression_ratio']
+
+def find_refine_spans(segments, thresholds=REFINE_THRESHOLDS):
+    """
+    Group low-confidence segments into contiguous spans
+
+    Returns:
+        list: (first_index, last_index) pairs into segments, inclusive
+    """
+    spans = []
+    for i, segment in enumerate(segments):
+        if not needs_refinement(segment, thresholds):
+            continue
+        if spans and i == spans[-1][1] + 1 and \
+                segment['start'] - segments[spans[-1][1]]['end'] <= REFINE_MERGE_GAP:
+            spans[-1] = (spans[-1][0], i)
+        else:
+            spans.append((i, i))
+    return spans
+
+def _mean_logprob(segments):
+    """Duration-weighted average log probability of a list of segments"""
+    total = sum(max(s['end'] - s['start'], 0.01) for s in segments)
+    if not total:
+        return float('-inf')
+    return sum(s.get('avg_logprob', 0.0) * max(s['end'] - s['start'], 0.01) for s in segments) / total
+
+def merge_refinement(total, summary):
+    """Add the refinement summary of one part of a recording to the running total"""
+    if summary is None:
+        return total
+    if total is None:
+        return dict(summary)
+    for key in ('spans', 'segments_refined', 'seconds_refined'):
+        total[key] += summary[key]
+    return total
+
+def refine_low_confidence(audio, result, refine_model_size, decode_options, thresholds=REFINE_THRESHOLDS,
+                          cancel_token=None):
+    """
+    Re-decode weak spans of a first-pass result with a larger model
+
+    Args:
+        audio: Decoded 16 kHz waveform the first pass was run on
+        result (dict): First-pass Whisper result (modified in place)
+        refine_model_size (str): Whisper model used for re-decoding
+        decode_options (dict): Options for model.transcribe()
+        thresholds (dict): Confidence thresholds, see REFINE_THRESHOLDS
+        cancel_token (CancelToken): Stops re-decoding when cancelled
+
+    Returns:
+        dict: The result with refined segments and a 'refinement' summary
+    """
+    segments = result.get('segments', [])
+    spans = find_refine_spans(segments, thresholds)
+    summary = {
+        'model': refine_model_size,
+        'spans': len(spans),
+        'segments_refined': 0,
+        'seconds_refined': 0.0,
+    }
+
+    if not spans:
+        result['refinement'] = summary
+        return result
+
+    model = cancellable(get_whisper_model(refine_model_size), cancel_token)
+    options = dict(decode_options)
+    options['language'] = options.get('language') or result.get('language')
+    options['condition_on_previous_text'] = False
+
+    start_time = time.perf_counter()
+    refined = []
+    previous = 0
+
+    for first, last in spans:
+        refined.extend(segments[previous:first])
+        previous = last + 1
+
+        span_start = segments[first]['start']
+        span_end = segments[last]['end']
+        clip = audio[int(span_start * whisper.audio.SAMPLE_RATE):int(span_end * whisper.audio.SAMPLE_RATE)]
+
+        # Give the larger model the preceding text as context
+        if first > 0:
+            options['initial_prompt'] = segments[first - 1]['text'].strip()
+        else:
+            options.pop('initial_prompt', None)
+
+        with model_in_use(refine_model_size, cancel_token):
+            redecoded = model.transcribe(clip, **options).get('segments', [])
+        for segment in redecoded:
+            segment['start'] = min(segment['start'] + span_start, span_end)
+            segment['end'] = min(segment['end'] + span_start, span_end)
+
+        # Keep the first pass if the larger model did no better
+        original = segments[first:last + 1]
+        if redecoded and _mean_logprob(redecoded) >= _mean_logprob(original):
+            refined.extend(redecoded)
+            summary['segments_refined'] += len(original)
+            summary['seconds_refined'] += span_end - span_start
+        else:
+            refined.extend(original)
+
+    refined.extend(segments[previous:])
+    record_metric('refine_seconds', time.perf_counter() - start_time)
+
+    for i, segment in enumerate(refined):
+        segment['id'] = i
+    result['segments'] = refined
+    result['text'] = ''.join(segment['text'] for segment in refined)
+    result['refinement'] = summary
+    return result
@@ -0,0 +1,95 @@
+"""
+Resumable Window-by-Window Transcription
+Transcribes long audio in windows of a few minutes and hands the state
+after each window to a callback, so a job interrupted by a crash or a
+restart can continue from its last completed window instead of starting over.
+"""
+
+import os
+
+import whisper
+
+from refine import merge_refinement
+from window_cache import split_windows, transcribe_windows, merge_reuse
+
+# Length of each checkpointed window; Whisper still decodes 30 seconds at a time inside it
+CHECKPOINT_WINDOW_SECONDS = float(os.getenv('CHECKPOINT_WINDOW_SECONDS', '300'))
+
+def new_state(language=None):
+    """Empty progress for a transcription that has not started"""
+    return {
+        'position': 0.0,
+        'segments': [],
+        'language': language,
+        'language_detection': None,
+        'refinement': None,
+        'reuse': None,
+    }
+
+def transcribe_resumable(audio, model_size="base", decode_profile="balanced", language=None,
+                         no_speech_threshold=None, refine_model_size=None, state=None,
+                         on_checkpoint=None, cancel_token=None):
+    """
+    Transcribe a decoded waveform window by window, resuming from saved state
+
+    Checkpoints fall on the boundaries of window_cache.split_windows(), which
+    lie in pauses and come out the same every time the audio is split, so no
+    word is cut at a checkpoint and windows seen before come from the cache.
+
+    Args:
+        audio: Decoded 16 kHz waveform
+        model_size (str): Whisper model size
+        decode_profile (str): Decoding profile (fast, balanced, accurate)
+        language (str): Language code; detected on the first window if None
+        no_speech_threshold (float): Override for Whisper's silence threshold
+        refine_model_size (str): Larger model used to re-decode low-confidence spans
+        state (dict): Progress from an earlier run (see new_state), updated in place
+        on_checkpoint (callable): Called with the state after every completed window
+        cancel_token (CancelToken): Stops decoding at the next 30 second window
+
+    Returns:
+        dict: Whisper-style result for the whole waveform
+    """
+    duration = len(audio) / whisper.audio.SAMPLE_RATE
+    if state is None:
+        state = new_state(language)
+    windows = [window for window in split_windows(audio) if window.end_seconds > state['position']]
+
+    while windows:
+        # Group content windows into one checkpointed window
+        batch = [windows.pop(0)]
+        while windows and windows[0].end_seconds - batch[0].start_seconds <= CHECKPOINT_WINDOW_SECONDS:
+            batch.append(windows.pop(0))
+        if windows and duration - batch[-1].end_seconds < CHECKPOINT_WINDOW_SECONDS / 4:
+            # Fold a short tail into this window
+            batch.extend(windows)
+            windows = []
+
+        prompt = ''.join(segment['text'] for segment in state['segments']) or None
+        result = transcribe_windows(audio, model_size, decode_profile, language, no_speech_threshold,
+                                    refine_model_size, cancel_token, initial_prompt=prompt, windows=batch,
+                                    detected_language=state['language'])
+
+        if state['language'] is None:
+            state['language'] = result.get('language')
+            state['language_detection'] = result.get('language_detection')
+
+        state['segments'].extend(result.get('segments', []))
+        state['position'] = batch[-1].end_seconds
+        state['refinement'] = merge_refinement(state['refinement'], result.get('refinement'))
+        state['reuse'] = merge_reuse(state.get('reuse'), result['reuse']['transcription'])
+        if on_checkpoint is not None:
+            on_checkpoint(state)
+
+    segments = state['segments']
+    for i, segment in enumerate(segments):
+        segment['id'] = i
+    return {
+        'text': ''.join(segment['text'] for segment in segments),
+        'segments': segments,
+        'language': state['language'],
+        'language_detection': state['language_detection'],
+        'refinement': state['refinement'],
+        'reuse': {'transcription': state.get('reuse')},
+        'duration': duration,
+    }
@@ -0,0 +1,347 @@
+"""
+Speaker Identity Index for ConvertAnything
+Keeps an embedding for every speaker diarization has seen, plus speakers
+enrolled by name, in a local SQLite file. A new recording's speakers are
+looked up by the embeddings diarization already returns, so recurring
+people get the same label in every recording without another model pass.
+Identities belong to the client whose recordings or enrollment created them,
+and are only matched, listed or changed for that client.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from ownership import owner_key
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# Index file; empty disables cross-recording identities
+SPEAKER_INDEX_DB = os.getenv(
+    'SPEAKER_INDEX_DB',
+    str(Path.home() / '.cache' / 'convertanything' / 'speakers.db')
+)
+
+# Cosine similarity at which a speaker is taken to be a known identity. Stricter
+# than linking windows of one recording, since microphones and rooms differ.
+SPEAKER_MATCH_SIMILARITY = float(os.getenv('SPEAKER_MATCH_SIMILARITY', '0.7'))
+
+# Above this many identities lookups use an HNSW graph (needs hnswlib) instead
+# of comparing against every stored embedding
+SPEAKER_ANN_MIN_SPEAKERS = 5000
+
+# Candidates fetched per speaker before identities are assigned
+SPEAKER_CANDIDATES = 5
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS speakers (
+    id INTEGER PRIMARY KEY,
+    owner TEXT,
+    name TEXT,
+    enrolled INTEGER NOT NULL DEFAULT 0,
+    embedding BLOB NOT NULL,
+    recordings INTEGER NOT NULL DEFAULT 1,
+    created_at REAL,
+    last_seen REAL
+);
+CREATE INDEX IF NOT EXISTS speakers_owner ON speakers(owner);
+'''
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def speaker_label(speaker_id, name=None):
+    """Label shown in transcripts for an identity"""
+    return name or f'Speaker #{speaker_id}'
+
+class SpeakerIndex:
+    """
+    Embeddings of known speakers with nearest-neighbour lookup
+
+    Embeddings are kept in memory as one normalized matrix, updated in place
+    for this process's changes and reloaded when another process commits one.
+
+    Args:
+        path (str): SQLite file holding the identities
+    """
+
+    def __init__(self, path=SPEAKER_INDEX_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._version = None
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._owners = np.zeros(0, dtype=object)
+        self._matrix = None
+        self._graph = None
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connect(self):
+        # One connection, used under self._lock, so data_version tracks other processes
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _load(self):
+        """Reload the embeddings if another process changed the file since they were read"""
+        connection = self._connect()
+        version = connection.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._version:
+            return connection
+        rows = connection.execute('SELECT id, owner, embedding FROM speakers ORDER BY id').fetchall()
+        self._ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self._owners = np.array([row[1] for row in rows], dtype=object)
+        self._matrix = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows]) if rows else None
+        self._graph = None
+        if hnswlib is not None and len(rows) >= SPEAKER_ANN_MIN_SPEAKERS:
+            graph = hnswlib.Index(space='cosine', dim=self._matrix.shape[1])
+            graph.init_index(max_elements=len(rows) * 2, ef_construction=200, M=16)
+            graph.add_items(self._matrix, self._ids)
+            graph.set_ef(64)
+            self._graph = graph
+        self._version = version
+        return connection
+
+    def _set_vector(self, speaker_id, vector, owner):
+        """Apply this process's own change to the in-memory embeddings"""
+        rows = np.flatnonzero(self._ids == speaker_id)
+        if len(rows):
+            self._matrix[rows[0]] = vector
+        elif self._matrix is None:
+            self._ids, self._matrix = np.array([speaker_id], dtype=np.int64), vector[None, :].copy()
+            self._owners = np.array([owner], dtype=object)
+        elif self._matrix.shape[1] == len(vector):
+            self._ids = np.append(self._ids, speaker_id)
+            self._owners = np.append(self._owners, np.array([owner], dtype=object))
+            self._matrix = np.vstack([self._matrix, vector])
+        if self._graph is not None:
+            if len(self._ids) > self._graph.get_max_elements():
+                self._graph.resize_index(len(self._ids) * 2)
+            # Adding an existing id replaces its vector
+            self._graph.add_items(vector[None, :], [speaker_id])
+
+    def _candidates(self, vector, count, owner):
+        """[(speaker id, similarity)] of the owner's closest stored embeddings"""
+        if self._matrix is None or self._matrix.shape[1] != len(vector):
+            return []
+        mine = self._owners == owner
+        count = min(count, int(mine.sum()))
+        if count == 0:
+            return []
+        if self._graph is not None:
+            allowed = set(self._ids[mine].tolist())
+            try:
+                labels, distances = self._graph.knn_query(vector, k=count, filter=lambda label: label in allowed)
+                return [(int(label), 1.0 - float(distance)) for label, distance in zip(labels[0], distances[0])]
+            except RuntimeError:
+                # The graph search reached fewer of the owner's identities than asked for
+                pass
+        similarities = np.where(mine, self._matrix @ vector, -np.inf)
+        best = np.argpartition(-similarities, count - 1)[:count]
+        return [(int(self._ids[i]), float(similarities[i])) for i in best]
+
+    def identify(self, embeddings, client_id, remember=True):
+        """
+        Map one recording's speakers to stable identities of the client
+
+        Each speaker goes to the most similar of the client's identities above
+        SPEAKER_MATCH_SIMILARITY that no other speaker of the recording took.
+        The rest become new identities of the client when remember is set.
+
+        Args:
+            embeddings (dict): {diarization label: embedding vector}
+            client_id (str): Client the recording belongs to
+            remember (bool): Store new speakers and refine the embeddings of unnamed ones
+
+        Returns:
+            dict: {diarization label: {'speaker_id', 'label', 'name', 'similarity'}}
+        """
+        vectors = {label: _normalize(vector) for label, vector in embeddings.items() if vector is not None}
+        if not vectors:
+            return {}
+        owner = owner_key(client_id)
+
+        with self._lock:
+            connection = self._load()
+            pairs = sorted(
+                ((similarity, label, speaker_id)
+                 for label, vector in vectors.items()
+                 for speaker_id, similarity in self._candidates(vector, SPEAKER_CANDIDATES, owner)
+                 if similarity >= SPEAKER_MATCH_SIMILARITY),
+                reverse=True
+            )
+            matches = {}
+            taken = set()
+            for similarity, label, speaker_id in pairs:
+                if label not in matches and speaker_id not in taken:
+                    matches[label] = (speaker_id, similarity)
+                    taken.add(speaker_id)
+
+            identities = {}
+            now = time.time()
+            with connection:
+                for label in sorted(vectors):
+                    vector = vectors[label]
+                    if label in matches:
+                        speaker_id, similarity = matches[label]
+                        name, enrolled, stored, recordings = connection.execute(
+                            'SELECT name, enrolled, embedding, recordings FROM speakers WHERE id = ?', (speaker_id,)
+                        ).fetchone()
+                        if remember:
+                            # Unnamed identities drift toward every recording they appear in
+                            stored = np.frombuffer(stored, dtype=np.float32)
+                            if not enrolled:
+                                stored = _normalize(stored * recordings + vector)
+                                self._set_vector(speaker_id, stored, owner)
+                            connection.execute(
+                                'UPDATE speakers SET embedding = ?, recordings = ?, last_seen = ? WHERE id = ?',
+                                (stored.tobytes(), recordings + 1, now, speaker_id)
+                            )
+                    elif remember:
+                        name, similarity = None, None
+                        speaker_id = connection.execute(
+                            'INSERT INTO speakers (owner, embedding, created_at, last_seen) VALUES (?, ?, ?, ?)',
+                            (owner, vector.tobytes(), now, now)
+                        ).lastrowid
+                        self._set_vector(speaker_id, vector, owner)
+                    else:
+                        continue
+                    identities[label] = {
+                        'speaker_id': speaker_id,
+                        'label': speaker_label(speaker_id, name),
+                        'name': name,
+                        'similarity': round(similarity, 3) if similarity is not None else None,
+                    }
+        return identities
+
+    def enroll(self, name, embedding, client_id):
+        """
+        Register a named speaker of a client from an embedding of their voice
+
+        One of the client's identities that matches is named instead of adding
+        a second one, so recordings that already show it keep pointing at the
+        same person.
+
+        Returns:
+            dict: The enrolled speaker, see get()
+        """
+        vector = _normalize(embedding)
+        owner = owner_key(client_id)
+        with self._lock:
+            connection = self._load()
+            candidates = [candidate for candidate in self._candidates(vector, 1, owner)
+                          if candidate[1] >= SPEAKER_MATCH_SIMILARITY]
+            now = time.time()
+            with connection:
+                if candidates:
+                    speaker_id = candidates[0][0]
+                    connection.execute(
+                        'UPDATE speakers SET name = ?, enrolled = 1, embedding = ?, last_seen = ? WHERE id = ?',
+                        (name, vector.tobytes(), now, speaker_id)
+                    )
+                else:
+                    speaker_id = connection.execute(
+                        'INSERT INTO speakers (owner, name, enrolled, embedding, recordings, created_at, last_seen) '
+                        'VALUES (?, ?, 1, ?, 0, ?, ?)',
+                        (owner, name, vector.tobytes(), now, now)
+                    ).lastrowid
+            self._set_vector(speaker_id, vector, owner)
+        return self.get(speaker_id, client_id)
+
+    def rename(self, speaker_id, name, client_id):
+        """Name one of a client's speakers; None makes it anonymous again (None if not theirs)"""
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                updated = connection.execute(
+                    'UPDATE speakers SET name = ?, enrolled = ? WHERE id = ? AND owner = ?',
+                    (name, 1 if name else 0, speaker_id, owner_key(client_id))
+                ).rowcount
+        return self.get(speaker_id, client_id) if updated else None
+
+    def delete(self, speaker_id, client_id):
+        """Forget one of a client's speakers; False if it is not theirs"""
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                deleted = connection.execute(
+                    'DELETE FROM speakers WHERE id = ? AND owner = ?', (speaker_id, owner_key(client_id))
+                ).rowcount > 0
+            if deleted:
+                keep = self._ids != speaker_id
+                self._ids, self._owners = self._ids[keep], self._owners[keep]
+                self._matrix = self._matrix[keep] if keep.any() else None
+                if self._graph is not None:
+                    self._graph.mark_deleted(speaker_id)
+        return deleted
+
+    def _row(self, row):
+        speaker_id, name, enrolled, recordings, created_at, last_seen = row
+        return {
+            'speaker_id': speaker_id,
+            'label': speaker_label(speaker_id, name),
+            'name': name,
+            'enrolled': bool(enrolled),
+            'recordings': recordings,
+            'created_at': created_at,
+            'last_seen': last_seen,
+        }
+
+    def get(self, speaker_id, client_id):
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT id, name, enrolled, recordings, created_at, last_seen FROM speakers '
+                'WHERE id = ? AND owner = ?',
+                (speaker_id, owner_key(client_id))
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, client_id, enrolled_only=False):
+        sql = 'SELECT id, name, enrolled, recordings, created_at, last_seen FROM speakers WHERE owner = ?'
+        if enrolled_only:
+            sql += ' AND enrolled = 1'
+        with self._lock:
+            rows = self._connect().execute(sql + ' ORDER BY id', (owner_key(client_id),)).fetchall()
+        return [self._row(row) for row in rows]
+
+# Shared by all requests in this process
+speaker_index = SpeakerIndex()
+
+def identify_speakers(turns, embeddings, client_id=None):
+    """
+    Relabel diarization turns with the client's stable identities from the speaker index
+
+    Args:
+        turns (list): [start, end, label] turns of one recording
+        embeddings (dict): {label: embedding vector or None}
+        client_id (str): Client the recording belongs to (None on the command line)
+
+    Returns:
+        tuple: (relabelled turns, {identity label: identity details})
+    """
+    if not speaker_index.enabled or not turns:
+        return turns, {}
+    try:
+        identities = speaker_index.identify(embeddings, client_id)
+    except (sqlite3.Error, OSError, ValueError) as e:
+        print(f"Warning: Speaker index unavailable, keeping per-recording labels: {e}")
+        return turns, {}
+    turns = [[start, end, identities[label]['label'] if label in identities else label]
+             for start, end, label in turns]
+    return turns, {identity['label']: identity for identity in identities.values()}
@@ -9,9 +9,170 @@ import os
 import sys
 from pathlib import Path
 import argparse
+import time
 from datetime import datetime
 
-def transcribe_audio(audio_file_path, model_size="base", output_format="txt"):
+from performance import record_rtf, record_metric
+from model_registry import get_whisper_model, model_in_use
+from refine import refine_low_confidence
+from cancellation import cancellable
+from model_server import get_model_server
+from compact_audio import load_audio
+from exports import write_export, EXPORT_FORMATS
+
+# Curated decoding presets that trade accuracy for speed
+DECODE_PROFILES = {
+    'fast': {
+        'name': 'Fast',
+        'description': 'Greedy decoding without temperature fallback',
+        'options': {
+            'temperature': 0.0,
+            'beam_size': None,
+            'best_of': None,
+            'condition_on_previous_text': False,
+        },
+    },
+    'balanced': {
+        'name': 'Balanced',
+        'description': 'Whisper defaults with temperature fallback',
+        'options': {
+            'temperature': (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+            'condition_on_previous_text': True,
+        },
+    },
+    'accurate': {
+        'name': 'Accurate',
+        'description': 'Beam search with temperature fallback',
+        'options': {
+            'temperature': (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+            'beam_size': 5,
+            'best_of': 5,
+            'patience': 1.0,
+            'condition_on_previous_text': True,
+        },
+    },
+}
+DEFAULT_DECODE_PROFILE = 'balanced'
+
+def build_decode_options(decode_profile=DEFAULT_DECODE_PROFILE, language=None, no_speech_threshold=None):
+    """
+    Build keyword arguments for model.transcribe() from a decoding profile
+    
+    Args:
+        decode_profile (str): Decoding profile (fast, balanced, accurate)
+        language (str): Language code; skips language detection when given
+        no_speech_threshold (float): Override for Whisper's silence threshold
+    
+    Returns:
+        dict: Options for model.transcribe()
+    """
+    if decode_profile not in DECODE_PROFILES:
+        raise ValueError(f"Unknown decode profile: {decode_profile}")
+    
+    options = dict(DECODE_PROFILES[decode_profile]['options'])
+    if language:
+        options['language'] = language
+    if no_speech_threshold is not None:
+        options['no_speech_threshold'] = float(no_speech_threshold)
+    return options
+
+def resolve_language(model, audio, language=None):
+    """
+    Determine the spoken language before decoding
+    
+    Whisper runs a separate language-detection forward pass whenever no
+    language is given. Running it here instead lets us time it and pass the
+    result on, so model.transcribe() never detects it a second time.
+    
+    Args:
+        model: Loaded Whisper model
+        audio: Decoded 16 kHz waveform
+        language (str): Known language code, if any
+    
+    Returns:
+        tuple: (language, detection) where detection is None when skipped
+    """
+    if language:
+        record_metric('language_detection_skipped')
+        return language, None
+    
+    if not model.is_multilingual:
+        return 'en', None
+    
+    start_time = time.perf_counter()
+    mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels).to(model.device)
+    _, probs = model.detect_language(mel)
+    elapsed = time.perf_counter() - start_time
+    
+    language = max(probs, key=probs.get)
+    record_metric('language_detection_seconds', elapsed)
+    record_metric(f'language_detected.{language}')
+    
+    return language, {'probability': float(probs[language]), 'seconds': elapsed}
+
+def transcribe_waveform(audio, model_size="base", decode_profile=DEFAULT_DECODE_PROFILE, language=None,
+                        no_speech_threshold=None, refine_model_size=None, cancel_token=None,
+                        initial_prompt=None):
+    """
+    Transcribe a decoded waveform with models loaded in this process
+    
+    Args:
+        audio: Decoded 16 kHz mono waveform
+        model_size (str): Whisper model size (tiny, base, small, medium, large)
+        decode_profile (str): Decoding profile (fast, balanced, accurate)
+        language (str): Language code; skips language detection when given
+        no_speech_threshold (float): Override for Whisper's silence threshold
+        refine_model_size (str): Larger model used to re-decode low-confidence spans
+        cancel_token (CancelToken): Stops decoding at the next window when cancelled
+        initial_prompt (str): Preceding text given to the decoder as context
+    
+    Returns:
+        dict: Transcription result
+    """
+    # Load the Whisper model (cached across calls)
+    model = cancellable(get_whisper_model(model_size), cancel_token)
+    duration = len(audio) / whisper.audio.SAMPLE_RATE
+    
+    # Transcribe the audio
+    with model_in_use(model_size, cancel_token):
+        start_time = time.perf_counter()
+        language, detection = resolve_language(model, audio, language)
+        decode_options = build_decode_options(decode_profile, language, no_speech_threshold)
+        result = model.transcribe(audio, initial_prompt=initial_prompt, **decode_options)
+        record_rtf(model_size, decode_profile, duration, time.perf_counter() - start_time)
+    
+    # Optionally re-decode weak segments with a larger model
+    if refine_model_size and refine_model_size != model_size:
+        print(f"Re-decoding low-confidence segments with: {refine_model_size}")
+        refine_low_confidence(audio, result, refine_model_size, decode_options, cancel_token=cancel_token)
+    
+    result['duration'] = duration
+    result['language_detection'] = detection
+    return result
+
+def run_whisper(audio, model_size="base", decode_profile=DEFAULT_DECODE_PROFILE, language=None,
+                no_speech_threshold=None, refine_model_size=None, cancel_token=None, initial_prompt=None):
+    """
+    Transcribe a decoded waveform on the local model server if one is running,
+    otherwise in this process (arguments as for transcribe_waveform)
+    """
+    # Validate options before sending audio anywhere or loading a model
+    build_decode_options(decode_profile, language, no_speech_threshold)
+    
+    server = get_model_server()
+    if server is not None:
+        print(f"Using model server at {server.socket_path}")
+        return server.transcribe(audio, model_size=model_size, decode_profile=decode_profile,
+                                 language=language, no_speech_threshold=no_speech_threshold,
+                                 refine_model_size=refine_model_size, cancel_token=cancel_token,
+                                 initial_prompt=initial_prompt)
+    
+    return transcribe_waveform(audio, model_size, decode_profile, language, no_speech_threshold,
+                               refine_model_size, cancel_token, initial_prompt)
+
+def transcribe_audio(audio_file_path, model_size="base", output_format="txt",
+                     decode_profile=DEFAULT_DECODE_PROFILE, language=None, no_speech_threshold=None,
+                     refine_model_size=None, cancel_token=None):
     """
     Transcribe audio file using OpenAI Whisper model
     
@@ -19,6 +180,11 @@ def transcribe_audio(audio_file_path, model_size="base", output_format="txt"):
         audio_file_path (str): Path to the audio file
         model_size (str): Whisper model size (tiny, base, small, medium, large)
         output_format (str): Output format (txt, json, srt, vtt)
+        decode_profile (str): Decoding profile (fast, balanced, accurate)
+        language (str): Language code; skips language detection when given
+        no_speech_threshold (float): Override for Whisper's silence threshold
+        refine_model_size (str): Larger model used to re-decode low-confidence spans
+        cancel_token (CancelToken): Stops decoding at the next window when cancelled
     
     Returns:
         dict: Transcription result
@@ -28,19 +194,17 @@ def transcribe_audio(audio_file_path, model_size="base", output_format="txt"):
     if not os.path.exists(audio_file_path):
         raise FileNotFoundError(f"Audio file not found: {audio_file_path}")
     
-    print(f"Loading Whisper model: {model_size}")
-    print("This may take a moment on first run as the model needs to be downloaded...")
-    
-    # Load the Whisper model
-    model = whisper.load_model(model_size)
-    
     print(f"Transcribing audio file: {audio_file_path}")
     print("Processing... This may take several minutes depending on audio length.")
     
-    # Transcribe the audio
-    result = model.transcribe(audio_file_path)
+    from window_cache import transcribe_windows
     
-    return result
+    # Decode here so only raw samples reach the model, whichever process runs it
+    audio = load_audio(audio_file_path)
+    
+    # Windows already transcribed for an earlier upload come from the cache
+    return transcribe_windows(audio, model_size, decode_profile, language, no_speech_threshold,
+                              refine_model_size, cancel_token)
 
 def save_transcription(result, audio_file_path, output_format="txt"):
     """
@@ -49,55 +213,19 @@ def save_transcription(result, audio_file_path, output_format="txt"):
     Args:
         result (dict): Whisper transcription result
         audio_file_path (str): Original audio file path
-        output_format (str): Output format
+        output_format (str): Output format (txt, json, srt, vtt or pdf)
     """
     
     # Create output filename based on input file
     audio_path = Path(audio_file_path)
-    base_name = audio_path.stem
-    output_dir = audio_path.parent
-    
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_file = audio_path.parent / f"{audio_path.stem}_transcript_{timestamp}.{output_format}"
     
-    if output_format == "txt":
-        output_file = output_dir / f"{base_name}_transcript_{timestamp}.txt"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write("AUDIO TRANSCRIPTION\n")
-            f.write("=" * 50 + "\n\n")
-            f.write(f"Source File: {audio_file_path}\n")
-            f.write(f"Transcribed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Model Used: Whisper AI\n\n")
-            f.write("TRANSCRIPT:\n")
-            f.write("-" * 20 + "\n\n")
-            f.write(result["text"])
-            
-    elif output_format == "json":
-        import json
-        output_file = output_dir / f"{base_name}_transcript_{timestamp}.json"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
-            
-    elif output_format == "srt":
-        output_file = output_dir / f"{base_name}_transcript_{timestamp}.srt"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            for i, segment in enumerate(result["segments"], 1):
-                start_time = format_timestamp_srt(segment["start"])
-                end_time = format_timestamp_srt(segment["end"])
-                f.write(f"{i}\n")
-                f.write(f"{start_time} --> {end_time}\n")
-                f.write(f"{segment['text'].strip()}\n\n")
+    write_export(result, output_format, output_file, source=audio_file_path)
     
     print(f"Transcription saved to: {output_file}")
     return output_file
 
-def format_timestamp_srt(seconds):
-    """Format timestamp for SRT subtitle format"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millisecs = int((seconds % 1) * 1000)
-    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millisecs:03d}"
-
 def main():
     parser = argparse.ArgumentParser(description="Transcribe audio files using OpenAI Whisper")
     parser.add_argument("audio_file", help="Path to the audio file to transcribe")
@@ -105,14 +233,28 @@ def main():
                        choices=["tiny", "base", "small", "medium", "large"],
                        help="Whisper model size (default: base)")
     parser.add_argument("--format", "-f", default="txt",
-                       choices=["txt", "json", "srt"],
+                       choices=list(EXPORT_FORMATS),
                        help="Output format (default: txt)")
+    parser.add_argument("--profile", "-p", default=DEFAULT_DECODE_PROFILE,
+                       choices=list(DECODE_PROFILES),
+                       help=f"Decoding profile (default: {DEFAULT_DECODE_PROFILE})")
+    parser.add_argument("--language", "-l", default=None,
+                       help="Language code, e.g. en (default: auto-detect)")
+    parser.add_argument("--no-speech-threshold", type=float, default=None,
+                       help="Probability above which a window is treated as silence")
+    parser.add_argument("--refine-model", default=None,
+                       choices=["tiny", "base", "small", "medium", "large"],
+                       help="Re-decode low-confidence segments with this larger model")
     
     args = parser.parse_args()
     
     try:
         # Transcribe the audio
-        result = transcribe_audio(args.audio_file, args.model, args.format)
+        result = transcribe_audio(args.audio_file, args.model, args.format,
+                                  decode_profile=args.profile,
+                                  language=args.language,
+                                  no_speech_threshold=args.no_speech_threshold,
+                                  refine_model_size=args.refine_model)
         
         # Save the transcription
         output_file = save_transcription(result, args.audio_file, args.format)
@@ -124,6 +266,11 @@ def main():
         print(f"Input file: {args.audio_file}")
         print(f"Output file: {output_file}")
         print(f"Model used: {args.model}")
+        print(f"Decode profile: {args.profile}")
+        if result.get('refinement'):
+            refinement = result['refinement']
+            print(f"Refined: {refinement['segments_refined']} segments "
+                  f"({refinement['seconds_refined']:.1f}s) with {refinement['model']}")
         print(f"Text length: {len(result['text'])} characters")
         print(f"Duration: {result.get('duration', 'Unknown')} seconds")
         
@@ -6,7 +6,7 @@ Transcribes audio files and separates speakers using AI neural networks.
 
 import whisper
 import torch
-from pyannote.audio import Pipeline
+import numpy as np
 from pyannote.audio.pipelines.utils.hook import ProgressHook
 import os
 import sys
@@ -16,27 +16,19 @@ from datetime import datetime
 import warnings
 warnings.filterwarnings("ignore")
 
+from transcribe_audio import DECODE_PROFILES, DEFAULT_DECODE_PROFILE
+from model_registry import get_whisper_model, get_diarization_pipeline
+from model_server import get_model_server
+from cancellation import TranscriptionCancelled, CancellableHook
+from compact_audio import load_audio
+from exports import write_export, EXPORT_FORMATS
+
 def load_models(whisper_model_size="base"):
     """
-    Load Whisper and speaker diarization models
+    Load Whisper and speaker diarization models (cached across calls)
     """
-    print(f"Loading Whisper model: {whisper_model_size}")
-    whisper_model = whisper.load_model(whisper_model_size)
-    
-    print("Loading speaker diarization model...")
-    print("Note: This requires a Hugging Face token for pyannote models.")
-    print("You can get one free at: https://huggingface.co/settings/tokens")
-    
-    try:
-        # Try to load the diarization pipeline
-        diarization_pipeline = Pipeline.from_pretrained(
-            "pyannote/speaker-diarization-3.1",
-            use_auth_token=None  # Will use HF_TOKEN environment variable if set
-        )
-    except Exception as e:
-        print(f"Warning: Could not load speaker diarization model: {e}")
-        print("Falling back to simple speaker detection...")
-        diarization_pipeline = None
+    whisper_model = get_whisper_model(whisper_model_size)
+    diarization_pipeline = get_diarization_pipeline()
     
     return whisper_model, diarization_pipeline
 
@@ -59,9 +51,11 @@ def simple_speaker_detection(segments, num_speakers=2):
     
     return speakers
 
-def perform_diarization(audio_file, diarization_pipeline):
+def perform_diarization(audio_file, diarization_pipeline, cancel_token=None, return_embeddings=False):
     """
     Perform speaker diarization on the audio file
+    
+    With return_embeddings, returns (diarization, per-speaker embeddings) instead.
     """
     if diarization_pipeline is None:
         return None
@@ -69,15 +63,57 @@ def perform_diarization(audio_file, diarization_pipeline):
     try:
         print("Performing speaker diarization...")
         with ProgressHook() as hook:
-            diarization = diarization_pipeline(audio_file, hook=hook)
+            if cancel_token is not None:
+                # Check for cancellation at every pipeline step
+                hook = CancellableHook(cancel_token, hook)
+            diarization = diarization_pipeline(audio_file, hook=hook, return_embeddings=return_embeddings)
         return diarization
+    except TranscriptionCancelled:
+        raise
     except Exception as e:
         print(f"Diarization failed: {e}")
         return None
 
+def waveform_input(audio):
+    """
+    Wrap a decoded 16 kHz waveform for pyannote so it does not decode the file again
+    """
+    return {
+        'waveform': torch.from_numpy(audio).unsqueeze(0),
+        'sample_rate': whisper.audio.SAMPLE_RATE
+    }
+
+def diarize_waveform(audio, diarization_pipeline=None, cancel_token=None, with_embeddings=False):
+    """
+    Diarize a decoded waveform with the pipeline loaded in this process
+    
+    Returns:
+        list: [start, end, speaker] turns, or None if diarization is unavailable;
+        with_embeddings returns {'turns': [...], 'embeddings': {speaker: vector or None}}
+    """
+    if diarization_pipeline is None:
+        diarization_pipeline = get_diarization_pipeline()
+    
+    diarization = perform_diarization(waveform_input(audio), diarization_pipeline, cancel_token, with_embeddings)
+    if diarization is None:
+        return None
+    
+    if not with_embeddings:
+        return [[turn.start, turn.end, speaker] for turn, _, speaker in diarization.itertracks(yield_label=True)]
+    
+    diarization, centroids = diarization
+    embeddings = {}
+    # Rows follow the sorted labels; speakers with too little speech get NaN
+    for speaker, centroid in zip(diarization.labels(), centroids):
+        embeddings[speaker] = None if np.isnan(centroid).any() else [float(value) for value in centroid]
+    return {
+        'turns': [[turn.start, turn.end, speaker] for turn, _, speaker in diarization.itertracks(yield_label=True)],
+        'embeddings': embeddings
+    }
+
 def align_transcription_with_speakers(whisper_result, diarization):
     """
-    Align Whisper transcription segments with speaker diarization
+    Align Whisper transcription segments with speaker diarization turns
     """
     if diarization is None:
         # Fallback to simple detection
@@ -92,8 +128,8 @@ def align_transcription_with_speakers(whisper_result, diarization):
         
         # Find which speaker is active at the midpoint of this segment
         active_speaker = None
-        for turn, _, speaker in diarization.itertracks(yield_label=True):
-            if turn.start <= segment_mid <= turn.end:
+        for turn_start, turn_end, speaker in diarization:
+            if turn_start <= segment_mid <= turn_end:
                 active_speaker = speaker
                 break
         
@@ -104,39 +140,79 @@ def align_transcription_with_speakers(whisper_result, diarization):
     
     return aligned_segments
 
-def transcribe_with_speakers(audio_file_path, whisper_model_size="base", num_speakers=2):
+def speaker_turns(audio, diarization_pipeline=None, cancel_token=None, with_embeddings=False):
+    """
+    Diarize a decoded waveform wherever the models live
+    
+    Diarization runs on the local model server when one is running and no
+    pipeline is passed in, otherwise in this process.
+    
+    Returns:
+        See diarize_waveform()
+    """
+    server = get_model_server() if diarization_pipeline is None else None
+    if server is not None:
+        return server.diarize(audio, cancel_token=cancel_token, with_embeddings=with_embeddings)
+    return diarize_waveform(audio, diarization_pipeline, cancel_token, with_embeddings)
+
+def apply_speakers(whisper_result, diarization):
+    """
+    Attach speaker labels from diarization turns to a Whisper result in place
+    """
+    print("Aligning transcription with speakers...")
+    speakers = align_transcription_with_speakers(whisper_result, diarization)
+    
+    for i, segment in enumerate(whisper_result['segments']):
+        segment['speaker'] = speakers[i] if i < len(speakers) else "Unknown"
+    
+    return whisper_result
+
+def label_speakers(whisper_result, audio, diarization_pipeline=None, cancel_token=None, client_id=None):
+    """
+    Attach speaker labels to the segments of a Whisper result in place
+    """
+    from window_cache import diarize_windows
+    
+    # Cached windows are reused and speakers get their identities from the speaker index
+    diarization, reuse = diarize_windows(audio, diarization_pipeline, cancel_token, client_id=client_id)
+    if whisper_result.get('reuse') is not None:
+        whisper_result['reuse']['diarization'] = reuse
+    return apply_speakers(whisper_result, diarization)
+
+def transcribe_with_speakers(audio_file_path, whisper_model_size="base", num_speakers=2,
+                             decode_profile=DEFAULT_DECODE_PROFILE, language=None, no_speech_threshold=None,
+                             refine_model_size=None, cancel_token=None, client_id=None):
     """
     Transcribe audio with speaker separation
     """
     if not os.path.exists(audio_file_path):
         raise FileNotFoundError(f"Audio file not found: {audio_file_path}")
     
-    # Load models
-    whisper_model, diarization_pipeline = load_models(whisper_model_size)
+    from window_cache import split_windows, transcribe_windows, diarize_windows
     
-    # Transcribe with Whisper
+    # Transcribe with Whisper, reusing windows seen in earlier uploads
     print(f"Transcribing audio: {audio_file_path}")
-    whisper_result = whisper_model.transcribe(audio_file_path)
-    
-    # Perform speaker diarization
-    diarization = perform_diarization(audio_file_path, diarization_pipeline)
+    audio = load_audio(audio_file_path)
+    windows = split_windows(audio)
+    whisper_result = transcribe_windows(audio, whisper_model_size, decode_profile, language, no_speech_threshold,
+                                        refine_model_size, cancel_token, windows=windows)
     
-    # Align transcription with speakers
-    print("Aligning transcription with speakers...")
-    speakers = align_transcription_with_speakers(whisper_result, diarization)
+    # Diarize the same windows and label each segment
+    diarization, reuse = diarize_windows(audio, cancel_token=cancel_token, windows=windows, client_id=client_id)
+    whisper_result['reuse']['diarization'] = reuse
+    apply_speakers(whisper_result, diarization)
     
     # Create enhanced result with speaker information
     enhanced_result = {
         'text': whisper_result['text'],
-        'segments': [],
-        'language': whisper_result.get('language', 'unknown')
+        'segments': whisper_result['segments'],
+        'language': whisper_result.get('language', 'unknown'),
+        'language_detection': whisper_result.get('language_detection'),
+        'refinement': whisper_result.get('refinement'),
+        'reuse': whisper_result.get('reuse'),
+        'duration': whisper_result['duration']
     }
     
-    for i, segment in enumerate(whisper_result['segments']):
-        enhanced_segment = segment.copy()
-        enhanced_segment['speaker'] = speakers[i] if i < len(speakers) else "Unknown"
-        enhanced_result['segments'].append(enhanced_segment)
-    
     return enhanced_result
 
 def save_speaker_transcription(result, audio_file_path, output_format="txt"):
@@ -144,81 +220,14 @@ def save_speaker_transcription(result, audio_file_path, output_format="txt"):
     Save transcription with speaker labels
     """
     audio_path = Path(audio_file_path)
-    base_name = audio_path.stem
-    output_dir = audio_path.parent
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_file = audio_path.parent / f"{audio_path.stem}_speakers_transcript_{timestamp}.{output_format}"
     
-    if output_format == "txt":
-        output_file = output_dir / f"{base_name}_speakers_transcript_{timestamp}.txt"
-        
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write("AUDIO TRANSCRIPTION WITH SPEAKER SEPARATION\n")
-            f.write("=" * 60 + "\n\n")
-            f.write(f"Source File: {audio_file_path}\n")
-            f.write(f"Transcribed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Model Used: Whisper AI + Speaker Diarization\n")
-            f.write(f"Language: {result.get('language', 'unknown')}\n\n")
-            
-            f.write("TRANSCRIPT BY SPEAKER:\n")
-            f.write("-" * 30 + "\n\n")
-            
-            current_speaker = None
-            for segment in result['segments']:
-                speaker = segment.get('speaker', 'Unknown')
-                text = segment['text'].strip()
-                start_time = segment['start']
-                end_time = segment['end']
-                
-                # Add speaker header when speaker changes
-                if speaker != current_speaker:
-                    f.write(f"\n[{speaker}] ({format_time(start_time)} - {format_time(end_time)}):\n")
-                    current_speaker = speaker
-                
-                f.write(f"{text} ")
-            
-            f.write("\n\n" + "=" * 60 + "\n")
-            f.write("DETAILED TIMELINE:\n")
-            f.write("-" * 20 + "\n\n")
-            
-            for segment in result['segments']:
-                speaker = segment.get('speaker', 'Unknown')
-                text = segment['text'].strip()
-                start_time = format_time(segment['start'])
-                end_time = format_time(segment['end'])
-                
-                f.write(f"[{start_time} - {end_time}] {speaker}: {text}\n")
-                
-    elif output_format == "srt":
-        output_file = output_dir / f"{base_name}_speakers_transcript_{timestamp}.srt"
-        
-        with open(output_file, 'w', encoding='utf-8') as f:
-            for i, segment in enumerate(result['segments'], 1):
-                speaker = segment.get('speaker', 'Unknown')
-                text = segment['text'].strip()
-                start_time = format_timestamp_srt(segment['start'])
-                end_time = format_timestamp_srt(segment['end'])
-                
-                f.write(f"{i}\n")
-                f.write(f"{start_time} --> {end_time}\n")
-                f.write(f"[{speaker}] {text}\n\n")
+    write_export(result, output_format, output_file, source=audio_file_path)
     
     print(f"Speaker-separated transcription saved to: {output_file}")
     return output_file
 
-def format_time(seconds):
-    """Format seconds to MM:SS format"""
-    minutes = int(seconds // 60)
-    secs = int(seconds % 60)
-    return f"{minutes:02d}:{secs:02d}"
-
-def format_timestamp_srt(seconds):
-    """Format timestamp for SRT subtitle format"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millisecs = int((seconds % 1) * 1000)
-    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millisecs:03d}"
-
 def main():
     parser = argparse.ArgumentParser(description="Transcribe audio with speaker separation")
     parser.add_argument("audio_file", help="Path to the audio file to transcribe")
@@ -226,10 +235,20 @@ def main():
                        choices=["tiny", "base", "small", "medium", "large"],
                        help="Whisper model size (default: base)")
     parser.add_argument("--format", "-f", default="txt",
-                       choices=["txt", "srt"],
+                       choices=list(EXPORT_FORMATS),
                        help="Output format (default: txt)")
     parser.add_argument("--speakers", "-s", type=int, default=2,
                        help="Expected number of speakers (default: 2)")
+    parser.add_argument("--profile", "-p", default=DEFAULT_DECODE_PROFILE,
+                       choices=list(DECODE_PROFILES),
+                       help=f"Decoding profile (default: {DEFAULT_DECODE_PROFILE})")
+    parser.add_argument("--language", "-l", default=None,
+                       help="Language code, e.g. en (default: auto-detect)")
+    parser.add_argument("--no-speech-threshold", type=float, default=None,
+                       help="Probability above which a window is treated as silence")
+    parser.add_argument("--refine-model", default=None,
+                       choices=["tiny", "base", "small", "medium", "large"],
+                       help="Re-decode low-confidence segments with this larger model")
     
     args = parser.parse_args()
     
@@ -243,7 +262,11 @@ def main():
             print("\nProceeding with fallback speaker detection...\n")
         
         # Transcribe with speaker separation
-        result = transcribe_with_speakers(args.audio_file, args.model, args.speakers)
+        result = transcribe_with_speakers(args.audio_file, args.model, args.speakers,
+                                          decode_profile=args.profile,
+                                          language=args.language,
+                                          no_speech_threshold=args.no_speech_threshold,
+                                          refine_model_size=args.refine_model)
         
         # Save the transcription
         output_file = save_speaker_transcription(result, args.audio_file, args.format)
@@ -255,6 +278,7 @@ def main():
         print(f"Input file: {args.audio_file}")
         print(f"Output file: {output_file}")
         print(f"Model used: {args.model}")
+        print(f"Decode profile: {args.profile}")
         print(f"Expected speakers: {args.speakers}")
         print(f"Text length: {len(result['text'])} characters")
         print(f"Total segments: {len(result['segments'])}")
@@ -0,0 +1,577 @@
+"""
+Window-Level Result Cache
+Splits decoded audio into windows at pauses picked from the audio itself, so
+the same speech yields the same windows when a recording keeps growing or
+has its intro trimmed, and caches transcription and diarization results per
+window under a digest of its samples. Uploads that overlap earlier ones only
+run the models on the windows that have not been seen before.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+
+import numpy as np
+import whisper
+
+from transcribe_audio import run_whisper
+from refine import merge_refinement
+from performance import record_metric
+from speaker_index import identify_speakers
+
+# Where window results are kept, and how much disk they may use (0 disables the cache)
+WINDOW_CACHE_DIR = os.getenv(
+    'WINDOW_CACHE_DIR',
+    str(Path.home() / '.cache' / 'convertanything' / 'windows')
+)
+WINDOW_CACHE_MAX_MB = float(os.getenv('WINDOW_CACHE_MAX_MB', '500'))
+
+# Windows are cut at pauses at least this far apart and at most one Whisper window long
+WINDOW_MIN_SECONDS = 10.0
+WINDOW_MAX_SECONDS = 30.0
+
+# Pause detection: 10 ms frames within this many dB of the quiet end of the recording, for 0.2 s or more
+PAUSE_FRAME_SAMPLES = 160
+PAUSE_FLOOR_PERCENTILE = 5
+PAUSE_MARGIN_DB = 10.0
+PAUSE_THRESHOLD_STEP_DB = 3.0
+PAUSE_MIN_FRAMES = 20
+PAUSE_LENGTH_STEP_FRAMES = 10
+
+# Cuts go at the quietest CUT_SMOOTH_SAMPLES of a pause, searched this many frames around its middle
+CUT_SMOOTH_SAMPLES = 80
+CUT_SEARCH_FRAMES = 100
+
+# Cosine similarity above which speakers diarized in different windows are the same person
+SPEAKER_LINK_SIMILARITY = float(os.getenv('SPEAKER_LINK_SIMILARITY', '0.6'))
+
+# Text of the preceding windows given to the next decode as context
+PROMPT_CHARACTERS = 200
+
+def frame_energies(audio, frame_samples):
+    """Energy in dB of consecutive frames of a waveform"""
+    count = len(audio) // frame_samples
+    if count == 0:
+        return np.zeros(0)
+    frames = audio[:count * frame_samples].reshape(count, frame_samples).astype(np.float64)
+    return 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+
+def _pause_score(pause):
+    # Longer pauses win, then quieter ones, then earlier ones. Lengths are compared
+    # in coarse steps and quietness on exact sample sums, so that a few samples more
+    # or less at the start of a recording change nothing.
+    frame, length, _, quietness = pause
+    return (length // PAUSE_LENGTH_STEP_FRAMES, -quietness, -frame)
+
+def _quietest_sample(audio, start, end):
+    """
+    Sample to cut at between two offsets: the middle of the quietest stretch
+
+    Energies are summed over integer samples, so they do not depend on where
+    the recording starts and a copy with a trimmed intro is cut on the same
+    sample as the original. Ties go to the middle of the longest tied run,
+    and digital silence is cut in the middle of the whole silent stretch,
+    wherever the search started.
+
+    Returns:
+        tuple: (sample offset, energy of the stretch around it)
+    """
+    start, end = max(start, 0), min(end, len(audio))
+    if end - start <= CUT_SMOOTH_SAMPLES:
+        return (start + end) // 2, 0
+    levels = np.round(audio[start:end].astype(np.float64) * 32768).astype(np.int64)
+    sums = np.concatenate(([0], np.cumsum(levels * levels)))
+    energy = sums[CUT_SMOOTH_SAMPLES:] - sums[:-CUT_SMOOTH_SAMPLES]
+    quietest = np.flatnonzero(energy == energy.min())
+    runs = np.split(quietest, np.flatnonzero(np.diff(quietest) != 1) + 1)
+    run = max(runs, key=len)
+    if energy.min() == 0:
+        silent = start + int(run[0]) + CUT_SMOOTH_SAMPLES // 2
+        reach = int(WINDOW_MIN_SECONDS * whisper.audio.SAMPLE_RATE)
+        low, high = max(0, silent - reach), min(len(audio), silent + reach)
+        sounds = np.flatnonzero(np.round(audio[low:high].astype(np.float64) * 32768) != 0) + low
+        before, after = sounds[sounds < silent], sounds[sounds > silent]
+        first = int(before[-1]) + 1 if len(before) else low
+        last = int(after[0]) if len(after) else high
+        return (first + last) // 2, 0
+    return start + (int(run[0]) + int(run[-1])) // 2 + CUT_SMOOTH_SAMPLES // 2, int(energy.min())
+
+def _best_split(energy, pauses, start, end, min_frames):
+    """Frame to split an overlong span at: its best pause, else its quietest frame"""
+    low, high = start + min_frames, end - min_frames
+    if high <= low:
+        low, high = start + 1, end - 1
+    inside = [pause for pause in pauses if low <= pause[0] < high]
+    if inside:
+        return max(inside, key=_pause_score)[0]
+    return low + int(np.argmin(energy[low:high]))
+
+def find_windows(audio):
+    """
+    Split a waveform into windows at pauses chosen from the audio alone
+
+    A pause becomes a boundary when it is the longest within WINDOW_MIN_SECONDS
+    on either side. That depends only on the audio around it, so trimming or
+    extending a recording leaves the boundaries elsewhere where they were.
+    Windows still longer than WINDOW_MAX_SECONDS are split at their best pause.
+    Pauses are found on 10 ms frames counted from the start of the file, but
+    the cut itself goes on the quietest sample of the pause, so it does not
+    move when a trimmed copy's frames fall differently.
+
+    Args:
+        audio: Decoded 16 kHz waveform
+
+    Returns:
+        list: (start, end) sample offsets covering the whole waveform
+    """
+    total = len(audio)
+    frame_samples = PAUSE_FRAME_SAMPLES
+    frame_seconds = frame_samples / whisper.audio.SAMPLE_RATE
+    if total <= WINDOW_MAX_SECONDS * whisper.audio.SAMPLE_RATE:
+        return [(0, total)]
+
+    energy = frame_energies(audio, frame_samples)
+    # Rounded so that trimming or extending the recording rarely moves it
+    threshold = np.floor((np.percentile(energy, PAUSE_FLOOR_PERCENTILE) + PAUSE_MARGIN_DB) / PAUSE_THRESHOLD_STEP_DB)
+    quiet = energy < threshold * PAUSE_THRESHOLD_STEP_DB
+    edges = np.diff(np.concatenate(([0], quiet.astype(np.int8), [0])))
+    pauses = []
+    for run_start, run_end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+        if run_end - run_start >= PAUSE_MIN_FRAMES:
+            # Cut at the quietest stretch near the middle of the pause
+            middle = int(run_start + run_end) // 2
+            low = max(int(run_start) + 1, middle - CUT_SEARCH_FRAMES)
+            high = min(int(run_end) - 1, middle + CUT_SEARCH_FRAMES)
+            cut, quietness = _quietest_sample(audio, low * frame_samples, high * frame_samples)
+            pauses.append((middle, int(run_end - run_start), cut, quietness))
+
+    radius = int(WINDOW_MIN_SECONDS / frame_seconds)
+    boundaries = []
+    for i, pause in enumerate(pauses):
+        score = _pause_score(pause)
+        j = i - 1
+        local_best = True
+        while j >= 0 and pause[0] - pauses[j][0] <= radius and local_best:
+            local_best = _pause_score(pauses[j]) < score
+            j -= 1
+        j = i + 1
+        while j < len(pauses) and pauses[j][0] - pause[0] <= radius and local_best:
+            local_best = _pause_score(pauses[j]) < score
+            j += 1
+        if local_best:
+            boundaries.append(pause[0])
+
+    # Split spans that are still too long, working from the frames
+    frames = [0] + boundaries + [len(energy)]
+    max_frames = int(WINDOW_MAX_SECONDS / frame_seconds)
+    min_frames = int(WINDOW_MIN_SECONDS / frame_seconds)
+    spans = []
+    pending = list(zip(frames[:-1], frames[1:]))
+    while pending:
+        start, end = pending.pop(0)
+        if end - start > max_frames:
+            split = _best_split(energy, pauses, start, end, min_frames)
+            pending[:0] = [(start, split), (split, end)]
+        else:
+            spans.append((start, end))
+
+    # Cut inside the pause, or around the quietest frame of a span without one
+    by_frame = {pause[0]: pause[2] for pause in pauses}
+    cuts = {start: by_frame[start] if start in by_frame else
+            _quietest_sample(audio, (start - 1) * frame_samples, (start + 2) * frame_samples)[0]
+            for start, _ in spans[1:]}
+    return [(cuts.get(start, 0), cuts.get(end, total)) for start, end in spans]
+
+class Fingerprint:
+    """
+    Identity of a window's audio used to find it in the cache
+
+    The key is a SHA-256 digest of the window's samples, so a result is only
+    reused for exactly the same audio. Different recordings that merely sound
+    alike, such as speech at a steady level, never share a result.
+
+    Args:
+        clip: Waveform of the window
+    """
+
+    def __init__(self, clip):
+        self.duration = len(clip) / whisper.audio.SAMPLE_RATE
+        samples = np.ascontiguousarray(clip, dtype=np.float32)
+        self.digest = hashlib.sha256(samples.tobytes()).hexdigest()
+
+    @property
+    def key(self):
+        """Key the window's results are stored under"""
+        return self.digest
+
+class AudioWindow:
+    """
+    One window of a recording: sample offsets and fingerprint
+    """
+
+    def __init__(self, audio, start, end):
+        self.start = start
+        self.end = end
+        self.fingerprint = Fingerprint(audio[start:end])
+
+    @property
+    def start_seconds(self):
+        return self.start / whisper.audio.SAMPLE_RATE
+
+    @property
+    def end_seconds(self):
+        return self.end / whisper.audio.SAMPLE_RATE
+
+def split_windows(audio):
+    """Split a waveform into fingerprinted windows (see find_windows)"""
+    return [AudioWindow(audio, start, end) for start, end in find_windows(audio)]
+
+class WindowCache:
+    """
+    Per-window results on disk, one JSON file per window digest
+
+    Args:
+        root (str): Cache directory
+        max_mb (float): Disk space after which the least recently used files are removed
+    """
+
+    # Writes between checks of the cache size
+    PRUNE_EVERY = 200
+
+    def __init__(self, root=WINDOW_CACHE_DIR, max_mb=WINDOW_CACHE_MAX_MB):
+        self.root = root
+        self.max_mb = max_mb
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    @property
+    def enabled(self):
+        return self.max_mb > 0
+
+    def _path(self, kind, key):
+        return os.path.join(self.root, kind, key[:2], f'{key}.json')
+
+    def _load(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, kind, fingerprint, result_key):
+        """
+        Look up a window's result
+
+        Args:
+            kind (str): What the result is, e.g. transcripts or speakers
+            fingerprint (Fingerprint): The window's fingerprint
+            result_key (str): Settings the result depends on
+
+        Returns:
+            The stored result, or None
+        """
+        if not self.enabled:
+            return None
+        path = self._path(kind, fingerprint.key)
+        stored = self._load(path)
+        if stored is None or result_key not in stored.get('results', {}):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return stored['results'][result_key]
+
+    def put(self, kind, fingerprint, result_key, result):
+        """Store a window's result"""
+        if not self.enabled:
+            return
+        path = self._path(kind, fingerprint.key)
+        with self._lock:
+            stored = self._load(path) or {'duration': fingerprint.duration, 'results': {}}
+            stored.setdefault('results', {})[result_key] = result
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = f'{path}.{os.getpid()}.tmp'
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(stored, f)
+                os.replace(temp_path, path)
+            except (OSError, TypeError, ValueError) as e:
+                print(f"Warning: Could not cache window result: {e}")
+                return
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self.prune()
+
+    def prune(self):
+        """Remove the least recently used files until the cache fits in max_mb"""
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        limit = self.max_mb * 1024 * 1024
+        for _, size, path in sorted(files):
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+# Shared by all requests in this process
+window_cache = WindowCache()
+
+def reuse_stats(windows, reused):
+    """Summarize how much of a recording came from the cache"""
+    seconds = sum(window.end_seconds - window.start_seconds for window in windows)
+    seconds_reused = sum(window.end_seconds - window.start_seconds
+                         for window, hit in zip(windows, reused) if hit)
+    return {
+        'windows': len(windows),
+        'windows_reused': sum(1 for hit in reused if hit),
+        'seconds': round(seconds, 2),
+        'seconds_reused': round(seconds_reused, 2),
+        'ratio': round(seconds_reused / seconds, 3) if seconds else 0.0,
+    }
+
+def merge_reuse(total, stats):
+    """Add the reuse stats of one part of a recording to the running total"""
+    if total is None:
+        return dict(stats)
+    for key in ('windows', 'windows_reused'):
+        total[key] += stats[key]
+    for key in ('seconds', 'seconds_reused'):
+        total[key] = round(total[key] + stats[key], 2)
+    total['ratio'] = round(total['seconds_reused'] / total['seconds'], 3) if total['seconds'] else 0.0
+    return total
+
+def _runs(cached):
+    """Yield (first, last + 1) index ranges of consecutive windows missing from the cache"""
+    i = 0
+    while i < len(cached):
+        if cached[i] is not None:
+            i += 1
+            continue
+        j = i
+        while j < len(cached) and cached[j] is None:
+            j += 1
+        yield i, j
+        i = j
+
+def _window_of(windows, first, last, seconds):
+    """Index of the window in windows[first:last] containing a point in time"""
+    for i in range(first, last):
+        if seconds < windows[i].end_seconds:
+            return i
+    return last - 1
+
+def transcribe_windows(audio, model_size="base", decode_profile="balanced", language=None,
+                       no_speech_threshold=None, refine_model_size=None, cancel_token=None,
+                       initial_prompt=None, windows=None, detected_language=None):
+    """
+    Transcribe a waveform, reusing cached results for windows seen before
+
+    Consecutive windows missing from the cache are decoded together, so a
+    recording that is entirely new is decoded exactly as before.
+
+    Args:
+        audio: Decoded 16 kHz waveform
+        model_size (str): Whisper model size
+        decode_profile (str): Decoding profile (fast, balanced, accurate)
+        language (str): Language code; detected on the first new window if None
+        no_speech_threshold (float): Override for Whisper's silence threshold
+        refine_model_size (str): Larger model used to re-decode low-confidence spans
+        cancel_token (CancelToken): Stops decoding at the next 30 second window
+        initial_prompt (str): Text preceding the first window
+        windows (list): AudioWindows to transcribe (default: all of split_windows(audio))
+        detected_language (str): Language found on earlier windows when language is None
+
+    Returns:
+        dict: Whisper-style result with a 'reuse' summary
+    """
+    if windows is None:
+        windows = split_windows(audio)
+    # A window decoded in some language serves requests for that language or for detection
+    result_key = json.dumps([model_size, decode_profile, no_speech_threshold, refine_model_size])
+    cached = [window_cache.get('transcripts', window.fingerprint, result_key) for window in windows]
+    detected_language = language or detected_language or \
+        next((hit['language'] for hit in cached if hit is not None), None)
+    cached = [hit if hit is not None and hit['language'] in (detected_language, None) else None
+              for hit in cached]
+
+    parts = [None] * len(windows)
+    for i, hit in enumerate(cached):
+        if hit is not None:
+            parts[i] = hit
+    detection = None
+    refinement = None
+
+    for first, last in _runs(cached):
+        start, end = windows[first].start, windows[last - 1].end
+        offset = start / whisper.audio.SAMPLE_RATE
+        end_seconds = end / whisper.audio.SAMPLE_RATE
+
+        # Give the decoder the text before this run, cached or not
+        previous = ''.join(segment['text'] for part in parts[:first] if part for segment in part['segments'])
+        prompt = (previous or initial_prompt or '')[-PROMPT_CHARACTERS:] or None
+
+        result = run_whisper(audio[start:end], model_size, decode_profile, detected_language,
+                             no_speech_threshold, refine_model_size, cancel_token, initial_prompt=prompt)
+        if detected_language is None:
+            detected_language = result.get('language')
+            detection = result.get('language_detection')
+        refinement = merge_refinement(refinement, result.get('refinement'))
+
+        for i in range(first, last):
+            parts[i] = {'segments': [], 'language': result.get('language') or detected_language}
+        for segment in result.get('segments', []):
+            segment['start'] = min(segment['start'] + offset, end_seconds)
+            segment['end'] = min(segment['end'] + offset, end_seconds)
+            i = _window_of(windows, first, last, (segment['start'] + segment['end']) / 2)
+            parts[i]['segments'].append(segment)
+
+        for i in range(first, last):
+            # Stored relative to the window so they apply wherever it turns up again
+            window_start = windows[i].start_seconds
+            relative = [dict(segment, start=segment['start'] - window_start, end=segment['end'] - window_start)
+                        for segment in parts[i]['segments']]
+            window_cache.put('transcripts', windows[i].fingerprint, result_key,
+                             {'segments': relative, 'language': parts[i]['language']})
+
+    segments = []
+    for window, hit, part in zip(windows, cached, parts):
+        if hit is not None:
+            window_start = window.start_seconds
+            part = {'segments': [dict(segment, start=segment['start'] + window_start,
+                                      end=segment['end'] + window_start)
+                                 for segment in hit['segments']]}
+        segments.extend(part['segments'])
+    for i, segment in enumerate(segments):
+        segment['id'] = i
+
+    reuse = reuse_stats(windows, [hit is not None for hit in cached])
+    record_metric('window_reuse_ratio', reuse['ratio'])
+    return {
+        'text': ''.join(segment['text'] for segment in segments),
+        'segments': segments,
+        'language': detected_language,
+        'language_detection': detection,
+        'refinement': refinement,
+        'duration': len(audio) / whisper.audio.SAMPLE_RATE,
+        'reuse': {'transcription': reuse},
+    }
+
+def _cosine(a, b):
+    norm = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(np.dot(a, b) / norm) if norm else 0.0
+
+def link_speakers(windows_turns):
+    """
+    Give speakers diarized window by window labels that hold across windows
+
+    Speakers are matched to those of earlier windows by their embeddings;
+    one without a close enough match, or without an embedding, is new.
+
+    Args:
+        windows_turns (list): Per window, {'turns': [[start, end, label]], 'embeddings': {label: vector}}
+            with absolute times
+
+    Returns:
+        tuple: ([start, end, speaker] turns for the whole recording, {speaker: embedding sum or None})
+    """
+    speakers = []  # [label, embedding sum]
+    known = {}  # window label -> index in speakers, for labels shared by several windows
+    turns = []
+    for part in windows_turns:
+        taken = set()
+        for label in sorted({turn[2] for turn in part['turns']}):
+            embedding = part['embeddings'].get(label)
+            embedding = np.array(embedding) if embedding is not None else None
+            best = known.get(label)
+            if best is None and embedding is not None:
+                best_similarity = SPEAKER_LINK_SIMILARITY
+                for i, (_, total) in enumerate(speakers):
+                    if i in taken or total is None:
+                        continue
+                    similarity = _cosine(embedding, total)
+                    if similarity >= best_similarity:
+                        best, best_similarity = i, similarity
+            if best is None:
+                best = len(speakers)
+                speakers.append([f'SPEAKER_{best:02d}', None])
+            if embedding is not None and label not in known:
+                total = speakers[best][1]
+                speakers[best][1] = embedding if total is None else total + embedding
+            taken.add(best)
+            known[label] = best
+        turns.extend([start, end, speakers[known[label]][0]] for start, end, label in part['turns'])
+    return turns, dict(speakers)
+
+def diarize_windows(audio, diarization_pipeline=None, cancel_token=None, windows=None, client_id=None):
+    """
+    Diarize a waveform, reusing cached turns for windows seen before
+
+    Args:
+        audio: Decoded 16 kHz waveform
+        diarization_pipeline: pyannote pipeline to use instead of the shared one
+        cancel_token (CancelToken): Stops diarization at the next pipeline step
+        windows (list): AudioWindows to diarize (default: all of split_windows(audio))
+        client_id (str): Client whose speaker identities label the turns
+
+    Returns:
+        tuple: ([start, end, speaker] turns or None if diarization is unavailable, reuse summary)
+    """
+    from transcribe_with_speakers import speaker_turns
+
+    if windows is None:
+        windows = split_windows(audio)
+
+    cached = [window_cache.get('speakers', window.fingerprint, 'pyannote') for window in windows]
+    parts = [None] * len(windows)
+    for i, hit in enumerate(cached):
+        if hit is not None:
+            offset = windows[i].start_seconds
+            parts[i] = {'turns': [[start + offset, end + offset, f'{i}:{label}']
+                                  for start, end, label in hit['turns']],
+                        'embeddings': {f'{i}:{label}': vector for label, vector in hit['embeddings'].items()}}
+
+    for first, last in _runs(cached):
+        start, end = windows[first].start, windows[last - 1].end
+        offset = start / whisper.audio.SAMPLE_RATE
+        diarization = speaker_turns(audio[start:end], diarization_pipeline, cancel_token, with_embeddings=True)
+        if diarization is None:
+            return None, reuse_stats(windows, [hit is not None for hit in cached])
+
+        for i in range(first, last):
+            window_start, window_end = windows[i].start_seconds, windows[i].end_seconds
+            turns = []
+            for turn_start, turn_end, label in diarization['turns']:
+                turn_start, turn_end = max(turn_start + offset, window_start), min(turn_end + offset, window_end)
+                if turn_end > turn_start:
+                    turns.append([turn_start, turn_end, label])
+            labels = {label for _, _, label in turns}
+            embeddings = {label: vector for label, vector in diarization['embeddings'].items()
+                          if label in labels and vector is not None}
+            window_cache.put('speakers', windows[i].fingerprint, 'pyannote', {
+                'turns': [[turn_start - window_start, turn_end - window_start, label]
+                          for turn_start, turn_end, label in turns],
+                'embeddings': embeddings,
+            })
+            # Labels are shared by all windows of one run
+            parts[i] = {'turns': [[turn_start, turn_end, f'run{first}:{label}'] for turn_start, turn_end, label in turns],
+                        'embeddings': {f'run{first}:{label}': vector for label, vector in embeddings.items()}}
+
+    reuse = reuse_stats(windows, [hit is not None for hit in cached])
+    turns, embeddings = link_speakers(parts)
+    # Speakers seen in the client's earlier recordings get their stable identity
+    turns, _ = identify_speakers(turns, embeddings, client_id)
+    return turns, reuse
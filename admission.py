@@ -0,0 +1,493 @@
+"""
+Memory-aware admission control for ConvertAnything
+Estimates the peak memory of each transcription from its audio duration,
+model and mode, and only starts it once the estimate fits in the host's
+memory budget next to everything already running. Pre-forked workers share
+one budget through a ledger directory. Estimates are compared with the
+memory actually used and corrected over time.
+"""
+
+import os
+import json
+import time
+import fcntl
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+from performance import record_metric
+
+# Resident size of each Whisper model's weights on CPU, in MB
+MODEL_MEMORY_MB = {'tiny': 150, 'base': 300, 'small': 1000, 'medium': 3000, 'large': 6200}
+
+# Working memory of one running decode (mel features, activations, beams), in MB
+DECODE_MEMORY_MB = {'tiny': 200, 'base': 300, 'small': 600, 'medium': 1200, 'large': 2000}
+
+# pyannote pipeline weights, and its working memory per second of audio
+DIARIZATION_MEMORY_MB = 600
+DIARIZATION_MB_PER_SECOND = 0.3
+
+# Decoded audio: float32 samples plus ffmpeg's int16 output and a copy, per second
+AUDIO_MB_PER_SECOND = 16000 * (4 + 2 + 4) / (1024 * 1024)
+
+# Smaller models tried, in order, when a client allows a downgrade
+DOWNGRADE_ORDER = ['large', 'medium', 'small', 'base', 'tiny']
+
+def _default_budget_mb():
+    # 80% of physical memory, leaving room for the OS and the web server itself
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) / 1024 * 0.8
+    except OSError:
+        pass
+    return None
+
+# Memory all admitted transcriptions on the host may use together, in MB (0 disables admission control)
+MEMORY_BUDGET_MB = float(os.getenv('MEMORY_BUDGET_MB') or _default_budget_mb() or 0)
+
+# Directory where the serving processes of a host record what they have committed, so
+# they share the one budget; serve.py's workers use their shared job directory by default
+ADMISSION_STATE_DIR = os.getenv('ADMISSION_STATE_DIR') or (
+    os.path.join(os.environ['JOB_STATE_DIR'], 'admission') if os.getenv('JOB_STATE_DIR') else ''
+)
+
+# Models whose weights every process on the host shares (loaded before serve.py forks)
+SHARED_MODELS = set()
+
+# Where observed/estimated ratios are kept between runs
+MEMORY_CALIBRATION_FILE = os.getenv(
+    'CONVERTANYTHING_MEMORY_CALIBRATION',
+    str(Path.home() / '.cache' / 'convertanything' / 'memory_calibration.json')
+)
+
+# Weight of the newest observation, and the range corrections are kept in
+CALIBRATION_SMOOTHING = 0.3
+CALIBRATION_LIMITS = (0.5, 3.0)
+
+# Seconds between memory samples while a request runs
+SAMPLE_SECONDS = 0.2
+
+class AdmissionRejected(Exception):
+    """Raised when a request could never fit in the memory budget"""
+
+def process_rss_mb():
+    """Resident memory of this process in MB (None if unknown)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+def private_memory_mb(pid='self'):
+    """
+    Memory private to a process in MB (None if unknown)
+
+    Unlike the resident size, this leaves out pages still shared with the
+    process it was forked from, such as model weights loaded before the fork.
+    """
+    try:
+        private_kb = 0
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+            for line in f:
+                if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                    private_kb += int(line.split()[1])
+        return private_kb / 1024
+    except (OSError, ValueError):
+        return None
+
+def inference_process():
+    """
+    Where models run: (pid, loaded models) of the local model server if one is
+    up, else of this process
+    """
+    from model_server import get_model_server
+    from model_registry import loaded_models
+
+    server = get_model_server()
+    status = server.ping() if server is not None else None
+    if status:
+        return status['pid'], status['models']
+    return os.getpid(), loaded_models()
+
+def weights_mb(models):
+    return sum(MODEL_MEMORY_MB.get(model, 0) for model in models)
+
+class MemoryLedger:
+    """
+    Memory committed by every serving process on a host, one JSON file per process
+
+    Admission decisions are made under an flock on the directory's lock
+    file, so two processes cannot both take the last of the budget.
+
+    Args:
+        directory (str): Directory shared by the processes
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @contextmanager
+    def locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def publish(self, committed_mb, running, models_pid, models):
+        """Record this process's share and where its models live; call with the lock held"""
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'committed_mb': committed_mb, 'running': running,
+                       'models_pid': models_pid, 'models': list(models)}, f)
+        os.replace(temp_path, path)
+
+    def others(self):
+        """
+        Shares of the other live processes
+
+        Returns:
+            list: {'committed_mb', 'running', 'models_pid', 'models'} per process
+        """
+        shares = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return shares
+        for name in names:
+            pid = name[:-len('.json')]
+            if not name.endswith('.json') or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                # The process died without releasing; its memory is free again
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+                continue
+            except PermissionError:
+                pass
+            try:
+                with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                    shares.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return shares
+
+def request_mode(options):
+    """Name the pipeline a request runs, used to calibrate estimates separately"""
+    if options['speaker_separation']:
+        return 'speakers'
+    return 'draft' if options['draft'] else 'transcribe'
+
+class MemoryEstimate:
+    """
+    Estimated peak memory of one request, in MB
+    """
+
+    def __init__(self, model_size, mode, raw_mb, correction):
+        self.model_size = model_size
+        self.mode = mode
+        self.raw_mb = raw_mb
+        self.correction = correction
+        self.mb = raw_mb * correction
+
+    def to_dict(self):
+        return {'model': self.model_size, 'mode': self.mode,
+                'estimated_mb': round(self.mb), 'correction': round(self.correction, 2)}
+
+class AdmissionController:
+    """
+    Tracks memory committed to running requests against a budget
+
+    Args:
+        budget_mb (float): Memory admitted requests may use together (0 admits everything)
+    """
+
+    def __init__(self, budget_mb=MEMORY_BUDGET_MB, calibration_file=MEMORY_CALIBRATION_FILE,
+                 state_dir=ADMISSION_STATE_DIR):
+        self.budget_mb = budget_mb
+        self.calibration_file = calibration_file
+        self.ledger = MemoryLedger(state_dir) if state_dir else None
+        self.committed_mb = 0.0
+        self.running = 0
+        self.waiting = 0
+        self._calibration = None
+        self._cond = threading.Condition()
+
+    # -- estimation -------------------------------------------------------
+
+    def _load_calibration(self):
+        if self._calibration is None:
+            try:
+                with open(self.calibration_file, 'r', encoding='utf-8') as f:
+                    self._calibration = json.load(f)
+            except (OSError, ValueError):
+                self._calibration = {}
+        return self._calibration
+
+    def _save_calibration(self):
+        try:
+            os.makedirs(os.path.dirname(self.calibration_file), exist_ok=True)
+            temp_file = f"{self.calibration_file}.{os.getpid()}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._calibration, f, indent=2)
+            os.replace(temp_file, self.calibration_file)
+        except OSError as e:
+            print(f"Warning: Could not save memory calibration: {e}")
+
+    def estimate(self, duration, model_size, mode, refine_model_size=None, loaded_models=()):
+        """
+        Estimate the peak memory a request adds to this process
+
+        Args:
+            duration (float): Audio duration in seconds
+            model_size (str): Whisper model
+            mode (str): transcribe, draft or speakers (see request_mode)
+            refine_model_size (str): Larger model used for re-decoding, if any
+            loaded_models (list): Models already in memory, whose weights cost nothing extra
+
+        Returns:
+            MemoryEstimate
+        """
+        models = [model_size]
+        if mode == 'draft':
+            models.append('tiny')
+        if refine_model_size:
+            models.append(refine_model_size)
+
+        raw_mb = (duration or 0) * AUDIO_MB_PER_SECOND
+        for model in set(models):
+            if model not in loaded_models:
+                raw_mb += MODEL_MEMORY_MB.get(model, 0)
+        # Passes run one after another, so only the largest decode is live at once
+        raw_mb += max(DECODE_MEMORY_MB.get(model, 0) for model in models)
+        if mode == 'speakers':
+            raw_mb += DIARIZATION_MEMORY_MB + (duration or 0) * DIARIZATION_MB_PER_SECOND
+
+        with self._cond:
+            entry = self._load_calibration().get(f'{model_size}/{mode}')
+        return MemoryEstimate(model_size, mode, raw_mb, entry['ratio'] if entry else 1.0)
+
+    def calibrate(self, estimate, observed_mb):
+        """Fold an observed peak into the correction for this model and mode"""
+        if not observed_mb or observed_mb <= 0 or estimate.raw_mb <= 0:
+            return
+        ratio = min(max(observed_mb / estimate.raw_mb, CALIBRATION_LIMITS[0]), CALIBRATION_LIMITS[1])
+        key = f'{estimate.model_size}/{estimate.mode}'
+        with self._cond:
+            calibration = self._load_calibration()
+            entry = calibration.setdefault(key, {'ratio': ratio, 'runs': 0})
+            entry['ratio'] = ratio if entry['runs'] == 0 else \
+                (1 - CALIBRATION_SMOOTHING) * entry['ratio'] + CALIBRATION_SMOOTHING * ratio
+            entry['runs'] += 1
+            entry['updated_at'] = time.time()
+            self._save_calibration()
+        record_metric('admission_estimate_error_ratio', observed_mb / estimate.mb)
+
+    # -- admission --------------------------------------------------------
+
+    def _others(self):
+        return self.ledger.others() if self.ledger is not None else []
+
+    def host_running(self):
+        """Requests running on the host, in this process and the others sharing the budget"""
+        return self.running + sum(share['running'] for share in self._others())
+
+    @contextmanager
+    def _host_locked(self):
+        if self.ledger is None:
+            yield
+        else:
+            with self.ledger.locked():
+                yield
+
+    def host_usage(self, inference=None):
+        """
+        Memory in use across the host's serving processes
+
+        Args:
+            inference (tuple): (pid, models) where this process's requests run, see inference_process()
+
+        Returns:
+            dict: committed_mb and running over all processes, and weights_mb of the cached models
+        """
+        models_pid, models = inference or inference_process()
+        others = self._others()
+
+        # Weights count once per process holding them, so a model server shared by
+        # several workers counts once; weights loaded before serve.py forked count once
+        holders = {models_pid: set(models)}
+        for share in others:
+            holders.setdefault(share['models_pid'], set()).update(share['models'])
+        cached_mb = weights_mb(SHARED_MODELS) + sum(weights_mb(held - SHARED_MODELS) for held in holders.values())
+
+        return {
+            'committed_mb': self.committed_mb + sum(share['committed_mb'] for share in others),
+            'running': self.running + sum(share['running'] for share in others),
+            'weights_mb': cached_mb,
+        }
+
+    def fits(self, estimate, usage):
+        """Check whether a request fits next to the running ones and the cached models"""
+        if not self.budget_mb:
+            return True
+        # Alone on the host it runs anyway; cached models are evicted as needed
+        if usage['running'] == 0:
+            return estimate.mb <= self.budget_mb
+        return usage['weights_mb'] + usage['committed_mb'] + estimate.mb <= self.budget_mb
+
+    def check(self, estimate, fallbacks=()):
+        """
+        Pick the first of estimate and fallbacks that could run on an idle server
+
+        Raises:
+            AdmissionRejected: If none of them could
+        """
+        for candidate in [estimate] + list(fallbacks):
+            if not self.budget_mb or candidate.mb <= self.budget_mb:
+                return candidate
+        raise AdmissionRejected(
+            f"This request needs about {estimate.mb:.0f} MB, more than the server's "
+            f"{self.budget_mb:.0f} MB memory budget; try a smaller model or a shorter file"
+        )
+
+    def admit(self, estimate, cancel_token=None, on_wait=None, fallbacks=()):
+        """
+        Block until the request fits in the budget, then commit its memory
+
+        Args:
+            estimate (MemoryEstimate): The request's estimate
+            cancel_token (CancelToken): Stops waiting when cancelled
+            on_wait (callable): Called once if the request has to wait
+            fallbacks (list): Estimates for cheaper variants of the request (e.g.
+                smaller models), used instead of waiting when one fits right away
+
+        Returns:
+            Admission: Context manager that measures the peak and releases the
+            memory; its estimate tells which variant was admitted
+        """
+        candidates = [estimate] + list(fallbacks)
+        preferred = self.check(estimate, fallbacks)
+        candidates = candidates[candidates.index(preferred):]
+
+        start_time = time.perf_counter()
+        admission = self._try_admit(candidates)
+        if admission is None:
+            with self._cond:
+                self.waiting += 1
+            if on_wait is not None:
+                on_wait()
+            try:
+                # Other processes release without notifying us, so look again regularly;
+                # a fallback that fits first still beats waiting on for the preferred one
+                while admission is None:
+                    with self._cond:
+                        self._cond.wait(0.5)
+                    if cancel_token is not None:
+                        cancel_token.check()
+                    admission = self._try_admit(candidates)
+            finally:
+                with self._cond:
+                    self.waiting -= 1
+        record_metric('admission_wait_seconds', time.perf_counter() - start_time)
+        record_metric(f'admission_estimated_mb.{admission.estimate.model_size}', admission.estimate.mb)
+        return admission
+
+    def _try_admit(self, candidates):
+        """Commit the first candidate that fits right now, or return None"""
+        # Pings the model server, so it is asked before taking the condition
+        inference = inference_process()
+        with self._cond, self._host_locked():
+            usage = self.host_usage(inference)
+            for candidate in candidates:
+                if self.fits(candidate, usage):
+                    self.committed_mb += candidate.mb
+                    self.running += 1
+                    self._publish(inference)
+                    return Admission(self, candidate, inference[0], alone=usage['running'] == 0)
+        return None
+
+    def _publish(self, inference):
+        # Called with the host lock held
+        if self.ledger is not None:
+            self.ledger.publish(self.committed_mb, self.running, *inference)
+
+    def _release(self, admission, observed_mb):
+        inference = inference_process()
+        with self._cond:
+            with self._host_locked():
+                self.committed_mb = max(0.0, self.committed_mb - admission.estimate.mb)
+                self.running -= 1
+                self._publish(inference)
+            self._cond.notify_all()
+        # Peaks only say something about this request when it ran alone
+        if admission.alone and observed_mb is not None:
+            self.calibrate(admission.estimate, observed_mb)
+
+    def status(self):
+        usage = self.host_usage()
+        with self._cond:
+            return {
+                'budget_mb': round(self.budget_mb) if self.budget_mb else None,
+                'committed_mb': round(usage['committed_mb']),
+                'cached_models_mb': round(usage['weights_mb']),
+                'running': usage['running'],
+                'running_here': self.running,
+                'waiting': self.waiting,
+                'shared': self.ledger is not None,
+            }
+
+class Admission:
+    """
+    Memory committed to one running request
+
+    Used as a context manager around the work; samples the private memory
+    of the process the models run in (this one, or the model server)
+    meanwhile so the estimate can be calibrated.
+    """
+
+    def __init__(self, controller, estimate, models_pid, alone=False):
+        self.controller = controller
+        self.estimate = estimate
+        self.models_pid = models_pid
+        self.alone = alone
+        self.peak_mb = None
+        self._baseline_mb = None
+        self._done = threading.Event()
+        self._sampler = None
+
+    def _sample(self):
+        while not self._done.wait(SAMPLE_SECONDS):
+            used_mb = private_memory_mb(self.models_pid)
+            if used_mb is not None:
+                self.peak_mb = max(self.peak_mb or 0, used_mb)
+            if self.alone and self.controller.host_running() > 1:
+                self.alone = False
+
+    def __enter__(self):
+        self._baseline_mb = private_memory_mb(self.models_pid)
+        if self._baseline_mb is not None:
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._done.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        observed_mb = None
+        if exc_type is None and self._baseline_mb is not None and self.peak_mb is not None:
+            observed_mb = self.peak_mb - self._baseline_mb
+        self.controller._release(self, observed_mb)
+        return False
+
+# Shared by all requests in this process
+admission_controller = AdmissionController()
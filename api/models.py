@@ -1,48 +1,29 @@
+"""
+Available models endpoint for ConvertAnything (Vercel)
+Serves the same catalog as app.py's /api/models, from model_catalog.py.
+"""
+
+import os
+import sys
 import json
+from http.server import BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model_catalog import WHISPER_MODELS, DEFAULT_MODEL, AUTO_MODEL_INFO
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps({'models': WHISPER_MODELS, 'default': DEFAULT_MODEL, 'auto': AUTO_MODEL_INFO}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
-def handler(request):
-    """Available models endpoint for Vercel"""
-    
-    # Handle CORS preflight
-    if request.method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': ''
-        }
-    
-    if request.method == 'GET':
-        models = [
-            {'id': 'tiny', 'name': 'Tiny', 'description': 'Fastest, lower accuracy (~39 MB)'},
-            {'id': 'base', 'name': 'Base', 'description': 'Recommended balance (~74 MB)'},
-            {'id': 'small', 'name': 'Small', 'description': 'Better accuracy (~244 MB)'},
-            {'id': 'medium', 'name': 'Medium', 'description': 'High accuracy (~769 MB)'},
-            {'id': 'large', 'name': 'Large', 'description': 'Best accuracy (~1550 MB)'}
-        ]
-        
-        response = {
-            'models': models,
-            'default': 'base'
-        }
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps(response)
-        }
-    
-    # Method not allowed
-    return {
-        'statusCode': 405,
-        'headers': {
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': json.dumps({'error': 'Method not allowed'})
-    }
\ No newline at end of file
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
@@ -1,88 +1,412 @@
-import json
+"""
+Serverless transcription endpoint for ConvertAnything (Vercel)
+Transcription runs on self-hosted workers (app.py, or a fleet coordinator).
+The upload is streamed through to a worker's /api/jobs over a pooled
+keep-alive connection and parsed on the way, so it is never held in memory
+or written to disk here. The handler then waits briefly for the job and
+returns its result, or answers 202 with a URL to poll when it takes longer;
+polls come back through this function, which adds the workers' fleet token. Only the standard library is imported, to keep cold starts short.
+
+Run locally against a worker:
+    TRANSCRIBE_WORKER_URLS=http://localhost:5000 python api/transcribe.py
+"""
+
 import os
-import tempfile
-from datetime import datetime
-import traceback
-
-def handler(request):
-    """Transcription endpoint for Vercel"""
-    
-    # Handle CORS preflight
-    if request.method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': ''
-        }
-    
-    if request.method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
-    
+import re
+import sys
+import json
+import time
+import zlib
+import select
+import threading
+import http.client
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model_catalog import MODEL_CHOICES
+from client_identity import FORWARDED_CLIENT_HEADER, FORWARDING_SECRET, sign_client
+
+# Workers (or a fleet coordinator) uploads are forwarded to, comma-separated
+TRANSCRIBE_WORKER_URLS = [url.strip().rstrip('/') for url in os.getenv('TRANSCRIBE_WORKER_URLS', '').split(',')
+                          if url.strip()]
+
+# Address clients poll unfinished jobs at instead of this function, e.g. a coordinator they can reach
+TRANSCRIBE_PUBLIC_URL = os.getenv('TRANSCRIBE_PUBLIC_URL', '').rstrip('/')
+
+# How long to wait for a job before answering with its URL; keep below the function's maxDuration
+SERVERLESS_WAIT_SECONDS = float(os.getenv('SERVERLESS_WAIT_SECONDS', '8'))
+
+MAX_UPLOAD_BYTES = 100 * 1024 * 1024
+STREAM_CHUNK_BYTES = 64 * 1024
+WORKER_TIMEOUT = 30
+POLL_SECONDS = 0.5
+
+# Idle keep-alive connections kept per worker between invocations
+POOL_SIZE = 4
+
+# Limits on what the parser buffers: part headers and text fields
+HEADER_MAX_BYTES = 16 * 1024
+FIELD_MAX_BYTES = 64 * 1024
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-API-Key',
+}
+
+class MultipartParser:
+    """
+    Incremental multipart/form-data parser
+
+    Bytes are fed as they arrive. Text fields are collected; file parts are
+    only measured, so an upload of any size is parsed in constant memory.
+
+    Args:
+        boundary (bytes): Boundary from the Content-Type header
+    """
+
+    def __init__(self, boundary):
+        self.delimiter = b'\r\n--' + boundary
+        self.fields = {}
+        self.files = {}
+        self.finished = False
+        # The first delimiter has no line break before it
+        self._buffer = b'\r\n'
+        self._state = 'boundary'
+        self._part = None
+
+    def feed(self, data):
+        """
+        Parse the next bytes of the body
+
+        Raises:
+            ValueError: If the body is not valid multipart or a text field is too long
+        """
+        self._buffer += data
+        while True:
+            if self._state == 'boundary':
+                index = self._buffer.find(self.delimiter)
+                if index < 0:
+                    # Keep enough to recognise a delimiter split across chunks
+                    keep = len(self.delimiter) - 1
+                    if len(self._buffer) > keep:
+                        self._data(self._buffer[:-keep])
+                        self._buffer = self._buffer[-keep:]
+                    return
+                self._data(self._buffer[:index])
+                self._part = None
+                self._buffer = self._buffer[index + len(self.delimiter):]
+                self._state = 'delimiter'
+
+            elif self._state == 'delimiter':
+                if len(self._buffer) < 2:
+                    return
+                if self._buffer[:2] == b'--':
+                    self.finished = True
+                    self._state = 'epilogue'
+                elif self._buffer[:2] == b'\r\n':
+                    self._state = 'headers'
+                else:
+                    raise ValueError('Malformed multipart boundary')
+                self._buffer = self._buffer[2:]
+
+            elif self._state == 'headers':
+                index = self._buffer.find(b'\r\n\r\n')
+                if index < 0:
+                    if len(self._buffer) > HEADER_MAX_BYTES:
+                        raise ValueError('Multipart part headers too long')
+                    return
+                self._start_part(self._buffer[:index].decode('utf-8', 'replace'))
+                self._buffer = self._buffer[index + 4:]
+                self._state = 'boundary'
+
+            else:
+                self._buffer = b''
+                return
+
+    def _start_part(self, headers):
+        disposition = ''
+        for line in headers.split('\r\n'):
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-disposition':
+                disposition = value
+        name = re.search(r'(?:^|;)\s*name="([^"]*)"', disposition)
+        filename = re.search(r'(?:^|;)\s*filename="([^"]*)"', disposition)
+        name = name.group(1) if name else ''
+        if filename:
+            self.files[name] = {'filename': filename.group(1), 'size': 0}
+            self._part = ('file', name)
+        else:
+            self.fields[name] = b''
+            self._part = ('field', name)
+
+    def _data(self, data):
+        if self._part is None or not data:
+            return
+        kind, name = self._part
+        if kind == 'file':
+            self.files[name]['size'] += len(data)
+        else:
+            if len(self.fields[name]) + len(data) > FIELD_MAX_BYTES:
+                raise ValueError(f'Form field {name} is too long')
+            self.fields[name] += data
+
+    def field(self, name):
+        """A completed text field, or None while it has not arrived"""
+        if name not in self.fields or self._part == ('field', name):
+            return None
+        return self.fields[name].decode('utf-8', 'replace')
+
+class ConnectionPool:
+    """Keep-alive connections to the workers, reused while the function stays warm"""
+
+    def __init__(self, size=POOL_SIZE):
+        self.size = size
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        parts = urlsplit(url)
+        with self._lock:
+            idle = self._idle.get(parts.netloc, [])
+            while idle:
+                connection = idle.pop()
+                if self._usable(connection):
+                    return connection
+                connection.close()
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        return connection_class(parts.hostname, parts.port, timeout=WORKER_TIMEOUT)
+
+    def put(self, url, connection):
+        """Return a connection whose response has been read completely"""
+        netloc = urlsplit(url).netloc
+        with self._lock:
+            idle = self._idle.setdefault(netloc, [])
+            if len(idle) < self.size:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _usable(self, connection):
+        # An idle keep-alive socket becomes readable once the worker closes it
+        if connection.sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([connection.sock], [], [], 0)
+            return not readable
+        except (OSError, ValueError):
+            return False
+
+# Shared by the invocations a warm function instance serves
+connection_pool = ConnectionPool()
+_next_worker = 0
+
+def _worker_order():
+    """Workers to try, starting with the next in rotation"""
+    global _next_worker
+    start = _next_worker % len(TRANSCRIBE_WORKER_URLS)
+    _next_worker += 1
+    return TRANSCRIBE_WORKER_URLS[start:] + TRANSCRIBE_WORKER_URLS[:start]
+
+def client_address(headers, peer):
+    """
+    Address of the end user; Vercel's edge sets X-Real-IP and overwrites any
+    X-Forwarded-For the client sent, so those are only believed there
+    """
+    if os.getenv('VERCEL'):
+        forwarded = headers.get('X-Real-IP') or (headers.get('X-Forwarded-For') or '').split(',')[0].strip()
+        if forwarded:
+            return forwarded
+    return peer
+
+# Job ids as the workers issue them
+JOB_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def _path(url, path):
+    return (urlsplit(url).path or '') + path
+
+def _read_response(url, connection):
+    """Read a worker response and pool the connection again; returns (status, dict)"""
+    response = connection.getresponse()
+    payload = response.read()
+    if response.will_close:
+        connection.close()
+    else:
+        connection_pool.put(url, connection)
+    if response.getheader('Content-Encoding') == 'gzip':
+        payload = zlib.decompress(payload, 31)
     try:
-        # Check if OpenAI API key is configured
-        if not os.getenv('OPENAI_API_KEY'):
-            return {
-                'statusCode': 500,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'success': False,
-                    'error': 'OpenAI API key not configured. Please set OPENAI_API_KEY environment variable in Vercel dashboard.'
-                })
-            }
-        
-        # For now, return a placeholder response since we need multipart form handling
-        # This would need proper multipart parsing for file uploads
-        response = {
-            'success': True,
-            'result': {
-                'text': 'Transcription service is configured and ready. To enable file uploads, please implement multipart form parsing.',
-                'duration': 0,
-                'language': 'en',
-                'segments': []
-            },
-            'metadata': {
-                'filename': 'placeholder',
-                'model': 'whisper-1',
-                'speaker_separation': False,
-                'processed_at': datetime.now().isoformat(),
-                'environment': 'vercel_serverless'
-            }
-        }
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps(response)
+        return response.status, json.loads(payload or b'{}')
+    except ValueError:
+        return response.status, {'error': payload.decode('utf-8', 'replace')[:200]}
+
+def get_job(url, job_id):
+    """Poll a job on a worker, retrying once on a connection the worker had closed"""
+    headers = {'Accept-Encoding': 'gzip'}
+    # Fleet workers refuse API requests without it, polls included
+    if FORWARDING_SECRET:
+        headers['X-Fleet-Token'] = FORWARDING_SECRET
+    for attempt in range(2):
+        connection = connection_pool.get(url)
+        try:
+            connection.request('GET', _path(url, f'/api/jobs/{job_id}'), headers=headers)
+            return _read_response(url, connection)
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            if attempt:
+                raise
+
+class handler(BaseHTTPRequestHandler):
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in dict(CORS_HEADERS, **(headers or {})).items():
+            self.send_header(name, value)
+        if len(data) >= 1024 and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            data = zlib.compress(data, 5, wbits=31)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        for name, value in CORS_HEADERS.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        """Relay a poll for a job this function handed back with 202"""
+        query = parse_qs(urlsplit(self.path).query)
+        job_id = query.get('job_id', [''])[0]
+        worker = query.get('worker', [''])[0]
+        if not JOB_ID_PATTERN.match(job_id) or not worker.isdigit() or int(worker) >= len(TRANSCRIBE_WORKER_URLS):
+            return self._send(404, {'error': 'Job not found'})
+        try:
+            status, job = get_job(TRANSCRIBE_WORKER_URLS[int(worker)], job_id)
+        except (OSError, http.client.HTTPException) as e:
+            return self._send(502, {'error': f'Worker unreachable: {e}'})
+        return self._send(status, job)
+
+    def do_POST(self):
+        started = time.time()
+        try:
+            if not TRANSCRIBE_WORKER_URLS:
+                return self._send(503, {'success': False, 'error': 'No transcription workers configured'})
+
+            boundary = re.search(r'boundary="?([^";]+)"?', self.headers.get('Content-Type', ''))
+            if not self.headers.get('Content-Type', '').startswith('multipart/form-data') or not boundary:
+                return self._send(400, {'error': 'Expected a multipart/form-data upload'})
+            try:
+                length = int(self.headers.get('Content-Length', ''))
+            except ValueError:
+                return self._send(411, {'error': 'Content-Length required'})
+            if length > MAX_UPLOAD_BYTES:
+                return self._send(413, {'error': 'File too large. Maximum size is 100MB.'})
+
+            worker_url, connection = self._open_worker(length)
+            if connection is None:
+                return self._send(503, {'success': False, 'error': 'No transcription worker reachable'})
+
+            parser = MultipartParser(boundary.group(1).encode('latin-1'))
+            error = self._stream_upload(parser, connection, length)
+            if error is not None:
+                connection.close()
+                return self._send(400, {'error': error})
+
+            status, reply = _read_response(worker_url, connection)
+            if status != 202:
+                return self._send(status, reply)
+            print(f"Forwarded {parser.files.get('audio', {}).get('filename')} "
+                  f"({length} bytes) to {worker_url} as job {reply['job_id']}")
+            return self._wait_for_job(worker_url, reply['job_id'], started)
+
+        except Exception as e:
+            print(f"Transcription error: {str(e)}")
+            return self._send(502, {'success': False, 'error': f'Transcription failed: {str(e)}'})
+
+    def _open_worker(self, length):
+        """Send the request line and headers to the first worker that accepts a connection"""
+        forwarded_for = self.headers.get('X-Forwarded-For') or self.client_address[0]
+        headers = {
+            'Content-Type': self.headers['Content-Type'],
+            'Content-Length': str(length),
+            'X-Forwarded-For': forwarded_for,
         }
-        
-    except Exception as e:
-        print(f"Transcription error: {str(e)}")
-        print(traceback.format_exc())
-        
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'success': False,
-                'error': f'Transcription failed: {str(e)}'
-            })
-        }
\ No newline at end of file
+        if self.headers.get('X-API-Key'):
+            headers['X-API-Key'] = self.headers['X-API-Key']
+        # Workers key callers without an API key by this signed address, not the function's own
+        identity = sign_client(client_address(self.headers, self.client_address[0]))
+        if identity:
+            headers[FORWARDED_CLIENT_HEADER] = identity
+            headers['X-Fleet-Token'] = FORWARDING_SECRET
+
+        for worker_url in _worker_order():
+            connection = connection_pool.get(worker_url)
+            try:
+                connection.putrequest('POST', _path(worker_url, '/api/jobs'), skip_accept_encoding=True)
+                for name, value in headers.items():
+                    connection.putheader(name, value)
+                connection.endheaders()
+                return worker_url, connection
+            except (OSError, http.client.HTTPException) as e:
+                print(f"Worker {worker_url} unreachable: {e}")
+                connection.close()
+        return None, None
+
+    def _stream_upload(self, parser, connection, length):
+        """Copy the body to the worker while parsing it; returns an error message or None"""
+        remaining = length
+        while remaining > 0:
+            chunk = self.rfile.read(min(STREAM_CHUNK_BYTES, remaining))
+            if not chunk:
+                return 'Upload ended early'
+            remaining -= len(chunk)
+            try:
+                parser.feed(chunk)
+            except ValueError as e:
+                return str(e)
+            # Stop before sending the rest of a request the worker would refuse
+            model = parser.field('model')
+            if model is not None and model not in MODEL_CHOICES:
+                return 'Unknown model'
+            connection.send(chunk)
+
+        if not parser.finished:
+            return 'Incomplete multipart upload'
+        if 'audio' not in parser.files:
+            return 'No audio file provided'
+        return None
+
+    def _wait_for_job(self, worker_url, job_id, started):
+        """Return the job's result if it finishes in time, otherwise where to collect it"""
+        if TRANSCRIBE_PUBLIC_URL:
+            status_url = f"{TRANSCRIBE_PUBLIC_URL}/api/jobs/{job_id}"
+        else:
+            # Workers only answer the function, so the client polls through it
+            worker = TRANSCRIBE_WORKER_URLS.index(worker_url)
+            status_url = f"{urlsplit(self.path).path}?job_id={job_id}&worker={worker}"
+        while time.time() - started < SERVERLESS_WAIT_SECONDS:
+            status, job = get_job(worker_url, job_id)
+            if status != 200:
+                return self._send(status, job)
+            if job['status'] == 'completed':
+                return self._send(200, job['result'])
+            if job['status'] in ('failed', 'cancelled'):
+                return self._send(500, {'success': False, 'error': job['error'], 'job_id': job_id})
+            time.sleep(POLL_SECONDS)
+
+        # The client polls from here on, which keeps the job from being abandoned
+        return self._send(202, {
+            'success': True,
+            'job_id': job_id,
+            'status_url': status_url
+        }, headers={'Location': status_url})
+
+if __name__ == '__main__':
+    port = int(os.getenv('SERVERLESS_PORT', '3000'))
+    print(f"Serverless transcribe handler on http://localhost:{port}/ -> {', '.join(TRANSCRIBE_WORKER_URLS) or 'no workers'}")
+    ThreadingHTTPServer(('', port), handler).serve_forever()
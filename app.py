@@ -4,8 +4,9 @@ Flask API backend for ConvertAnything web application
 Connects the web UI to the Python transcription scripts
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
+from werkzeug.utils import secure_filename
 import os
 import sys
 import tempfile
@@ -13,11 +14,43 @@ import json
 from pathlib import Path
 from datetime import datetime
 import traceback
+import uuid
+import select
+import socket
+import time
 
 # Import our transcription modules
 sys.path.append(os.path.join(os.path.dirname(__file__), 'Transcribe Audio AI'))
-from transcribe_audio import transcribe_audio, save_transcription
-from transcribe_with_speakers import transcribe_with_speakers, save_speaker_transcription
+import whisper
+from transcribe_audio import transcribe_audio, save_transcription, DECODE_PROFILES, DEFAULT_DECODE_PROFILE
+from transcribe_with_speakers import transcribe_with_speakers, save_speaker_transcription, label_speakers, \
+    apply_speakers, speaker_turns
+from speaker_index import speaker_index
+from progressive import draft_then_refine
+from resumable import transcribe_resumable, new_state
+from window_cache import diarize_windows, split_windows, transcribe_windows, window_cache
+from compact_audio import load_audio, compact_duration
+from exports import render_export, export_cache, EXPORT_FORMATS
+from model_server import get_model_server
+from model_registry import loaded_models
+from performance import get_rtf_table, get_metrics
+from language_hints import language_hints
+from jobs import job_manager, JobWaiting
+from responses import transcript_response
+from transcripts import transcript_store, index_finished_job, SEARCH_DEFAULT_LIMIT
+from uploads import upload_store, PrefixDecoder, UploadError
+import fleet
+from admission import (admission_controller, request_mode, process_rss_mb, inference_process,
+                       AdmissionRejected, DOWNGRADE_ORDER)
+from checkpoints import checkpoint_store, CHECKPOINT_MIN_SECONDS
+from model_catalog import WHISPER_MODELS, MODEL_IDS, MODEL_CHOICES, DEFAULT_MODEL, AUTO_MODEL, AUTO_MODEL_INFO
+from model_selection import select_model, AUTO_TARGET_LATENCY
+from scheduling import cost_limiter, client_weight, job_cost, known_api_key, RateLimited
+from client_identity import FORWARDED_CLIENT_HEADER, verify_client
+
+# A fleet node without the shared secret would accept any peer
+if fleet.config_error():
+    raise SystemExit(f"Fleet configuration error: {fleet.config_error()}")
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend requests
@@ -27,6 +60,20 @@ UPLOAD_FOLDER = 'temp_uploads'
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
 ALLOWED_EXTENSIONS = {'mp3', 'wav', 'm4a', 'flac', 'ogg', 'mp4', 'avi', 'mov'}
 
+# Upper bound on any request's processing time; clients may ask for less
+MAX_REQUEST_SECONDS = float(os.getenv('MAX_REQUEST_SECONDS', '1800'))
+DISCONNECT_POLL_SECONDS = 1.0
+
+# Enrollment samples are cut to this many seconds before diarization
+SPEAKER_ENROLL_SECONDS = 120
+
+# Chunked uploads: decoded audio between early transcription passes, audio at the
+# end of what has arrived left for later (its windows may still move), and how
+# often the job looks for new parts
+UPLOAD_EARLY_SECONDS = 60
+UPLOAD_TAIL_SECONDS = 30
+UPLOAD_POLL_SECONDS = 0.5
+
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
@@ -37,6 +84,10 @@ def allowed_file(filename):
 
 def get_file_duration(filepath):
     """Get audio duration using ffmpeg-python or fallback"""
+    # Compact uploads carry it in their header
+    duration = compact_duration(filepath)
+    if duration is not None:
+        return duration
     try:
         import ffmpeg
         probe = ffmpeg.probe(filepath)
@@ -44,9 +95,58 @@ def get_file_duration(filepath):
         return duration
     except:
         # Fallback - estimate based on file size (very rough)
-        file_size = os.path.getsize(filepath)
-        # Rough estimate: 1MB per minute for compressed audio
-        return file_size / (1024 * 1024) * 60
+        return estimate_duration(os.path.getsize(filepath))
+
+def estimate_duration(file_size):
+    """Rough duration of compressed audio from its size: about 1MB per minute"""
+    return file_size / (1024 * 1024) * 60
+
+def client_disconnected(environ):
+    """
+    Check whether the client behind a request has closed its connection
+    
+    Works with servers that expose the connection socket (Werkzeug, Gunicorn);
+    elsewhere the client is assumed to still be there.
+    """
+    sock = environ.get('werkzeug.socket') or environ.get('gunicorn.socket')
+    if sock is None:
+        return False
+    
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        # The request body has been read, so a readable socket with no data is closed
+        return sock.recv(1, socket.MSG_PEEK) == b''
+    except (OSError, ValueError):
+        return True
+
+def wait_for_job(job, environ):
+    """Wait for a job while the client is connected; cancel it if they leave"""
+    while not job.wait(DISCONNECT_POLL_SECONDS):
+        if client_disconnected(environ):
+            print(f"Client disconnected, cancelling job {job.id}")
+            job.cancel('client disconnected')
+            return False
+        job.touch()
+    return True
+
+def get_client_id():
+    """
+    Identify the caller by a configured API key, else by the client a trusted
+    front end signed for (see client_identity.py), else by the remote address
+    """
+    key = request.headers.get('X-API-Key')
+    if key and known_api_key(key):
+        return key
+    return verify_client(request.headers.get(FORWARDED_CLIENT_HEADER)) or request.remote_addr
+
+@app.before_request
+def require_fleet_token():
+    """Fleet workers only take API requests from their coordinator"""
+    if fleet.FLEET_COORDINATOR_URL and request.path.startswith('/api/') and request.path != '/api/health':
+        if not fleet.check_token(request.headers):
+            return jsonify({'error': 'Invalid fleet token'}), 403
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -57,101 +157,596 @@ def health_check():
         'timestamp': datetime.now().isoformat()
     })
 
-@app.route('/api/transcribe', methods=['POST'])
-def transcribe_audio_api():
-    """Main transcription endpoint"""
-    try:
-        # Check if file is present
-        if 'audio' not in request.files:
-            return jsonify({'error': 'No audio file provided'}), 400
+def parse_transcription_options(form, client_id):
+    """
+    Read and validate transcription options from a request form
+    
+    Raises:
+        ValueError: With a message suitable for the client
+    """
+    options = {
+        'model': form.get('model', DEFAULT_MODEL),
+        'speaker_separation': form.get('speaker_separation', 'false').lower() == 'true',
+        'speaker_count': int(form.get('speaker_count', '2')),
+        'decode_profile': form.get('decode_profile', DEFAULT_DECODE_PROFILE),
+        'language': form.get('language') or None,
+        'source': form.get('source') or None,
+        'refine_model': form.get('refine_model') or None,
+        'draft': form.get('draft', 'false').lower() == 'true',
+        'allow_downgrade': form.get('allow_downgrade', 'false').lower() == 'true',
+        'no_speech_threshold': None,
+        'timeout': MAX_REQUEST_SECONDS,
+        'target_latency': None,
+        'client_id': client_id,
+    }
+    
+    if options['decode_profile'] not in DECODE_PROFILES:
+        raise ValueError(f"Unknown decode profile: {options['decode_profile']}")
+    
+    if options['model'] not in MODEL_CHOICES or \
+            (options['refine_model'] and options['refine_model'] not in MODEL_IDS):
+        raise ValueError('Unknown model')
+    
+    if form.get('no_speech_threshold'):
+        try:
+            options['no_speech_threshold'] = float(form['no_speech_threshold'])
+        except ValueError:
+            raise ValueError('no_speech_threshold must be a number')
+    
+    if form.get('target_latency'):
+        try:
+            options['target_latency'] = float(form['target_latency'])
+        except ValueError:
+            raise ValueError('target_latency must be a number of seconds')
+        if options['target_latency'] <= 0:
+            raise ValueError('target_latency must be positive')
+    
+    if form.get('timeout'):
+        try:
+            options['timeout'] = min(float(form['timeout']), MAX_REQUEST_SECONDS)
+        except ValueError:
+            raise ValueError('timeout must be a number of seconds')
+        if options['timeout'] <= 0:
+            raise ValueError('timeout must be positive')
+    
+    # Resolve the language: explicit value, cached hint, or detection
+    if options['language'] == 'auto':
+        language_hints.forget(client_id, options['source'])
+        options['language'] = None
+        options['language_source'] = 'detected'
+    elif options['language']:
+        options['language_source'] = 'request'
+    else:
+        options['language'] = language_hints.get(client_id, options['source'])
+        options['language_source'] = 'hint' if options['language'] else 'detected'
+    
+    return options
+
+def save_upload(file):
+    """Save an uploaded file to the temp folder and return its path"""
+    temp_filename = f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}_{file.filename}"
+    temp_filepath = os.path.join(UPLOAD_FOLDER, temp_filename)
+    file.save(temp_filepath)
+    return temp_filepath
+
+def format_result(result, duration):
+    """Shape a transcription result for the API, adding default speaker labels"""
+    # Convert to speaker format for consistency
+    if 'segments' not in result:
+        # Create segments from full text (simple splitting)
+        words = result['text'].split()
+        segment_length = len(words) // 5  # 5 segments
+        segments = []
         
-        file = request.files['audio']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
+        for i in range(0, len(words), max(1, segment_length)):
+            segment_words = words[i:i + segment_length]
+            segment_text = ' '.join(segment_words)
+            segments.append({
+                'start': i * 2,  # Rough timing
+                'end': (i + len(segment_words)) * 2,
+                'text': segment_text,
+                'speaker': 'Speaker 1'
+            })
         
-        if not allowed_file(file.filename):
-            return jsonify({'error': 'File type not supported'}), 400
+        result['segments'] = segments
+    else:
+        # Add speaker labels to existing segments
+        for segment in result['segments']:
+            if 'speaker' not in segment:
+                segment['speaker'] = 'Speaker 1'
+    
+    return {
+        'text': result.get('text', ''),
+        'duration': result.get('duration', duration),
+        'language': result.get('language', 'unknown'),
+        'segments': result.get('segments', [])
+    }
+
+def dispatching():
+    """Check whether transcriptions go to fleet workers instead of running here"""
+    return fleet.FLEET_MODE == 'coordinator' and bool(fleet.fleet_registry.workers())
+
+def memory_estimates(options, duration):
+    """
+    Estimate a request's peak memory for the requested model, followed by
+    estimates for each smaller model when the client allows a downgrade
+    """
+    mode = request_mode(options)
+    # Weights already loaded where the request will run cost nothing extra
+    loaded = inference_process()[1]
+    estimate = admission_controller.estimate(duration, options['model'], mode, options['refine_model'], loaded)
+    
+    fallbacks = []
+    if options['allow_downgrade'] and options['model'] in DOWNGRADE_ORDER:
+        for model_size in DOWNGRADE_ORDER[DOWNGRADE_ORDER.index(options['model']) + 1:]:
+            fallbacks.append(admission_controller.estimate(duration, model_size, mode, None, loaded))
+    return estimate, fallbacks
+
+def admit_transcription(options, duration, job):
+    """
+    Reserve memory for a request, waiting for running requests to finish if needed
+    
+    When the client allows it and a smaller model fits right away, that model
+    is used instead of waiting; options are updated to match.
+    """
+    estimate, fallbacks = memory_estimates(options, duration)
+    admission = admission_controller.admit(
+        estimate, job.cancel_token, fallbacks=fallbacks,
+        on_wait=lambda: job.update('waiting_for_memory')
+    )
+    
+    if admission.estimate.model_size != options['model']:
+        print(f"Not enough memory for {options['model']}, using {admission.estimate.model_size}")
+        options['downgraded_from'] = options['model']
+        options['model'] = admission.estimate.model_size
+        options['refine_model'] = None
+    return admission
+
+def transcribe_upload(temp_filepath, options, job, duration):
+    """Run the transcription pipeline selected by the options on a saved upload"""
+    cancel_token = job.cancel_token
+    
+    if options['draft']:
+        # Publish a tiny-model draft first, then refine it window by window
+        print(f"Starting draft-then-refine transcription: {temp_filepath}")
+        audio = load_audio(temp_filepath)
         
-        # Get parameters
-        model_size = request.form.get('model', 'base')
-        speaker_separation = request.form.get('speaker_separation', 'false').lower() == 'true'
-        speaker_count = int(request.form.get('speaker_count', '2'))
+        def on_update(stage, partial, progress):
+            job.update(stage, format_result(partial, duration), progress)
+        
+        # Share the host's model server when one is running
+        server = get_model_server()
+        refine = server.draft_then_refine if server is not None else draft_then_refine
         
-        # Save uploaded file temporarily
-        temp_filename = f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
-        temp_filepath = os.path.join(UPLOAD_FOLDER, temp_filename)
-        file.save(temp_filepath)
+        result = refine(
+            audio,
+            options['model'],
+            decode_profile=options['decode_profile'],
+            language=options['language'],
+            no_speech_threshold=options['no_speech_threshold'],
+            on_update=on_update,
+            cancel_token=cancel_token
+        )
         
+        if options['speaker_separation']:
+            job.update('separating_speakers')
+            label_speakers(result, audio, cancel_token=cancel_token, client_id=options['client_id'])
+    elif options['speaker_separation']:
+        # Use speaker separation
+        print(f"Starting transcription with speaker separation: {temp_filepath}")
+        result = transcribe_with_speakers(
+            temp_filepath, 
+            options['model'], 
+            options['speaker_count'],
+            decode_profile=options['decode_profile'],
+            language=options['language'],
+            no_speech_threshold=options['no_speech_threshold'],
+            refine_model_size=options['refine_model'],
+            cancel_token=cancel_token,
+            client_id=options['client_id']
+        )
+    else:
+        # Regular transcription
+        print(f"Starting regular transcription: {temp_filepath}")
+        result = transcribe_audio(
+            temp_filepath,
+            options['model'],
+            decode_profile=options['decode_profile'],
+            language=options['language'],
+            no_speech_threshold=options['no_speech_threshold'],
+            refine_model_size=options['refine_model'],
+            cancel_token=cancel_token
+        )
+    
+    return result
+
+def transcribe_checkpointed(checkpoint, options, job, duration):
+    """
+    Transcribe a checkpointed upload window by window, continuing from its
+    saved progress and saving it again after every window
+    """
+    cancel_token = job.cancel_token
+    state = checkpoint.load_progress() or new_state(options['language'])
+    resumed_from = state['position']
+    if resumed_from:
+        print(f"Resuming job {job.id} at {resumed_from:.0f}s of {duration:.0f}s")
+    else:
+        print(f"Starting checkpointed transcription: {checkpoint.audio_path}")
+    audio = load_audio(checkpoint.audio_path)
+    
+    def on_checkpoint(state):
+        checkpoint.save_progress(state)
+        partial = {'text': ''.join(segment['text'] for segment in state['segments']),
+                   'segments': [dict(segment) for segment in state['segments']]}
+        job.update('transcribing', format_result(partial, duration), min(90, int(90 * state['position'] / duration)))
+    
+    result = transcribe_resumable(
+        audio,
+        options['model'],
+        decode_profile=options['decode_profile'],
+        no_speech_threshold=options['no_speech_threshold'],
+        refine_model_size=options['refine_model'],
+        state=state,
+        on_checkpoint=on_checkpoint,
+        cancel_token=cancel_token
+    )
+    
+    if options['speaker_separation']:
+        if 'turns' not in state:
+            job.update('separating_speakers')
+            state['turns'], state['speaker_reuse'] = diarize_windows(audio, cancel_token=cancel_token,
+                                                                     client_id=options['client_id'])
+            checkpoint.save_progress(state)
+        result['reuse']['diarization'] = state['speaker_reuse']
+        apply_speakers(result, state['turns'])
+    
+    result['resumed_from'] = resumed_from or None
+    return result
+
+def run_transcription(temp_filepath, filename, options, job, duration=None, checkpoint=None):
+    """
+    Run the requested transcription pipeline on a saved upload
+    
+    Args:
+        temp_filepath (str): Path of the saved upload
+        filename (str): Original file name
+        options (dict): Options from parse_transcription_options()
+        job (Job): Job to report progress to; its cancel token stops the work
+        duration (float): Audio duration in seconds, probed if not given
+        checkpoint (Checkpoint): Saves progress so the job survives a restart
+    
+    Returns:
+        dict: API response body
+    """
+    if dispatching():
+        # Run on a worker node; it reports back in this same response format
+        response = fleet.dispatch(temp_filepath, filename, options, job)
+        response['metadata']['language_source'] = options['language_source']
+        response['metadata']['model_selection'] = options.get('model_selection')
+        language_hints.remember(
+            options['client_id'], options['source'],
+            response['result'].get('language'),
+            response['metadata'].get('language_detection')
+        )
+        return response
+    
+    # Get file duration
+    if duration is None:
+        duration = get_file_duration(temp_filepath)
+    
+    # Wait until the request fits in memory, possibly on a smaller model
+    admission = admit_transcription(options, duration, job)
+    with admission:
+        if checkpoint is not None:
+            result = transcribe_checkpointed(checkpoint, options, job, duration)
+        else:
+            result = transcribe_upload(temp_filepath, options, job, duration)
+    
+    # Remember the language so this caller can skip detection next time
+    language_hints.remember(
+        options['client_id'], options['source'],
+        result.get('language'),
+        result.get('language_detection')
+    )
+    
+    # Format response
+    return {
+        'success': True,
+        'result': format_result(result, duration),
+        'metadata': {
+            'filename': filename,
+            'model': options['model'],
+            'decode_profile': options['decode_profile'],
+            'language_source': options['language_source'],
+            'language_detection': detection,
+            'refinement': result.get('refinement'),
+            'model_selection': options.get('model_selection'),
+            'downgraded_from': options.get('downgraded_from'),
+            'memory': admission.estimate.to_dict(),
+            'resumed_from': result.get('resumed_from'),
+            'reuse': result.get('reuse'),
+            'speaker_separation': options['speaker_separation'],
+            'processed_at': datetime.now().isoformat()
+        }
+    }
+
+def get_uploaded_file():
+    """Return the uploaded audio file, or an error response tuple"""
+    # Check if file is present
+    if 'audio' not in request.files:
+        return None, (jsonify({'error': 'No audio file provided'}), 400)
+    
+    file = request.files['audio']
+    if file.filename == '':
+        return None, (jsonify({'error': 'No file selected'}), 400)
+    
+    if not allowed_file(file.filename):
+        return None, (jsonify({'error': 'File type not supported'}), 400)
+    
+    return file, None
+
+def job_metadata(filename, options):
+    """Summary of a request shown with its job"""
+    return {
+        'filename': filename,
+        'model': options['model'],
+        'draft': options['draft'],
+        'speaker_separation': options['speaker_separation'],
+        'cost': round(options.get('cost', 1.0), 1),
+        'model_selection': options.get('model_selection')
+    }
+
+def resolve_auto_model(options, duration):
+    """
+    Replace model=auto with the largest model expected to meet the request's
+    target latency, given its duration and the work already queued
+    """
+    if options['model'] != AUTO_MODEL:
+        return
+    model, selection = select_model(duration, options['speaker_separation'], options['decode_profile'],
+                                    options['target_latency'], job_manager.backlog(), loaded_models())
+    print(f"Auto model for {duration:.0f}s of audio: {model} ({selection['reason']})")
+    options['model'] = model
+    options['model_selection'] = selection
+    # The choice already trades quality for time, so memory pressure may too
+    options['allow_downgrade'] = True
+
+def charge_client(options, duration):
+    """
+    Charge a request to its client's cost budget, keeping the cost for scheduling
+    
+    Fleet workers leave limits to their coordinator, which charged the request already.
+    
+    Raises:
+        RateLimited: If the client has to wait before sending this much work
+    """
+    options['cost'] = job_cost(duration, options['model'], options['speaker_separation'])
+    if not fleet.FLEET_COORDINATOR_URL:
+        cost_limiter.charge(options['client_id'], options['cost'])
+
+def submit_transcription(file, options, checkpoint=False):
+    """
+    Save an upload and queue its transcription; the job removes the file
+    
+    Args:
+        file: Uploaded audio file
+        options (dict): Options from parse_transcription_options()
+        checkpoint (bool): Checkpoint long uploads so they survive a restart;
+            only useful when the client collects the result by job id
+    
+    Raises:
+        AdmissionRejected: If the request could not fit in memory even on an idle server
+        RateLimited: If the client has used up its cost budget for now
+    """
+    temp_filepath = save_upload(file)
+    filename = file.filename
+    
+    duration = None if dispatching() else get_file_duration(temp_filepath)
+    resolve_auto_model(options, duration if duration is not None
+                       else estimate_duration(os.path.getsize(temp_filepath)))
+    try:
+        if duration is not None:
+            admission_controller.check(*memory_estimates(options, duration))
+        # Dispatched requests are charged by size; the worker probes the duration
+        charge_client(options, duration if duration is not None
+                      else estimate_duration(os.path.getsize(temp_filepath)))
+    except (AdmissionRejected, RateLimited):
+        os.remove(temp_filepath)
+        raise
+    
+    if duration is not None and checkpoint and CHECKPOINT_MIN_SECONDS and duration >= CHECKPOINT_MIN_SECONDS:
+        # Partials come from each completed window instead of a draft pass
+        options['draft'] = False
+        return submit_checkpointed(checkpoint_store.create(
+            uuid.uuid4().hex, temp_filepath, filename, options, duration, options['timeout']
+        ))
+    
+    def run_job(job):
         try:
-            # Get file duration
-            duration = get_file_duration(temp_filepath)
-            
-            if speaker_separation:
-                # Use speaker separation
-                print(f"Starting transcription with speaker separation: {temp_filepath}")
-                result = transcribe_with_speakers(
-                    temp_filepath, 
-                    model_size, 
-                    speaker_count
-                )
-            else:
-                # Regular transcription
-                print(f"Starting regular transcription: {temp_filepath}")
-                result = transcribe_audio(temp_filepath, model_size)
-                
-                # Convert to speaker format for consistency
-                if 'segments' not in result:
-                    # Create segments from full text (simple splitting)
-                    words = result['text'].split()
-                    segment_length = len(words) // 5  # 5 segments
-                    segments = []
-                    
-                    for i in range(0, len(words), max(1, segment_length)):
-                        segment_words = words[i:i + segment_length]
-                        segment_text = ' '.join(segment_words)
-                        segments.append({
-                            'start': i * 2,  # Rough timing
-                            'end': (i + len(segment_words)) * 2,
-                            'text': segment_text,
-                            'speaker': 'Speaker 1'
-                        })
-                    
-                    result['segments'] = segments
-                else:
-                    # Add speaker labels to existing segments
-                    for segment in result['segments']:
-                        if 'speaker' not in segment:
-                            segment['speaker'] = 'Speaker 1'
-            
-            # Ensure we have duration
-            if 'duration' not in result:
-                result['duration'] = duration
-            
-            # Format response
-            response = {
-                'success': True,
-                'result': {
-                    'text': result.get('text', ''),
-                    'duration': result.get('duration', duration),
-                    'language': result.get('language', 'unknown'),
-                    'segments': result.get('segments', [])
-                },
-                'metadata': {
-                    'filename': file.filename,
-                    'model': model_size,
-                    'speaker_separation': speaker_separation,
-                    'processed_at': datetime.now().isoformat()
-                }
-            }
-            
-            return jsonify(response)
-            
+            return run_transcription(temp_filepath, filename, options, job, duration)
         finally:
             # Clean up temporary file
             try:
                 os.remove(temp_filepath)
             except:
                 pass
+    
+    return job_manager.submit(run_job, job_metadata(filename, options), timeout=options['timeout'],
+                              client_id=options['client_id'], cost=options['cost'])
+
+def submit_checkpointed(checkpoint, resumed=False):
+    """
+    Queue a checkpointed job; its checkpoint is removed however the job ends
+    
+    A resumed job is not abandoned before its client polls it again, so a
+    client that is slow to reconnect after a restart does not lose it.
+    """
+    request_info = checkpoint.request
+    options = request_info['options']
+    
+    def run_job(job):
+        return run_transcription(checkpoint.audio_path, request_info['filename'], options, job,
+                                 request_info['duration'], checkpoint)
+    
+    return job_manager.submit(
+        run_job, job_metadata(request_info['filename'], options),
+        # Time spent down counts against the original deadline
+        timeout=max(checkpoint.remaining_seconds(), 0.001),
+        job_id=checkpoint.job_id,
+        on_finish=lambda job: checkpoint.finish(),
+        client_id=options['client_id'],
+        cost=options.get('cost', 1.0),
+        await_client=resumed
+    )
+
+def resume_checkpoints():
+    """Pick up checkpointed jobs whose process died before they finished"""
+    for job_id in checkpoint_store.pending():
+        checkpoint = checkpoint_store.claim(job_id)
+        if checkpoint is None:
+            # Still running, here or in another worker
+            continue
+        print(f"Resuming checkpointed job {job_id}")
+        submit_checkpointed(checkpoint, resumed=True)
+
+if CHECKPOINT_MIN_SECONDS:
+    job_manager.add_reap_hook(resume_checkpoints)
+
+def transcribe_prefix(audio, options, job):
+    """
+    Transcribe the complete windows of an upload's leading audio into the window cache
+    
+    Returns:
+        float: Seconds of audio this pass covered
+    """
+    duration = len(audio) / whisper.audio.SAMPLE_RATE
+    windows = [window for window in split_windows(audio)
+               if window.end_seconds <= duration - UPLOAD_TAIL_SECONDS]
+    if windows:
+        with admit_transcription(options, duration, job):
+            result = transcribe_windows(
+                audio,
+                options['model'],
+                decode_profile=options['decode_profile'],
+                language=options['language'],
+                no_speech_threshold=options['no_speech_threshold'],
+                refine_model_size=options['refine_model'],
+                cancel_token=job.cancel_token,
+                windows=windows
+            )
+        job.update('transcribing_upload', format_result(result, duration))
+    return duration - UPLOAD_TAIL_SECONDS
+
+def wait_for_upload(session, options, upload, job):
+    """
+    Feed an upload's parts to its decoder as they arrive, outside the worker pool
+    
+    Returns once the upload is committed, or once enough new audio is decoded
+    for a transcribe_prefix() pass to be worth a worker slot.
+    
+    Args:
+        upload (dict): The upload's decoder and how far it has been fed and transcribed
+    
+    Returns:
+        float: Cost of the prefix pass, or None when the upload is committed
+    """
+    decoder = upload['decoder']
+    job.update('uploading')
+    while True:
+        job.cancel_token.check()
+        # Read before the parts, so every part of a committed upload gets fed
+        committed = session.committed
+        available = session.contiguous_bytes()
+        if decoder is not None and available > upload['fed']:
+            decoder.feed(session.read(upload['fed'], available))
+            upload['fed'] = available
+        if committed:
+            upload['committed'] = True
+            return None
+        
+        job.update(progress=int(10 * available / session.size))
+        if decoder is not None and not decoder.failed and window_cache.enabled:
+            pending = decoder.seconds - upload['transcribed_until']
+            if pending >= UPLOAD_EARLY_SECONDS + UPLOAD_TAIL_SECONDS:
+                return job_cost(pending, options['model'])
+        time.sleep(UPLOAD_POLL_SECONDS)
+
+def submit_upload_job(session, options):
+    """
+    Queue the transcription of a chunked upload; it starts before the upload completes
+    
+    The job only takes a worker slot to transcribe the leading windows that
+    have arrived (they land in the window cache, so the pass over the whole
+    file after the commit only decodes the audio that came later) and for
+    that final pass.
+    """
+    upload = {'decoder': None if dispatching() else PrefixDecoder(),
+              'fed': 0, 'transcribed_until': 0.0, 'committed': False}
+    
+    def run_job(job):
+        decoder = upload['decoder']
+        if not upload['committed']:
+            upload['transcribed_until'] = transcribe_prefix(decoder.samples(), options, job)
+            raise JobWaiting()
+        # The decoded audio when decoding kept up with the upload, otherwise the assembled upload
+        filepath = session.data_path
+        if decoder is not None and decoder.finish():
+            filepath = decoder.save_wav(os.path.join(session.path, 'decoded.wav'))
+        return run_transcription(filepath, session.filename, options, job)
+    
+    def clean_up(job):
+        if upload['decoder'] is not None:
+            upload['decoder'].abort()
+        session.remove()
+    
+    job = job_manager.submit(run_job, job_metadata(session.filename, options), timeout=options['timeout'],
+                             on_finish=clean_up, client_id=options['client_id'], cost=options['cost'],
+                             wait_for=lambda job: wait_for_upload(session, options, upload, job))
+    session.set_job(job.id)
+    return job
+
+job_manager.add_reap_hook(upload_store.expire)
+job_manager.add_reap_hook(export_cache.expire)
+job_manager.add_reap_hook(cost_limiter.expire)
+
+# Finished transcripts become searchable; fleet workers leave that to their coordinator
+if not fleet.FLEET_COORDINATOR_URL:
+    job_manager.add_finish_hook(index_finished_job)
+
+@app.route('/api/transcribe', methods=['POST'])
+def transcribe_audio_api():
+    """Main transcription endpoint"""
+    try:
+        file, error = get_uploaded_file()
+        if error:
+            return error
+        
+        # Get parameters
+        try:
+            options = parse_transcription_options(request.form, get_client_id())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Run on the shared worker pool so a departed client frees its slot
+        try:
+            job = submit_transcription(file, options)
+        except AdmissionRejected as e:
+            return jsonify({'success': False, 'error': str(e)}), 503
+        except RateLimited as e:
+            return rate_limited(e)
+        if not wait_for_job(job, request.environ):
+            return jsonify({'success': False, 'error': 'Client disconnected'}), 499
+        
+        if job.status == 'completed':
+            return transcript_response(job.result)
+        
+        if job.status == 'cancelled' and job.cancel_token.reason == 'deadline exceeded':
+            return jsonify({
+                'success': False,
+                'error': f"Transcription did not finish within {options['timeout']:g} seconds"
+            }), 504
+        
+        return jsonify({'success': False, 'error': job.error}), 500
                 
     except Exception as e:
         print(f"Transcription error: {str(e)}")
@@ -161,22 +756,385 @@ def transcribe_audio_api():
             'error': f'Transcription failed: {str(e)}'
         }), 500
 
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Start a background transcription and return its job id"""
+    try:
+        file, error = get_uploaded_file()
+        if error:
+            return error
+        
+        try:
+            options = parse_transcription_options(request.form, get_client_id())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        try:
+            job = submit_transcription(file, options, checkpoint=True)
+        except AdmissionRejected as e:
+            return jsonify({'success': False, 'error': str(e)}), 503
+        except RateLimited as e:
+            return rate_limited(e)
+        
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status_url': f'/api/jobs/{job.id}'
+        }), 202
+        
+    except Exception as e:
+        print(f"Job creation error: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'error': f'Could not start transcription: {str(e)}'
+        }), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get job status, progress and the draft or final result"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return transcript_response(job.to_dict())
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a job (POST form exists for navigator.sendBeacon)"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job_id': job.id})
+
+@app.route('/api/jobs/<job_id>/export', methods=['GET'])
+def export_job(job_id):
+    """Download a finished job's transcript as TXT, SRT, VTT, JSON or PDF"""
+    output_format = request.args.get('format', 'txt').lower()
+    if output_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format. Choose from: {", ".join(EXPORT_FORMATS)}'}), 400
+    
+    job = job_manager.get(job_id, touch=False)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status != 'completed':
+        return jsonify({'error': f'Job is {job.status}', 'status': job.status}), 409
+    
+    metadata = job.result.get('metadata', {})
+    filename = metadata.get('filename') or 'transcript'
+    download_name = f'{secure_filename(Path(filename).stem) or "audio"}_transcript.{output_format}'
+    
+    # Rendered once per result; repeat downloads are served from disk
+    cached = export_cache.get(job.id, output_format)
+    if cached is not None:
+        return send_file(cached, mimetype=EXPORT_FORMATS[output_format],
+                         as_attachment=True, download_name=download_name)
+    
+    chunks = render_export(job.result['result'], output_format, source=filename, model=metadata.get('model'))
+    return Response(
+        export_cache.stream(job.id, output_format, chunks),
+        mimetype=EXPORT_FORMATS[output_format],
+        headers={'Content-Disposition': f'attachment; filename="{download_name}"'}
+    )
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """Start a resumable chunked upload; its transcription starts as the parts arrive"""
+    try:
+        filename = request.form.get('filename', '')
+        if not allowed_file(filename):
+            return jsonify({'error': 'File type not supported'}), 400
+        
+        try:
+            size = int(request.form.get('size', '0'))
+            part_size = int(request.form['part_size']) if request.form.get('part_size') else None
+        except ValueError:
+            return jsonify({'error': 'size and part_size must be whole numbers of bytes'}), 400
+        if size > MAX_FILE_SIZE:
+            return too_large(None)
+        
+        try:
+            options = parse_transcription_options(request.form, get_client_id())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        # Partials come from the windows transcribed during the upload instead of a draft pass
+        options['draft'] = False
+        resolve_auto_model(options, estimate_duration(size))
+        
+        if not dispatching():
+            try:
+                admission_controller.check(*memory_estimates(options, estimate_duration(size)))
+            except AdmissionRejected as e:
+                return jsonify({'success': False, 'error': str(e)}), 503
+        try:
+            charge_client(options, estimate_duration(size))
+        except RateLimited as e:
+            return rate_limited(e)
+        
+        session = upload_store.create(filename, size, options, part_size, request.form.get('sha256') or None)
+        job = submit_upload_job(session, options)
+        return jsonify({
+            'success': True,
+            'upload_id': session.id,
+            'part_size': session.part_size,
+            'parts': session.part_count,
+            'upload_url': f'/api/uploads/{session.id}',
+            'job_id': job.id,
+            'status_url': f'/api/jobs/{job.id}'
+        }), 201
+        
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Upload creation error: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'error': f'Could not start upload: {str(e)}'
+        }), 500
+
+@app.route('/api/uploads/<upload_id>/parts/<int:index>', methods=['PUT'])
+def upload_part(upload_id, index):
+    """Store one part of a chunked upload; parts may arrive in any order and be resent"""
+    session = upload_store.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    try:
+        session.write_part(index, request.get_data(), request.headers.get('X-Part-SHA256'))
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    # A client still sending parts is still waiting for the job
+    if session.job_id:
+        job_manager.get(session.job_id)
+    return jsonify({'success': True, 'part': index, 'received': len(session.received()),
+                    'parts': session.part_count})
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Report which parts of a chunked upload have arrived, to resume it"""
+    session = upload_store.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(session.to_dict())
+
+@app.route('/api/uploads/<upload_id>/commit', methods=['POST'])
+def commit_upload(upload_id):
+    """Finish a chunked upload once all parts are in"""
+    session = upload_store.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    try:
+        session.commit(request.form.get('sha256') or None)
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e), 'missing': session.missing()}), 400
+    
+    job = job_manager.get(session.job_id) if session.job_id else None
+    if job is None:
+        # The server restarted during the upload; the parts are still here
+        job = submit_upload_job(session, session.options)
+    return jsonify({'success': True, 'job_id': job.id, 'status_url': f'/api/jobs/{job.id}'})
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def cancel_upload(upload_id):
+    """Abandon a chunked upload and its transcription"""
+    session = upload_store.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    if session.job_id:
+        job_manager.cancel(session.job_id)
+    session.remove()
+    return jsonify({'success': True, 'upload_id': upload_id})
+
 @app.route('/api/models', methods=['GET'])
 def get_available_models():
     """Get list of available Whisper models"""
-    models = [
-        {'id': 'tiny', 'name': 'Tiny', 'description': 'Fastest, lower accuracy (~39 MB)'},
-        {'id': 'base', 'name': 'Base', 'description': 'Recommended balance (~74 MB)'},
-        {'id': 'small', 'name': 'Small', 'description': 'Better accuracy (~244 MB)'},
-        {'id': 'medium', 'name': 'Medium', 'description': 'High accuracy (~769 MB)'},
-        {'id': 'large', 'name': 'Large', 'description': 'Best accuracy (~1550 MB)'}
+    models = WHISPER_MODELS
+    
+    # Real-time factors measured on this host (None until benchmarked)
+    rtf_table = get_rtf_table()
+    profiles = [
+        {
+            'id': profile_id,
+            'name': profile['name'],
+            'description': profile['description'],
+            'rtf': {
+                model['id']: rtf_table.get(profile_id, {}).get(model['id'])
+                for model in models
+            }
+        }
+        for profile_id, profile in DECODE_PROFILES.items()
     ]
     
     return jsonify({
         'models': models,
-        'default': 'base'
+        'default': DEFAULT_MODEL,
+        'auto': dict(AUTO_MODEL_INFO, default_target_latency=AUTO_TARGET_LATENCY),
+        'profiles': profiles,
+        'default_profile': DEFAULT_DECODE_PROFILE
+    })
+
+@app.route('/api/search', methods=['GET'])
+def search_transcripts():
+    """Find where something was said across the caller's finished transcripts"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing search query (q)'}), 400
+    if not transcript_store.enabled:
+        return jsonify({'error': 'Transcript store is disabled'}), 404
+    try:
+        limit = int(request.args.get('limit', SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    
+    started = time.time()
+    results = transcript_store.search(query, get_client_id(), limit, job_id=request.args.get('job_id'))
+    return jsonify({
+        'success': True,
+        'query': query,
+        'count': len(results),
+        'results': results,
+        'took_ms': round((time.time() - started) * 1000, 2)
+    })
+
+def speaker_owner():
+    """
+    Client allowed to change speaker identities: only callers with a configured
+    API key, so nobody can alter identities by sharing or spoofing an address
+
+    Returns:
+        tuple: (client id, None) or (None, error response)
+    """
+    client_id = get_client_id()
+    if not client_id or not known_api_key(client_id):
+        return None, (jsonify({'error': 'Changing speaker identities needs an API key (X-API-Key)'}), 401)
+    return client_id, None
+
+@app.route('/api/speakers', methods=['GET'])
+def list_speakers():
+    """List the caller's speaker identities, or only enrolled ones with ?enrolled=true"""
+    enrolled_only = request.args.get('enrolled', 'false').lower() == 'true'
+    return jsonify({'speakers': speaker_index.list(get_client_id(), enrolled_only)})
+
+@app.route('/api/speakers', methods=['POST'])
+def enroll_speaker():
+    """Enroll a named speaker of the caller from a recording of their voice"""
+    client_id, error = speaker_owner()
+    if error:
+        return error
+    name = request.form.get('name', '').strip()
+    if not name:
+        return jsonify({'error': 'Missing speaker name'}), 400
+    if not speaker_index.enabled:
+        return jsonify({'error': 'Speaker index is disabled'}), 404
+    file, error = get_uploaded_file()
+    if error:
+        return error
+    
+    temp_filepath = save_upload(file)
+    try:
+        audio = load_audio(temp_filepath)[:SPEAKER_ENROLL_SECONDS * whisper.audio.SAMPLE_RATE]
+        diarization = speaker_turns(audio, with_embeddings=True)
+        if diarization is None:
+            return jsonify({'error': 'Speaker diarization is not available on this server'}), 503
+        
+        # The sample's main voice is the one that talks longest
+        talk_time = {}
+        for start, end, label in diarization['turns']:
+            if diarization['embeddings'].get(label) is not None:
+                talk_time[label] = talk_time.get(label, 0) + end - start
+        if not talk_time:
+            return jsonify({'error': 'Not enough speech in the sample to enroll a speaker'}), 400
+        label = max(talk_time, key=talk_time.get)
+        
+        speaker = speaker_index.enroll(name, diarization['embeddings'][label], client_id)
+        return jsonify({'success': True, 'speaker': speaker, 'speech_seconds': round(talk_time[label], 1)}), 201
+    except Exception as e:
+        print(f"Speaker enrollment error: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({'success': False, 'error': f'Enrollment failed: {str(e)}'}), 500
+    finally:
+        try:
+            os.remove(temp_filepath)
+        except OSError:
+            pass
+
+@app.route('/api/speakers/<int:speaker_id>', methods=['PATCH'])
+def rename_speaker(speaker_id):
+    """Name (enroll) a speaker already seen in the caller's recordings, e.g. 'Speaker #12'"""
+    client_id, error = speaker_owner()
+    if error:
+        return error
+    data = request.get_json(silent=True) or request.form
+    speaker = speaker_index.rename(speaker_id, (data.get('name') or '').strip() or None, client_id)
+    if speaker is None:
+        return jsonify({'error': 'Speaker not found'}), 404
+    return jsonify({'success': True, 'speaker': speaker})
+
+@app.route('/api/speakers/<int:speaker_id>', methods=['DELETE'])
+def delete_speaker(speaker_id):
+    """Forget one of the caller's speaker identities"""
+    client_id, error = speaker_owner()
+    if error:
+        return error
+    if not speaker_index.delete(speaker_id, client_id):
+        return jsonify({'error': 'Speaker not found'}), 404
+    return jsonify({'success': True, 'speaker_id': speaker_id})
+
+@app.route('/api/metrics', methods=['GET'])
+def get_server_metrics():
+    """Get in-process counters and timings"""
+    return jsonify({
+        'metrics': get_metrics(),
+        'admission': admission_controller.status(),
+        'scheduler': job_manager.queue_status(),
+        'process': {'pid': os.getpid(), 'rss_mb': process_rss_mb()}
+    })
+
+@app.route('/api/queue', methods=['GET'])
+def get_queue_status():
+    """Get the caller's queued work, queue wait percentiles and remaining cost budget"""
+    client_id = get_client_id()
+    return jsonify({
+        'client': job_manager.queue_status(client_id),
+        'budget': {
+            'available': cost_limiter.tokens(client_id),
+            'rate': cost_limiter.rate * client_weight(client_id),
+            'burst': cost_limiter.burst * client_weight(client_id),
+        } if cost_limiter.enabled else None
     })
 
+@app.route('/api/fleet/register', methods=['POST'])
+def register_worker():
+    """Record a worker node's heartbeat (coordinator mode only)"""
+    if fleet.FLEET_MODE != 'coordinator':
+        return jsonify({'error': 'This node is not a fleet coordinator'}), 404
+    if not fleet.check_token(request.headers):
+        return jsonify({'error': 'Invalid fleet token'}), 403
+    
+    info = request.get_json(silent=True) or {}
+    if not info.get('node_id') or not info.get('url'):
+        return jsonify({'error': 'node_id and url are required'}), 400
+    
+    fleet.fleet_registry.register(info)
+    return jsonify({'success': True, 'heartbeat_seconds': fleet.FLEET_HEARTBEAT_SECONDS})
+
+@app.route('/api/fleet', methods=['GET'])
+def get_fleet():
+    """List the worker nodes currently registered with this coordinator"""
+    if fleet.FLEET_MODE != 'coordinator':
+        return jsonify({'error': 'This node is not a fleet coordinator'}), 404
+    return jsonify({'workers': fleet.fleet_registry.workers()})
+
+def rate_limited(e):
+    """Tell a client to come back once its cost budget allows the request"""
+    response = jsonify({'success': False, 'error': str(e), 'retry_after': e.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 @app.errorhandler(413)
 def too_large(e):
     """Handle file too large error"""
@@ -194,7 +1152,16 @@ if __name__ == '__main__':
     print("Available endpoints:")
     print("  GET  /api/health - Health check")
     print("  POST /api/transcribe - Transcribe audio file")
+    print("  POST /api/jobs - Start a background transcription")
+    print("  GET  /api/jobs/<id> - Job progress and result")
+    print("  GET  /api/jobs/<id>/export?format= - Download a finished transcript")
+    print("  POST /api/uploads - Start a resumable chunked upload")
+    print("  GET  /api/search?q= - Search finished transcripts")
+    print("  GET  /api/speakers - Speaker identities (POST to enroll)")
     print("  GET  /api/models - Available models")
+    print("  GET  /api/metrics - Server metrics")
+    print("  GET  /api/queue - Your queued work and remaining budget")
+    print("  GET  /api/fleet - Registered worker nodes (coordinator mode)")
     print()
     print("Frontend URL: http://localhost:8000 (serve with: python -m http.server 8000)")
     print("Backend API: http://localhost:5000")
@@ -230,14 +1197,18 @@ if __name__ == '__main__':
         exit(1)
     
     print("\n🚀 All dependencies satisfied!")
-    print("🌐 Starting server on http://localhost:5000")
+    port = int(os.getenv('API_PORT', '5001'))
+    fleet.start_heartbeat(port=port)
+    # Starts the reaper now so interrupted long jobs resume without waiting for traffic
+    job_manager.start()
+    print(f"🌐 Starting server on http://localhost:{port}")
     print("📝 Set HF_TOKEN environment variable for best speaker separation results")
     print("   Get token at: https://huggingface.co/settings/tokens")
     print("\nPress Ctrl+C to stop the server")
     print("-" * 60)
     
     try:
-        app.run(debug=False, host='0.0.0.0', port=5001, threaded=True)
+        app.run(debug=False, host='0.0.0.0', port=port, threaded=True)
     except KeyboardInterrupt:
         print("\n🛑 Server stopped by user")
     except Exception as e:
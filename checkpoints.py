@@ -0,0 +1,158 @@
+"""
+Durable checkpoints for long transcription jobs
+Keeps the upload, the request and the progress of each long job on disk so
+that a job interrupted by a crash, an OOM kill or a deploy continues from its
+last completed window, under the same job id, once a server picks it up again.
+"""
+
+import os
+import json
+import time
+import fcntl
+import shutil
+from pathlib import Path
+
+# Where checkpointed jobs live; shared by every worker process on the host
+CHECKPOINT_DIR = os.getenv(
+    'CHECKPOINT_DIR',
+    str(Path.home() / '.cache' / 'convertanything' / 'checkpoints')
+)
+
+# Background jobs at least this long (audio seconds) are checkpointed (0 disables)
+CHECKPOINT_MIN_SECONDS = float(os.getenv('CHECKPOINT_MIN_SECONDS', '600'))
+
+def _write_json(path, data):
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+class Checkpoint:
+    """
+    One checkpointed job, locked by the process working on it
+
+    The lock is an flock on a file in the job's directory, so it goes away
+    with the process however it dies and the job becomes claimable again.
+    """
+
+    def __init__(self, path, lock_file):
+        self.path = path
+        self.job_id = os.path.basename(path)
+        self._lock_file = lock_file
+        with open(os.path.join(path, 'request.json'), 'r', encoding='utf-8') as f:
+            self.request = json.load(f)
+        self.audio_path = os.path.join(path, self.request['audio'])
+
+    def load_progress(self):
+        """Return the saved progress, or None if no window has completed yet"""
+        try:
+            with open(os.path.join(self.path, 'progress.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_progress(self, state):
+        """Atomically replace the saved progress"""
+        try:
+            _write_json(os.path.join(self.path, 'progress.json'), state)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Warning: Could not checkpoint job {self.job_id}: {e}")
+
+    def remaining_seconds(self):
+        """Time left before the job's original deadline"""
+        return self.request['deadline'] - time.time()
+
+    def finish(self):
+        """Remove the checkpoint once the job has completed, failed or been cancelled"""
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.release()
+
+    def release(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+class CheckpointStore:
+    """
+    Directory of checkpointed jobs
+
+    Args:
+        root (str): Directory holding one subdirectory per job
+    """
+
+    def __init__(self, root=CHECKPOINT_DIR):
+        self.root = root
+
+    def _lock(self, path):
+        try:
+            lock_file = open(os.path.join(path, 'lock'), 'a')
+        except OSError:
+            # Finished and removed meanwhile
+            return None
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def create(self, job_id, upload_path, filename, options, duration, timeout):
+        """
+        Move an upload into a new checkpoint and lock it for this process
+
+        Args:
+            job_id (str): Id the job keeps across restarts
+            upload_path (str): Saved upload, moved into the checkpoint
+            filename (str): Original file name
+            options (dict): Options from parse_transcription_options()
+            duration (float): Audio duration in seconds
+            timeout (float): Seconds the job may run in total, downtime included
+
+        Returns:
+            Checkpoint
+        """
+        path = os.path.join(self.root, job_id)
+        os.makedirs(path)
+        lock_file = self._lock(path)
+        audio_name = 'audio' + os.path.splitext(filename)[1].lower()
+        shutil.move(upload_path, os.path.join(path, audio_name))
+        _write_json(os.path.join(path, 'request.json'), {
+            'audio': audio_name,
+            'filename': filename,
+            'options': options,
+            'duration': duration,
+            'deadline': time.time() + timeout,
+            'created_at': time.time(),
+        })
+        return Checkpoint(path, lock_file)
+
+    def pending(self):
+        """Ids of all checkpointed jobs, running or not"""
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return []
+        return [name for name in names
+                if name.isalnum() and os.path.exists(os.path.join(self.root, name, 'request.json'))]
+
+    def claim(self, job_id):
+        """
+        Lock a checkpointed job nobody is working on
+
+        Returns:
+            Checkpoint, or None if another process holds it or it is unreadable
+        """
+        path = os.path.join(self.root, job_id)
+        lock_file = self._lock(path)
+        if lock_file is None:
+            return None
+        try:
+            return Checkpoint(path, lock_file)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Dropping unreadable checkpoint {job_id}: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            lock_file.close()
+            return None
+
+# Shared by all requests in this process
+checkpoint_store = CheckpointStore()
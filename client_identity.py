@@ -0,0 +1,63 @@
+"""
+Forwarded client identities for ConvertAnything
+Front ends that relay requests to a worker (the serverless function, a
+fleet coordinator) name the real client in a signed X-Forwarded-Client
+header. A worker only believes the header when its HMAC checks out with the
+shared FLEET_TOKEN, so relayed users keep their own cost budget and queue
+share instead of all sharing the front end's address, and callers cannot
+claim to be someone else. Only the standard library is used, so the
+serverless function can import this too.
+"""
+
+import os
+import hmac
+import time
+import hashlib
+
+FORWARDED_CLIENT_HEADER = 'X-Forwarded-Client'
+
+# Secret shared by front ends and workers; without it identities are neither sent nor accepted
+FORWARDING_SECRET = os.getenv('FLEET_TOKEN', '')
+
+# Signed identities older than this many seconds (or this far in the future) are refused
+FORWARDED_CLIENT_MAX_AGE = 300
+
+def _signature(secret, timestamp, client_id):
+    message = f'{timestamp}.{client_id}'.encode('utf-8')
+    return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+def sign_client(client_id, secret=None, now=None):
+    """
+    Header value naming the client a relayed request comes from
+
+    Args:
+        client_id (str): The client, e.g. its address or a validated API key
+        secret (str): Shared secret, FORWARDING_SECRET by default
+
+    Returns:
+        str: "<timestamp>.<signature>.<client id>", or None without a secret
+    """
+    secret = FORWARDING_SECRET if secret is None else secret
+    if not secret or not client_id:
+        return None
+    timestamp = int(now if now is not None else time.time())
+    return f'{timestamp}.{_signature(secret, timestamp, client_id)}.{client_id}'
+
+def verify_client(value, secret=None, now=None):
+    """
+    Client named by a signed header value, or None if it is missing, forged or stale
+    """
+    secret = FORWARDING_SECRET if secret is None else secret
+    if not secret or not value:
+        return None
+    try:
+        timestamp, signature, client_id = value.split('.', 2)
+        age = (now if now is not None else time.time()) - int(timestamp)
+    except ValueError:
+        return None
+    if abs(age) > FORWARDED_CLIENT_MAX_AGE or not client_id:
+        return None
+    if not hmac.compare_digest(signature.encode('utf-8'),
+                               _signature(secret, timestamp, client_id).encode('utf-8')):
+        return None
+    return client_id
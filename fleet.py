@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Multi-node worker fleet for ConvertAnything
+A coordinator (the public Flask front end) forwards transcriptions to
+worker nodes that register with it. Each job goes to the worker that
+already has the requested model loaded and the shortest queue, and is
+retried on another worker if the first one fails.
+
+Run `python fleet.py local --workers 3` to try a coordinator and several
+workers on one machine.
+"""
+
+import os
+import sys
+import hmac
+import gzip
+import json
+import time
+import uuid
+import socket
+import secrets
+import argparse
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Transcribe Audio AI'))
+from cancellation import DeadlineExceeded
+from performance import record_metric
+from admission import MODEL_MEMORY_MB, DECODE_MEMORY_MB, admission_controller
+from client_identity import FORWARDED_CLIENT_HEADER, sign_client
+
+# 'coordinator' makes this node accept worker registrations and dispatch to them
+FLEET_MODE = os.getenv('FLEET_MODE', '')
+
+# Set on worker nodes: where to register, and the URL the coordinator should call back
+FLEET_COORDINATOR_URL = os.getenv('FLEET_COORDINATOR_URL', '')
+FLEET_WORKER_URL = os.getenv('FLEET_WORKER_URL', '')
+
+# Shared secret sent with registrations and dispatched jobs; required on coordinators and workers
+FLEET_TOKEN = os.getenv('FLEET_TOKEN', '')
+
+# Registrations are shared through this directory when the coordinator is pre-forked
+FLEET_STATE_DIR = os.getenv('FLEET_STATE_DIR') or os.getenv('JOB_STATE_DIR')
+
+FLEET_HEARTBEAT_SECONDS = float(os.getenv('FLEET_HEARTBEAT_SECONDS', '5'))
+FLEET_WORKER_TIMEOUT = float(os.getenv('FLEET_WORKER_TIMEOUT', '15'))  # no heartbeat for this long = gone
+FLEET_MAX_ATTEMPTS = int(os.getenv('FLEET_MAX_ATTEMPTS', '3'))
+FLEET_POLL_SECONDS = 0.5
+FLEET_HTTP_TIMEOUT = 30
+
+# Extra queue length (in full job slots) a worker without the model warm is charged
+FLEET_COLD_START_COST = float(os.getenv('FLEET_COLD_START_COST', '1.0'))
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+class WorkerUnavailable(Exception):
+    """Raised when a worker cannot be reached or loses a job; the job is retried elsewhere"""
+
+def _auth_headers():
+    return {'X-Fleet-Token': FLEET_TOKEN} if FLEET_TOKEN else {}
+
+def check_token(headers):
+    """Check the shared fleet secret on an incoming request (never matches without one)"""
+    if not FLEET_TOKEN:
+        return False
+    return hmac.compare_digest(headers.get('X-Fleet-Token', '').encode('utf-8'), FLEET_TOKEN.encode('utf-8'))
+
+def config_error():
+    """Why this node's fleet settings are unsafe to serve with, or None"""
+    if FLEET_MODE == 'coordinator' and not FLEET_TOKEN:
+        return ("FLEET_MODE=coordinator needs FLEET_TOKEN; without it any host could "
+                "register as a worker and receive user uploads")
+    if FLEET_COORDINATOR_URL and not FLEET_TOKEN:
+        return ("FLEET_COORDINATOR_URL needs FLEET_TOKEN; without it anyone could submit "
+                "jobs to this worker directly, past the coordinator's limits")
+    return None
+
+def _http(method, url, body=None, headers=None, timeout=FLEET_HTTP_TIMEOUT):
+    """
+    Make an HTTP request and decode its JSON reply
+
+    Returns:
+        tuple: (status code, decoded body)
+
+    Raises:
+        WorkerUnavailable: If the server cannot be reached
+    """
+    request = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status, payload, encoding = response.status, response.read(), response.headers.get('Content-Encoding')
+    except urllib.error.HTTPError as e:
+        status, payload, encoding = e.code, e.read(), e.headers.get('Content-Encoding')
+    except (urllib.error.URLError, OSError) as e:
+        raise WorkerUnavailable(str(getattr(e, 'reason', e)))
+
+    if encoding == 'gzip':
+        payload = gzip.decompress(payload)
+
+    try:
+        return status, json.loads(payload or b'null')
+    except ValueError:
+        return status, {'error': payload[:200].decode('utf-8', 'replace')}
+
+def _multipart_body(fields, file_field, filename, file_path, boundary):
+    """Yield a multipart/form-data body, streaming the file from disk"""
+    for name, value in fields.items():
+        yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+               f'{value}\r\n').encode('utf-8')
+    yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+           f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n').encode('utf-8')
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    yield f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+def post_upload(url, fields, file_field, filename, file_path, extra_headers=None):
+    """POST form fields and a file as multipart/form-data without reading it into memory"""
+    boundary = uuid.uuid4().hex
+    filename = filename.replace('"', '')
+    length = sum(len(part) for part in _multipart_body(fields, file_field, filename, os.devnull, boundary))
+    length += os.path.getsize(file_path)
+
+    headers = {
+        'Content-Type': f'multipart/form-data; boundary={boundary}',
+        'Content-Length': str(length),
+    }
+    headers.update(_auth_headers())
+    headers.update(extra_headers or {})
+    return _http('POST', url, _multipart_body(fields, file_field, filename, file_path, boundary), headers)
+
+def free_memory_mb():
+    """Memory available for new allocations on this host, in MB (None if unknown)"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+# ---------------------------------------------------------------------------
+# Coordinator
+# ---------------------------------------------------------------------------
+
+class WorkerRegistry:
+    """
+    Workers known to the coordinator, refreshed by their heartbeats
+    """
+
+    def __init__(self, state_dir=FLEET_STATE_DIR):
+        self.state_dir = os.path.join(state_dir, 'fleet') if state_dir else None
+        self._workers = {}   # node_id -> latest heartbeat
+        self._assigned = {}  # node_id -> jobs sent by this process and not yet finished
+        self._failed = {}    # node_id -> time of the last failed dispatch
+        self._lock = threading.Lock()
+        if self.state_dir:
+            os.makedirs(self.state_dir, exist_ok=True)
+
+    def register(self, info):
+        """Record a worker heartbeat"""
+        info = dict(info)
+        info['seen_at'] = time.time()
+        node_id = str(info['node_id'])
+        with self._lock:
+            self._workers[node_id] = info
+        if self.state_dir and node_id.replace('-', '').replace('.', '').isalnum():
+            path = os.path.join(self.state_dir, f'{node_id}.json')
+            temp_path = f'{path}.{os.getpid()}.tmp'
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(info, f)
+                os.replace(temp_path, path)
+            except OSError as e:
+                print(f"Warning: Could not share worker registration: {e}")
+
+    def _load_shared(self):
+        # Heartbeats received by sibling coordinator processes
+        if not self.state_dir:
+            return
+        for name in os.listdir(self.state_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.state_dir, name), 'r', encoding='utf-8') as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                continue
+            with self._lock:
+                current = self._workers.get(info['node_id'])
+                if current is None or current['seen_at'] < info['seen_at']:
+                    self._workers[info['node_id']] = info
+
+    def workers(self):
+        """Return heartbeats of the workers that are currently usable"""
+        self._load_shared()
+        now = time.time()
+        with self._lock:
+            return [
+                dict(info, assigned=self._assigned.get(node_id, 0))
+                for node_id, info in self._workers.items()
+                if now - info['seen_at'] < FLEET_WORKER_TIMEOUT
+                and self._failed.get(node_id, 0) < info['seen_at']
+            ]
+
+    def choose(self, model_size, exclude=()):
+        """
+        Pick the worker for a job
+
+        Prefers workers with the model already loaded and the fewest jobs
+        per slot; workers that would have to load the model without enough
+        free memory for it are skipped.
+
+        Returns:
+            dict: The chosen worker's heartbeat, or None if none can take it
+        """
+        best, best_cost = None, None
+        for info in self.workers():
+            if info['node_id'] in exclude:
+                continue
+            warm = model_size in info.get('models', [])
+            free_mb = info.get('free_memory_mb')
+            needed_mb = MODEL_MEMORY_MB.get(model_size, 0) + DECODE_MEMORY_MB.get(model_size, 0)
+            if not warm and free_mb is not None and free_mb < needed_mb:
+                continue
+
+            queued = info.get('active_jobs', 0) + info['assigned']
+            cost = queued / max(1, info.get('job_slots', 1))
+            if not warm:
+                cost += FLEET_COLD_START_COST
+            if best is None or cost < best_cost or \
+                    (cost == best_cost and (free_mb or 0) > (best.get('free_memory_mb') or 0)):
+                best, best_cost = info, cost
+        return best
+
+    def assign(self, node_id):
+        with self._lock:
+            self._assigned[node_id] = self._assigned.get(node_id, 0) + 1
+
+    def release(self, node_id):
+        with self._lock:
+            self._assigned[node_id] = max(0, self._assigned.get(node_id, 0) - 1)
+
+    def mark_failed(self, node_id):
+        """Stop routing to a worker until its next heartbeat"""
+        with self._lock:
+            self._failed[node_id] = time.time()
+
+# Workers registered with this coordinator
+fleet_registry = WorkerRegistry()
+
+def _forward_fields(options, cancel_token):
+    """Form fields that reproduce the coordinator's parsed options on a worker"""
+    fields = {
+        'model': options['model'],
+        'decode_profile': options['decode_profile'],
+        'speaker_separation': 'true' if options['speaker_separation'] else 'false',
+        'speaker_count': options['speaker_count'],
+        'draft': 'true' if options['draft'] else 'false',
+        # The coordinator already resolved language hints for the real client
+        'language': options['language'] or 'auto',
+    }
+    if options['refine_model']:
+        fields['refine_model'] = options['refine_model']
+    if options['no_speech_threshold'] is not None:
+        fields['no_speech_threshold'] = options['no_speech_threshold']
+    remaining = cancel_token.remaining()
+    if remaining is not None:
+        fields['timeout'] = max(remaining, 0.001)
+    return fields
+
+def _run_on_worker(worker, temp_filepath, filename, options, job):
+    """Submit a job to one worker and mirror its progress until it finishes"""
+    base_url = worker['url'].rstrip('/')
+    # The worker schedules the job fairly under the coordinator's client, not the coordinator
+    identity = sign_client(options['client_id'], FLEET_TOKEN)
+    status, body = post_upload(f'{base_url}/api/jobs', _forward_fields(options, job.cancel_token),
+                               'audio', filename, temp_filepath,
+                               {FORWARDED_CLIENT_HEADER: identity} if identity else None)
+    if status >= 500:
+        raise WorkerUnavailable(f"submit failed with HTTP {status}")
+    if status != 202:
+        # The worker rejected the request itself; another worker would too
+        raise RuntimeError((body or {}).get('error') or f"Worker rejected the job (HTTP {status})")
+
+    job_url = f"{base_url}/api/jobs/{body['job_id']}"
+    # Keep token ids for clients that ask the coordinator for them
+    poll_headers = dict(_auth_headers(), **{'Accept-Encoding': 'gzip'})
+    job.update(stage='dispatched')
+
+    while True:
+        if job.is_cancelled():
+            try:
+                _http('DELETE', job_url, headers=_auth_headers(), timeout=5)
+            except WorkerUnavailable:
+                pass
+            job.cancel_token.check()
+
+        status, state = _http('GET', f'{job_url}?tokens=true', headers=poll_headers)
+        if status == 404:
+            raise WorkerUnavailable("worker lost the job (restarted?)")
+        if status != 200:
+            raise WorkerUnavailable(f"status poll failed with HTTP {status}")
+
+        if state['status'] == 'completed':
+            return state['result']
+        if state['status'] == 'failed':
+            raise RuntimeError(state['error'])
+        if state['status'] == 'cancelled':
+            job.cancel_token.check()
+            if 'deadline' in (state['error'] or ''):
+                raise DeadlineExceeded(state['error'])
+            raise WorkerUnavailable(state['error'] or 'job cancelled on the worker')
+
+        if state['status'] == 'running':
+            job.update(state['stage'], state.get('partial'), state['progress'])
+        time.sleep(FLEET_POLL_SECONDS)
+
+def dispatch(temp_filepath, filename, options, job, registry=fleet_registry):
+    """
+    Run a transcription on the best available worker, retrying on others
+
+    Args:
+        temp_filepath (str): Path of the saved upload
+        filename (str): Original file name
+        options (dict): Options from parse_transcription_options()
+        job (Job): Local job that mirrors the remote job's progress
+
+    Returns:
+        dict: The worker's API response body, with the worker added to its metadata
+    """
+    tried = set()
+    last_error = 'no worker available'
+    for attempt in range(FLEET_MAX_ATTEMPTS):
+        worker = registry.choose(options['model'], exclude=tried)
+        if worker is None:
+            break
+
+        node_id = worker['node_id']
+        tried.add(node_id)
+        registry.assign(node_id)
+        start_time = time.perf_counter()
+        try:
+            print(f"Dispatching job {job.id} to worker {worker['url']} (attempt {attempt + 1})")
+            response = _run_on_worker(worker, temp_filepath, filename, options, job)
+            record_metric('fleet_dispatch_seconds', time.perf_counter() - start_time)
+            response.setdefault('metadata', {})
+            response['metadata']['worker'] = worker['url']
+            response['metadata']['attempts'] = attempt + 1
+            return response
+        except WorkerUnavailable as e:
+            print(f"Worker {worker['url']} failed job {job.id}: {e}")
+            registry.mark_failed(node_id)
+            record_metric('fleet_worker_failures')
+            last_error = str(e)
+        finally:
+            registry.release(node_id)
+
+    raise RuntimeError(f"No worker could run the transcription: {last_error}")
+
+# ---------------------------------------------------------------------------
+# Worker
+# ---------------------------------------------------------------------------
+
+def node_status(node_id, worker_url):
+    """Heartbeat describing this worker process"""
+    from jobs import job_manager
+    from model_server import get_model_server
+    from model_registry import loaded_models
+
+    server = get_model_server()
+    status = server.ping() if server is not None else None
+
+    # Room left in the worker's admission budget, if that is tighter than the host's free memory
+    free_mb = free_memory_mb()
+    admission = admission_controller.status()
+    if admission['budget_mb']:
+        budget_free_mb = admission['budget_mb'] - admission['committed_mb'] - admission['cached_models_mb']
+        free_mb = budget_free_mb if free_mb is None else min(free_mb, budget_free_mb)
+
+    return {
+        'node_id': node_id,
+        'url': worker_url,
+        'models': status['models'] if status else loaded_models(),
+        'active_jobs': job_manager.active_count(),
+        'job_slots': job_manager.workers,
+        'free_memory_mb': free_mb,
+    }
+
+def start_heartbeat(coordinator_url=FLEET_COORDINATOR_URL, worker_url=FLEET_WORKER_URL, port=None):
+    """
+    Register this process with a coordinator and keep the registration fresh
+
+    Args:
+        coordinator_url (str): Base URL of the coordinator
+        worker_url (str): URL the coordinator uses to reach this worker
+        port (int): Port used to build a default worker URL
+    """
+    if not coordinator_url:
+        return None
+    worker_url = worker_url or f'http://{socket.gethostname()}:{port}'
+    node_id = f'{socket.gethostname()}-{os.getpid()}'
+    register_url = f"{coordinator_url.rstrip('/')}/api/fleet/register"
+
+    def beat():
+        registered = None
+        while True:
+            try:
+                body = json.dumps(node_status(node_id, worker_url)).encode('utf-8')
+                headers = {'Content-Type': 'application/json'}
+                headers.update(_auth_headers())
+                status, reply = _http('POST', register_url, body, headers, timeout=10)
+                ok = status == 200
+                if ok != registered:
+                    print(f"Fleet: {'registered with' if ok else 'registration rejected by'} "
+                          f"{coordinator_url} as {worker_url}" + ('' if ok else f" (HTTP {status})"))
+            except WorkerUnavailable as e:
+                ok = False
+                if registered is not False:
+                    print(f"Fleet: coordinator {coordinator_url} unreachable: {e}")
+            registered = ok
+            time.sleep(FLEET_HEARTBEAT_SECONDS)
+
+    thread = threading.Thread(target=beat, name='fleet-heartbeat', daemon=True)
+    thread.start()
+    return thread
+
+def run_local(workers, port, base_port):
+    """Start a coordinator and several workers on this machine until interrupted"""
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+    coordinator_url = f'http://127.0.0.1:{port}'
+    token = FLEET_TOKEN or secrets.token_hex(16)
+
+    # The coordinator only waits on workers, so it can hold many jobs at once
+    env = dict(os.environ, API_PORT=str(port), FLEET_MODE='coordinator', FLEET_TOKEN=token,
+               JOB_WORKERS=os.getenv('JOB_WORKERS', str(8 * workers)))
+    env.pop('FLEET_COORDINATOR_URL', None)
+    coordinator = subprocess.Popen([sys.executable, app_path], env=env)
+
+    def start_worker(worker_port):
+        env = dict(os.environ, API_PORT=str(worker_port), FLEET_MODE='', FLEET_TOKEN=token,
+                   FLEET_COORDINATOR_URL=coordinator_url,
+                   FLEET_WORKER_URL=f'http://127.0.0.1:{worker_port}')
+        return subprocess.Popen([sys.executable, app_path], env=env)
+
+    worker_processes = {base_port + i: start_worker(base_port + i) for i in range(workers)}
+    print(f"Fleet: coordinator on {coordinator_url}, {workers} workers from port {base_port}")
+    try:
+        while coordinator.poll() is None:
+            # Restart crashed workers, like a supervisor on a real node would
+            for worker_port, process in list(worker_processes.items()):
+                if process.poll() is not None:
+                    print(f"Fleet: worker on port {worker_port} exited, restarting")
+                    worker_processes[worker_port] = start_worker(worker_port)
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        processes = [coordinator] + list(worker_processes.values())
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="ConvertAnything worker fleet")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    local = subparsers.add_parser('local', help="Run a coordinator and workers on this machine")
+    local.add_argument("--workers", "-w", type=int, default=2, help="Number of worker nodes (default: 2)")
+    local.add_argument("--port", type=int, default=5001, help="Coordinator port (default: 5001)")
+    local.add_argument("--base-port", type=int, default=5101, help="First worker port (default: 5101)")
+
+    args = parser.parse_args()
+    if args.command == 'local':
+        run_local(args.workers, args.port, args.base_port)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,414 @@
+"""
+Background transcription jobs for ConvertAnything
+Runs transcriptions on a small worker pool and keeps their progress and
+partial results so clients can poll instead of holding a request open.
+Queued jobs are started in fair order across clients, see scheduling.py.
+Jobs whose input is still arriving wait on a thread of their own instead of
+a worker slot.
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+import traceback
+from datetime import datetime
+
+from cancellation import CancelToken, TranscriptionCancelled
+from scheduling import FairQueue
+
+# Number of transcriptions run at the same time
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+
+# Jobs nobody has polled for this long are treated as abandoned and cancelled
+JOB_ABANDON_SECONDS = int(os.getenv('JOB_ABANDON_SECONDS', '60'))
+
+# Finished jobs are kept this long for clients to collect
+JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', '3600'))
+
+# Directory shared by pre-forked workers so any of them can serve any job
+JOB_STATE_DIR = os.getenv('JOB_STATE_DIR')
+
+FINISHED_STATES = ('completed', 'failed', 'cancelled')
+
+class JobWaiting(Exception):
+    """Raised by a running job to give its worker slot back until its wait_for(job) returns again"""
+
+def _state_path(job_id, suffix):
+    # Job ids are generated hex strings; anything else never names a file
+    if not job_id.isalnum():
+        return None
+    return os.path.join(JOB_STATE_DIR, f'{job_id}.{suffix}')
+
+class Job:
+    """
+    A single transcription job and its observable state
+    """
+
+    def __init__(self, metadata, timeout=None, job_id=None, client_id=None, cost=1.0, await_client=False):
+        self.id = job_id or uuid.uuid4().hex
+        self.client_id = client_id
+        self.cost = cost
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.progress = 0
+        self.partial = None
+        self.result = None
+        self.error = None
+        self.metadata = metadata
+        self.created_at = datetime.now().isoformat()
+        self.submitted_at = time.time()
+        # None until the first poll for jobs whose client may not be back yet
+        self.last_polled = None if await_client else self.submitted_at
+        self.finished_at = None
+        self.cancel_token = CancelToken(timeout)
+        self.on_finish = None
+        self.wait_for = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def update(self, stage=None, partial=None, progress=None):
+        """Publish progress and an optional partial result"""
+        with self._lock:
+            if stage is not None:
+                self.stage = stage
+            if partial is not None:
+                self.partial = partial
+            if progress is not None:
+                self.progress = progress
+        self.publish()
+
+    def publish(self):
+        """Write a snapshot other worker processes can read"""
+        if not JOB_STATE_DIR:
+            return
+        path = _state_path(self.id, 'json')
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f)
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Warning: Could not publish job {self.id}: {e}")
+
+    def cancel(self, reason='cancelled'):
+        self.cancel_token.cancel(reason)
+
+    def is_cancelled(self):
+        return self.cancel_token.is_cancelled()
+
+    def touch(self):
+        """Record that a client is still waiting for this job"""
+        self.last_polled = time.time()
+
+    def wait(self, timeout=None):
+        """Wait for the job to finish; returns False on timeout"""
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'stage': self.stage,
+                'progress': self.progress,
+                'partial': self.partial if self.status not in FINISHED_STATES else None,
+                'result': self.result,
+                'error': self.error,
+                'metadata': self.metadata,
+                'created_at': self.created_at,
+            }
+
+class JobSnapshot:
+    """
+    Read-only view of a job owned by another worker process
+
+    Cancelling and polling leave marker files that the owning worker picks up.
+    """
+
+    def __init__(self, state):
+        self.id = state['job_id']
+        self.status = state['status']
+        self.error = state['error']
+        self.result = state['result']
+        self._state = state
+
+    @classmethod
+    def load(cls, job_id):
+        path = _state_path(job_id, 'json')
+        if path is None:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def to_dict(self):
+        return self._state
+
+    def touch(self):
+        path = _state_path(self.id, 'polled')
+        try:
+            with open(path, 'a'):
+                pass
+            os.utime(path)
+        except OSError:
+            pass
+
+    def cancel(self, reason='cancelled'):
+        try:
+            with open(_state_path(self.id, 'cancel'), 'w', encoding='utf-8') as f:
+                f.write(reason)
+        except OSError as e:
+            print(f"Warning: Could not cancel job {self.id}: {e}")
+
+class JobManager:
+    """
+    Keeps jobs in memory and runs them on a pool of worker threads
+    """
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queue = FairQueue(workers)
+        self._threads = None
+        self._reaper = None
+        self._reap_hooks = []
+        self._finish_hooks = []
+
+    def _start(self):
+        # Threads are started lazily so the manager can be created before forking
+        if self._threads is None:
+            self._threads = [threading.Thread(target=self._work_forever, name=f'job_{i}', daemon=True)
+                             for i in range(self.workers)]
+            for thread in self._threads:
+                thread.start()
+            self._reaper = threading.Thread(target=self._reap_forever, daemon=True)
+            self._reaper.start()
+
+    def start(self):
+        """Start the worker pool and reaper now instead of on the first submit"""
+        with self._lock:
+            self._start()
+
+    def add_reap_hook(self, func):
+        """Call func() from the reaper thread every few seconds, e.g. to pick up orphaned work"""
+        self._reap_hooks.append(func)
+
+    def add_finish_hook(self, func):
+        """Call func(job) for every job once it has ended, e.g. to index finished transcripts"""
+        self._finish_hooks.append(func)
+
+    def submit(self, func, metadata, timeout=None, job_id=None, on_finish=None, client_id=None, cost=1.0,
+               wait_for=None, await_client=False):
+        """
+        Queue func(job) to run in the background
+
+        func returns the finished result dict, or raises TranscriptionCancelled
+        once job.cancel_token is cancelled or its timeout (seconds) passes.
+        job_id resumes a job under the id its client already knows, and
+        on_finish(job) is called however the job ends, even if func never ran.
+        client_id and cost (see scheduling.job_cost()) decide when it starts
+        relative to other clients' jobs.
+
+        wait_for(job), if given, blocks on a thread outside the worker pool
+        until the job has work for a slot, e.g. until enough of an upload has
+        arrived. It runs before the job is first queued and again whenever func
+        raises JobWaiting, and returns the cost of the next run (None for cost).
+
+        With await_client the job is not abandoned before its client first
+        polls it, e.g. a job resumed after a restart its client has not
+        noticed yet.
+        """
+        job = Job(metadata, timeout, job_id, client_id, cost, await_client)
+        job.on_finish = on_finish
+        job.wait_for = wait_for
+        with self._lock:
+            self._start()
+            self._jobs[job.id] = job
+        if wait_for is not None:
+            self._hold(job, func)
+        else:
+            self._queue.put((job, func), client_id, cost)
+        return job
+
+    def _hold(self, job, func):
+        with job._lock:
+            job.status = 'waiting'
+        job.publish()
+        threading.Thread(target=self._wait_then_queue, args=(job, func), name=f'wait_{job.id}',
+                         daemon=True).start()
+
+    def _wait_then_queue(self, job, func):
+        try:
+            cost = job.wait_for(job)
+        except TranscriptionCancelled as e:
+            print(f"Job {job.id} stopped: {e}")
+            with job._lock:
+                job.error = str(e)
+            self._finish(job, 'cancelled')
+            return
+        except Exception as e:
+            print(f"Job {job.id} failed while waiting: {str(e)}")
+            print(traceback.format_exc())
+            with job._lock:
+                job.error = f'Transcription failed: {str(e)}'
+            self._finish(job, 'failed')
+            return
+        with job._lock:
+            job.status = 'queued'
+        job.publish()
+        self._queue.put((job, func), job.client_id, job.cost if cost is None else cost)
+
+    def _work_forever(self):
+        while True:
+            entry = self._queue.take()
+            job, func = entry.item
+            try:
+                self._run(job, func)
+            except Exception as e:
+                print(f"Job worker error: {e}")
+            finally:
+                self._queue.done(entry)
+
+    def _run(self, job, func):
+        # Cancelled or expired while queued: free the slot without starting
+        if job.is_cancelled():
+            with job._lock:
+                job.error = f'Transcription {job.cancel_token.reason}'
+            self._finish(job, 'cancelled')
+            return
+
+        with job._lock:
+            job.status = 'running'
+            job.stage = 'starting'
+        job.publish()
+        try:
+            result = func(job)
+            with job._lock:
+                job.result = result
+                job.progress = 100
+            self._finish(job, 'completed')
+        except JobWaiting:
+            # The slot goes to other work until wait_for() has more for this job
+            self._hold(job, func)
+        except TranscriptionCancelled as e:
+            print(f"Job {job.id} stopped: {e}")
+            with job._lock:
+                job.error = str(e)
+            self._finish(job, 'cancelled')
+        except Exception as e:
+            print(f"Job {job.id} failed: {str(e)}")
+            print(traceback.format_exc())
+            with job._lock:
+                job.error = f'Transcription failed: {str(e)}'
+            self._finish(job, 'failed')
+
+    def _finish(self, job, status):
+        with job._lock:
+            job.status = status
+            job.stage = status
+            job.finished_at = time.time()
+        if job.on_finish is not None:
+            try:
+                job.on_finish(job)
+            except Exception as e:
+                print(f"Job {job.id} cleanup failed: {e}")
+        for hook in self._finish_hooks:
+            try:
+                hook(job)
+            except Exception as e:
+                print(f"Job {job.id} finish hook failed: {e}")
+        job.publish()
+        job._done.set()
+
+    def get(self, job_id, touch=True):
+        """Return a job by id, recording that its client is still there"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and JOB_STATE_DIR:
+            job = JobSnapshot.load(job_id)
+        if job is not None and touch:
+            job.touch()
+        return job
+
+    def cancel(self, job_id, reason='cancelled'):
+        job = self.get(job_id, touch=False)
+        if job is not None:
+            job.cancel(reason)
+        return job
+
+    def queue_status(self, client_id=None):
+        """Fair queue state for all clients, or one client's when client_id is given"""
+        if client_id is not None:
+            return self._queue.client_status(client_id)
+        return self._queue.status()
+
+    def backlog(self):
+        """Work queued and running, see FairQueue.backlog()"""
+        return self._queue.backlog()
+
+    def active_count(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status not in FINISHED_STATES)
+
+    def reap(self):
+        """Cancel abandoned jobs and forget expired ones"""
+        now = time.time()
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if JOB_STATE_DIR:
+                self._apply_markers(job)
+            if job.status in FINISHED_STATES:
+                if now - job.finished_at > JOB_RETENTION_SECONDS:
+                    with self._lock:
+                        self._jobs.pop(job.id, None)
+                    self._remove_state(job.id)
+            elif job.last_polled is not None and now - job.last_polled > JOB_ABANDON_SECONDS \
+                    and not job.is_cancelled():
+                print(f"Job {job.id} abandoned by its client, cancelling")
+                job.cancel('abandoned')
+
+    def _apply_markers(self, job):
+        """Pick up polls and cancellations other workers recorded for our job"""
+        try:
+            polled = os.path.getmtime(_state_path(job.id, 'polled'))
+        except OSError:
+            polled = None
+        # A marker left from before a restart is not a poll of this job
+        if polled is not None and polled >= job.submitted_at:
+            job.last_polled = max(job.last_polled or 0, polled)
+        cancel_path = _state_path(job.id, 'cancel')
+        if os.path.exists(cancel_path) and not job.is_cancelled():
+            with open(cancel_path, 'r', encoding='utf-8') as f:
+                job.cancel(f.read().strip() or 'cancelled')
+
+    def _remove_state(self, job_id):
+        if not JOB_STATE_DIR:
+            return
+        for suffix in ('json', 'polled', 'cancel'):
+            try:
+                os.remove(_state_path(job_id, suffix))
+            except OSError:
+                pass
+
+    def _reap_forever(self):
+        while True:
+            for hook in self._reap_hooks:
+                try:
+                    hook()
+                except Exception as e:
+                    print(f"Job reaper hook error: {e}")
+            time.sleep(5)
+            try:
+                self.reap()
+                self._queue.expire()
+            except Exception as e:
+                print(f"Job reaper error: {e}")
+
+# Shared by all requests in this process
+job_manager = JobManager()
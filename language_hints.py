@@ -0,0 +1,80 @@
+"""
+Language hint cache for ConvertAnything
+Remembers the language detected for each client and upload source so
+repeat callers skip Whisper's language-detection pass.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Only confident detections become hints
+LANGUAGE_HINT_MIN_PROBABILITY = float(os.getenv('LANGUAGE_HINT_MIN_PROBABILITY', '0.8'))
+LANGUAGE_HINT_TTL = int(os.getenv('LANGUAGE_HINT_TTL', str(24 * 3600)))  # seconds
+LANGUAGE_HINT_MAX_ENTRIES = 10000
+
+class LanguageHintCache:
+    """
+    Thread-safe LRU cache of {client or upload source: language}
+    """
+
+    def __init__(self, max_entries=LANGUAGE_HINT_MAX_ENTRIES, ttl=LANGUAGE_HINT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _keys(self, client_id, source):
+        # The upload source is more specific than the client, so check it first
+        keys = []
+        if source:
+            keys.append(('source', client_id, source))
+        if client_id:
+            keys.append(('client', client_id))
+        return keys
+
+    def get(self, client_id, source=None):
+        """Return the cached language for this caller, or None"""
+        now = time.time()
+        with self._lock:
+            for key in self._keys(client_id, source):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                language, stored_at = entry
+                if now - stored_at > self.ttl:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                return language
+        return None
+
+    def remember(self, client_id, source, language, detection):
+        """
+        Store a detected language if the detection was confident enough
+
+        Args:
+            detection (dict): The result's language_detection, None when detection
+                was skipped. A language the client sent or that came from a hint
+                says nothing new, so it neither creates nor refreshes a hint.
+        """
+        if not language or not detection or detection['probability'] < LANGUAGE_HINT_MIN_PROBABILITY:
+            return
+
+        now = time.time()
+        with self._lock:
+            for key in self._keys(client_id, source):
+                self._entries[key] = (language, now)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, client_id, source=None):
+        """Drop cached hints, e.g. when a client reports a wrong language"""
+        with self._lock:
+            for key in self._keys(client_id, source):
+                self._entries.pop(key, None)
+
+# Shared by all requests in this process
+language_hints = LanguageHintCache()
@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+"""
+Load testing and traffic replay for ConvertAnything
+Sends a mix of uploads (durations, formats, models, speaker separation) to
+/api/transcribe at a fixed concurrency and reports throughput, latency
+percentiles, error rate and server memory.
+
+`serve` runs the app with a deterministic stub in place of Whisper and
+pyannote: a request takes a fixed delay plus a per-model real-time factor
+times its duration, and returns synthetic segments. Whatever latency the
+stub does not account for is serving-layer time: Flask, multipart parsing,
+temp files, duration probing, scheduling and JSON.
+
+  python loadtest.py run --spawn --concurrency 8 --requests 200
+  python loadtest.py run --url http://localhost:5000 --mix mix.json
+  python loadtest.py trace --db ~/.cache/convertanything/transcripts.db > trace.jsonl
+  python loadtest.py run --spawn --trace trace.jsonl --speed 10
+"""
+
+import os
+import sys
+import json
+import time
+import wave
+import random
+import socket
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Transcribe Audio AI'))
+from compact_audio import compact_duration
+from scheduling import percentiles
+
+# Stub real-time factors (seconds of work per second of audio), roughly a fast GPU
+STUB_RTF = {'tiny': 0.01, 'base': 0.02, 'small': 0.05, 'medium': 0.1, 'large': 0.2}
+
+# Stub speaker separation takes this many times as long as transcription alone
+STUB_SPEAKER_FACTOR = 1.5
+
+# Synthetic segment length in seconds, and the words segments are made of
+STUB_SEGMENT_SECONDS = 5.0
+STUB_WORDS = ('the quick brown fox jumps over a lazy dog while seven sailors '
+              'sing about distant harbours and the price of fresh bread').split()
+
+# Seconds between server memory samples during a run
+RSS_SAMPLE_SECONDS = 0.5
+
+# Formats written without ffmpeg: 'wav' is the compact 16 kHz mono kind, 'wav44' CD-quality stereo
+NATIVE_FORMATS = {'wav': (16000, 1), 'wav44': (44100, 2)}
+
+def _parse_weights(value, cast=str):
+    """'base=3,small=1' -> {'base': 3.0, 'small': 1.0}; a bare name weighs 1"""
+    weights = {}
+    for part in value.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name:
+            weights[cast(name)] = float(weight or 1)
+    return weights
+
+class StubBackend:
+    """
+    Deterministic stand-in for the transcription and diarization pipelines
+
+    Args:
+        delay (float): Fixed seconds added to every request
+        rtf (dict): Seconds of work per second of audio for each model
+        speaker_factor (float): Work multiplier when speakers are separated
+    """
+
+    def __init__(self, delay=0.0, rtf=None, speaker_factor=STUB_SPEAKER_FACTOR):
+        self.delay = delay
+        self.rtf = dict(STUB_RTF, **(rtf or {}))
+        self.speaker_factor = speaker_factor
+
+    def model_seconds(self, duration, model, speaker_separation=False):
+        """Time the stub spends on a request"""
+        seconds = duration * self.rtf.get(model, self.rtf['base'])
+        if speaker_separation:
+            seconds *= self.speaker_factor
+        return self.delay + seconds
+
+    def _wait(self, seconds, cancel_token):
+        deadline = time.time() + seconds
+        while True:
+            if cancel_token is not None:
+                cancel_token.check()
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.05))
+
+    def _result(self, duration, speakers=0):
+        segments = []
+        start = 0.0
+        while start < duration:
+            end = min(duration, start + STUB_SEGMENT_SECONDS)
+            i = len(segments)
+            words = [STUB_WORDS[(i * 7 + j) % len(STUB_WORDS)] for j in range(12)]
+            segment = {
+                'id': i, 'seek': int(start * 100), 'start': start, 'end': end,
+                'text': ' ' + ' '.join(words),
+                'tokens': [50364 + (i * 13 + j) % 1000 for j in range(len(words) + 2)],
+                'temperature': 0.0, 'avg_logprob': -0.25, 'compression_ratio': 1.4, 'no_speech_prob': 0.02,
+            }
+            if speakers:
+                segment['speaker'] = f'SPEAKER_{i % speakers:02d}'
+            segments.append(segment)
+            start = end
+        return {'text': ''.join(segment['text'] for segment in segments), 'segments': segments, 'language': 'en'}
+
+    def install(self, app_module):
+        """Replace the app's model pipelines with the stub"""
+        backend = self
+
+        def file_duration(file_path):
+            duration = compact_duration(file_path)
+            if duration is None:
+                try:
+                    with wave.open(file_path, 'rb') as f:
+                        duration = f.getnframes() / f.getframerate()
+                except (wave.Error, EOFError, OSError):
+                    duration = app_module.get_file_duration(file_path)
+            return duration
+
+        def transcribe_audio(file_path, model_size='base', cancel_token=None, **kwargs):
+            duration = file_duration(file_path)
+            backend._wait(backend.model_seconds(duration, model_size), cancel_token)
+            return backend._result(duration)
+
+        def transcribe_with_speakers(file_path, model_size='base', num_speakers=2, cancel_token=None, **kwargs):
+            duration = file_duration(file_path)
+            backend._wait(backend.model_seconds(duration, model_size, True), cancel_token)
+            return backend._result(duration, speakers=num_speakers or 2)
+
+        def draft_then_refine(audio, model_size='base', on_update=None, cancel_token=None, **kwargs):
+            duration = len(audio) / 16000
+            seconds = backend.model_seconds(duration, model_size)
+            backend._wait(seconds / 2, cancel_token)
+            if on_update is not None:
+                on_update('draft', backend._result(duration), 50)
+            backend._wait(seconds / 2, cancel_token)
+            return backend._result(duration)
+
+        def label_speakers(result, audio, cancel_token=None, **kwargs):
+            duration = len(audio) / 16000
+            backend._wait(duration * backend.rtf['base'] * (backend.speaker_factor - 1), cancel_token)
+            for i, segment in enumerate(result.get('segments', [])):
+                segment['speaker'] = f'SPEAKER_{i % 2:02d}'
+            return result
+
+        app_module.transcribe_audio = transcribe_audio
+        app_module.transcribe_with_speakers = transcribe_with_speakers
+        app_module.draft_then_refine = draft_then_refine
+        app_module.label_speakers = label_speakers
+        app_module.get_model_server = lambda: None
+
+def serve(args):
+    """Run the app on a threaded server with the stub backend"""
+    import app as app_module
+    from werkzeug.serving import make_server
+
+    backend = StubBackend(args.delay, _parse_weights(args.rtf), args.speaker_factor)
+    backend.install(app_module)
+    server = make_server(args.host, args.port, app_module.app, threaded=True)
+    print(f"Stub backend serving on http://{args.host}:{args.port} (pid {os.getpid()}, "
+          f"delay {backend.delay}s, rtf {backend.rtf})", flush=True)
+    server.serve_forever()
+
+def make_audio(duration, audio_format, directory):
+    """
+    Write a test recording, converting with ffmpeg for compressed formats
+
+    Returns:
+        str: Path of the file
+    """
+    extension = 'wav' if audio_format in NATIVE_FORMATS else audio_format
+    path = os.path.join(directory, f'{duration:g}s_{audio_format}.{extension}')
+    if os.path.exists(path):
+        return path
+
+    rate, channels = NATIVE_FORMATS.get(audio_format, NATIVE_FORMATS['wav44'])
+    t = np.arange(int(duration * rate)) / rate
+    # A quiet warbling tone with some noise, the same on every run
+    noise = np.random.default_rng(int(duration * 1000)).normal(0, 0.02, len(t))
+    samples = 0.2 * np.sin(2 * np.pi * (220 + 30 * np.sin(2 * np.pi * 0.5 * t)) * t) + noise
+    pcm = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+    pcm = np.repeat(pcm[:, None], channels, axis=1)
+
+    wav_path = path if audio_format in NATIVE_FORMATS else path + '.wav'
+    with wave.open(wav_path, 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(pcm.tobytes())
+
+    if wav_path != path:
+        try:
+            subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-i', wav_path, path],
+                           check=True, capture_output=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise SystemExit(f"Could not create a {audio_format} test file with ffmpeg: {e}")
+        finally:
+            os.remove(wav_path)
+    return path
+
+def load_mix(args):
+    """
+    Requests to send: a trace file in order, or a sample of the mix
+
+    Returns:
+        list: {duration, format, model, speaker_separation, at (optional)} per request
+    """
+    if args.trace:
+        with open(args.trace, 'r', encoding='utf-8') as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        return requests[:args.requests] if args.requests else requests
+
+    if args.mix:
+        with open(args.mix, 'r', encoding='utf-8') as f:
+            mix = json.load(f)
+        mix = mix.get('requests', []) if isinstance(mix, dict) else mix
+    else:
+        # Every combination of the command-line choices, weighted by their weights
+        durations = _parse_weights(args.durations, float)
+        formats = _parse_weights(args.formats)
+        models = _parse_weights(args.models)
+        mix = [
+            {'duration': duration, 'format': audio_format, 'model': model, 'speaker_separation': speakers,
+             'weight': durations[duration] * formats[audio_format] * models[model] *
+                       (args.speakers if speakers else 1 - args.speakers)}
+            for duration in durations for audio_format in formats for model in models
+            for speakers in (False, True)
+        ]
+    mix = [entry for entry in mix if entry.get('weight', 1) > 0]
+    if not mix:
+        raise SystemExit("The request mix is empty")
+
+    rng = random.Random(args.seed)
+    return [dict(entry) for entry in rng.choices(mix, weights=[entry.get('weight', 1) for entry in mix],
+                                                 k=args.requests or 100)]
+
+def client_keys(count):
+    """API keys the simulated clients send; --spawn servers accept them, others need them in API_KEYS"""
+    return [f'loadtest-{i}' for i in range(count)]
+
+def multipart_body(path, fields):
+    boundary = f'loadtest{random.getrandbits(64):016x}'
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    with open(path, 'rb') as f:
+        audio = f.read()
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="audio"; '
+                 f'filename="{os.path.basename(path)}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode())
+    parts.append(audio)
+    parts.append(f'\r\n--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+def tree_rss_mb(pid):
+    """Resident memory of a process and its children (pre-forked workers), in MB"""
+    pids = {pid}
+    try:
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    with open(f'/proc/{entry}/stat', 'r') as f:
+                        if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                            pids.add(int(entry))
+                except (OSError, ValueError, IndexError):
+                    pass
+    except OSError:
+        return None
+    total = 0
+    for child in pids:
+        try:
+            with open(f'/proc/{child}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total / 1024 if total else None
+
+def _request(url, method, path, body=None, headers=None, timeout=600):
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    connection = connection_class(parts.hostname, parts.port, timeout=timeout)
+    try:
+        connection.request(method, parts.path.rstrip('/') + path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+def server_rss_mb(url):
+    """Resident memory the server reports in /api/metrics, in MB"""
+    try:
+        status, payload = _request(url, 'GET', '/api/metrics', timeout=5)
+        return json.loads(payload).get('process', {}).get('rss_mb') if status == 200 else None
+    except (OSError, ValueError, http.client.HTTPException):
+        return None
+
+def spawn_server(args):
+    """Start `serve` in a subprocess and wait until it answers; returns (process, url)"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    env = dict(os.environ)
+    # Measure the serving layer, not the per-client limits, unless asked to
+    env.setdefault('CLIENT_COST_RATE', '0')
+    if args.clients:
+        env['API_KEYS'] = ','.join(filter(None, [env.get('API_KEYS')] + client_keys(args.clients)))
+    command = [sys.executable, os.path.abspath(__file__), 'serve', '--host', '127.0.0.1', '--port', str(port),
+               '--delay', str(args.delay), '--speaker-factor', str(args.speaker_factor)]
+    if args.rtf:
+        command += ['--rtf', args.rtf]
+    log = open(args.server_log, 'w') if args.server_log else subprocess.DEVNULL
+    process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Stub server exited with code {process.returncode}")
+        try:
+            if _request(url, 'GET', '/api/health', timeout=2)[0] == 200:
+                return process, url
+        except OSError:
+            time.sleep(0.25)
+    process.terminate()
+    raise SystemExit("Stub server did not start within 120s")
+
+def run(args):
+    requests = load_mix(args)
+    audio_dir = args.audio_dir or tempfile.mkdtemp(prefix='convertanything_loadtest_')
+    os.makedirs(audio_dir, exist_ok=True)
+    for request in requests:
+        request['path'] = make_audio(float(request['duration']), request.get('format', 'wav'), audio_dir)
+
+    process = None
+    url = args.url.rstrip('/')
+    if args.spawn:
+        process, url = spawn_server(args)
+    # The stub's own time is known when it runs the server
+    stub = StubBackend(args.delay, _parse_weights(args.rtf), args.speaker_factor) if args.spawn or args.stub else None
+
+    def sample_rss():
+        return tree_rss_mb(process.pid) if process is not None else server_rss_mb(url)
+
+    rss = []
+    stop = threading.Event()
+
+    def sample_forever():
+        while not stop.is_set():
+            value = sample_rss()
+            if value is not None:
+                rss.append(value)
+            stop.wait(RSS_SAMPLE_SECONDS)
+
+    bodies = {}
+    lock = threading.Lock()
+    pending = list(enumerate(requests))
+    records = []
+
+    def work(worker):
+        while True:
+            with lock:
+                if not pending:
+                    return
+                index, request = pending.pop(0)
+            fields = {'model': request.get('model', 'base'),
+                      'speaker_separation': str(bool(request.get('speaker_separation'))).lower()}
+            key = (request['path'], tuple(sorted(fields.items())))
+            with lock:
+                if key not in bodies:
+                    bodies[key] = multipart_body(request['path'], fields)
+                body, content_type = bodies[key]
+
+            if args.speed and request.get('at') is not None:
+                time.sleep(max(0.0, started + request['at'] / args.speed - time.time()))
+            headers = {'Content-Type': content_type}
+            if args.clients:
+                headers['X-API-Key'] = client_keys(args.clients)[index % args.clients]
+            sent = time.time()
+            try:
+                status, payload = _request(url, 'POST', '/api/transcribe', body, headers)
+                error = None if status == 200 else json.loads(payload or b'{}').get('error', '')[:200]
+            except (OSError, ValueError, http.client.HTTPException) as e:
+                status, payload, error = None, b'', str(e)
+            latency = time.time() - sent
+            record = {
+                'index': index, 'worker': worker, 'sent': round(sent - started, 3), 'latency': round(latency, 4),
+                'status': status, 'error': error, 'bytes_out': len(body), 'bytes_in': len(payload),
+                'duration': float(request['duration']), 'format': request.get('format', 'wav'),
+                'model': fields['model'], 'speaker_separation': fields['speaker_separation'] == 'true',
+            }
+            if stub is not None:
+                model_seconds = stub.model_seconds(record['duration'], record['model'], record['speaker_separation'])
+                record['overhead'] = round(latency - model_seconds, 4)
+            with lock:
+                records.append(record)
+
+    try:
+        rss_start = sample_rss()
+        sampler = threading.Thread(target=sample_forever, daemon=True)
+        sampler.start()
+        started = time.time()
+        workers = [threading.Thread(target=work, args=(i,)) for i in range(args.concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.time() - started
+        stop.set()
+        sampler.join()
+        rss_end = sample_rss()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    report = summarize(records, elapsed, rss_start, rss, rss_end)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(dict(report, requests=sorted(records, key=lambda record: record['index'])), f, indent=2)
+        print(f"\nFull report written to {args.json}")
+    return report
+
+def _latency_stats(records, key='latency'):
+    values = [record[key] for record in records if record.get(key) is not None]
+    stats = percentiles(values)
+    stats['mean'] = round(sum(values) / len(values), 4) if values else None
+    stats['max'] = round(max(values), 4) if values else None
+    return stats
+
+def summarize(records, elapsed, rss_start, rss, rss_end):
+    ok = [record for record in records if record['status'] == 200]
+    errors = {}
+    for record in records:
+        if record['status'] != 200:
+            errors[str(record['status'] or 'connection')] = errors.get(str(record['status'] or 'connection'), 0) + 1
+    report = {
+        'requests': len(records),
+        'ok': len(ok),
+        'errors': errors,
+        'error_rate': round(1 - len(ok) / len(records), 4) if records else 0,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(len(ok) / elapsed, 3) if elapsed else None,
+        'audio_seconds_per_second': round(sum(record['duration'] for record in ok) / elapsed, 2) if elapsed else None,
+        'latency': _latency_stats(ok),
+        'overhead': _latency_stats(ok, 'overhead') if any('overhead' in record for record in ok) else None,
+        'by_model': {},
+        'rss_mb': {
+            'start': round(rss_start, 1) if rss_start else None,
+            'peak': round(max(rss), 1) if rss else None,
+            'end': round(rss_end, 1) if rss_end else None,
+        },
+    }
+    for model in sorted({record['model'] for record in ok}):
+        matching = [record for record in ok if record['model'] == model]
+        report['by_model'][model] = dict(_latency_stats(matching), count=len(matching))
+    return report
+
+def print_report(report):
+    def line(stats):
+        return '  '.join(f"{name} {stats[name]:.3f}" if stats[name] is not None else f"{name} -"
+                         for name in ('p50', 'p95', 'p99', 'max'))
+
+    errors = ', '.join(f"{status}x{count}" for status, count in sorted(report['errors'].items()))
+    print(f"Requests:    {report['requests']} ({report['ok']} ok{', errors ' + errors if errors else ''})"
+          f"  error rate {report['error_rate'] * 100:.1f}%")
+    print(f"Elapsed:     {report['elapsed_seconds']:.1f}s  throughput {report['throughput_rps']} req/s, "
+          f"{report['audio_seconds_per_second']} audio s/s")
+    print(f"Latency:     {line(report['latency'])}")
+    if report['overhead']:
+        print(f"Overhead:    {line(report['overhead'])}  (latency minus stub model time)")
+    for model, stats in report['by_model'].items():
+        print(f"  {model:<10} n={stats['count']:<5} {line(stats)}")
+    rss = report['rss_mb']
+    print(f"Server RSS:  start {rss['start']} MB  peak {rss['peak']} MB  end {rss['end']} MB")
+
+def export_trace(args):
+    """Print a replayable trace of the transcriptions recorded in a transcript store"""
+    connection = sqlite3.connect(args.db)
+    rows = connection.execute(
+        "SELECT t.filename, t.duration, t.model, t.created_at, "
+        # Separated transcripts carry diarization labels instead of the default one
+        "EXISTS (SELECT 1 FROM segments s WHERE s.transcript_id = t.id "
+        "        AND s.speaker IS NOT NULL AND s.speaker != 'Speaker 1') "
+        "FROM transcripts t WHERE t.duration IS NOT NULL ORDER BY t.created_at"
+    ).fetchall()
+    first = None
+    for filename, duration, model, created_at, speakers in rows:
+        try:
+            moment = time.mktime(time.strptime(created_at[:19], '%Y-%m-%dT%H:%M:%S'))
+        except (TypeError, ValueError):
+            moment = None
+        first = first if first is not None or moment is None else moment
+        extension = os.path.splitext(filename or '')[1].lstrip('.').lower() or 'wav'
+        print(json.dumps({
+            'at': round(moment - first, 3) if moment is not None else None,
+            'duration': round(duration, 3),
+            'format': extension,
+            'model': model or 'base',
+            'speaker_separation': bool(speakers),
+        }))
+
+def main():
+    parser = argparse.ArgumentParser(description="ConvertAnything load testing")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def stub_options(command):
+        command.add_argument("--delay", type=float, default=0.0, help="Stub seconds added to every request")
+        command.add_argument("--rtf", default='', help="Stub real-time factors, e.g. base=0.02,small=0.05")
+        command.add_argument("--speaker-factor", type=float, default=STUB_SPEAKER_FACTOR,
+                             help="Stub work multiplier with speaker separation")
+
+    serve_parser = subparsers.add_parser('serve', help="Run the app with the stub backend")
+    serve_parser.add_argument("--host", default='127.0.0.1')
+    serve_parser.add_argument("--port", type=int, default=5000)
+    stub_options(serve_parser)
+
+    run_parser = subparsers.add_parser('run', help="Send a request mix and report")
+    run_parser.add_argument("--url", default='http://localhost:5000', help="Server to test")
+    run_parser.add_argument("--spawn", action='store_true', help="Start a stub server for the run and sample its memory")
+    run_parser.add_argument("--stub", action='store_true', help="--url runs `serve` with these stub options")
+    run_parser.add_argument("--concurrency", "-c", type=int, default=4)
+    run_parser.add_argument("--requests", "-n", type=int, default=0, help="Requests to send (default: 100, or the whole trace)")
+    run_parser.add_argument("--mix", help="JSON list of {duration, format, model, speaker_separation, weight}")
+    run_parser.add_argument("--trace", help="JSON lines of requests to replay in order, see `trace`")
+    run_parser.add_argument("--speed", type=float, default=0,
+                            help="Replay trace arrival times this many times faster (default: as fast as possible)")
+    run_parser.add_argument("--durations", default='10,30,120', help="Audio seconds, optionally weighted: 10=3,120=1")
+    run_parser.add_argument("--formats", default='wav', help=f"Formats ({', '.join(NATIVE_FORMATS)} or any ffmpeg can write)")
+    run_parser.add_argument("--models", default='base', help="Models, optionally weighted: base=3,small=1")
+    run_parser.add_argument("--speakers", type=float, default=0.0, help="Share of requests with speaker separation")
+    run_parser.add_argument("--clients", type=int, default=0, help="Spread requests over this many API keys")
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--audio-dir", help="Where test recordings are generated and reused")
+    run_parser.add_argument("--server-log", help="With --spawn, write the server's output here")
+    run_parser.add_argument("--json", help="Write the report and every request's timing to this file")
+    stub_options(run_parser)
+
+    trace_parser = subparsers.add_parser('trace', help="Export a replayable trace from a transcript store")
+    trace_parser.add_argument("--db", required=True, help="Transcript store (TRANSCRIPT_DB)")
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        serve(args)
+    elif args.command == 'run':
+        run(args)
+    else:
+        export_trace(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+"""
+Whisper model catalog for ConvertAnything
+The models clients can ask for, shared by the Flask app and the serverless
+handlers in api/. Standard library only, so serverless cold starts stay short.
+"""
+
+WHISPER_MODELS = [
+    {'id': 'tiny', 'name': 'Tiny', 'description': 'Fastest, lower accuracy (~39 MB)'},
+    {'id': 'base', 'name': 'Base', 'description': 'Recommended balance (~74 MB)'},
+    {'id': 'small', 'name': 'Small', 'description': 'Better accuracy (~244 MB)'},
+    {'id': 'medium', 'name': 'Medium', 'description': 'High accuracy (~769 MB)'},
+    {'id': 'large', 'name': 'Large', 'description': 'Best accuracy (~1550 MB)'}
+]
+MODEL_IDS = [model['id'] for model in WHISPER_MODELS]
+
+DEFAULT_MODEL = 'base'
+
+# Lets the server pick the model from the audio and its current load, see model_selection.py
+AUTO_MODEL = 'auto'
+AUTO_MODEL_INFO = {'id': AUTO_MODEL, 'name': 'Auto',
+                   'description': 'Largest model expected to finish within target_latency'}
+MODEL_CHOICES = MODEL_IDS + [AUTO_MODEL]
@@ -0,0 +1,111 @@
+"""
+Automatic model choice for ConvertAnything
+With model=auto the server picks the largest Whisper model expected to
+finish within the client's target latency. The prediction combines the
+audio's duration, the real-time factors measured on this host, and the work
+already queued and running ahead of the request.
+"""
+
+import os
+
+from model_catalog import MODEL_IDS, DEFAULT_MODEL
+from scheduling import MODEL_COST, SPEAKER_COST_FACTOR
+from performance import get_rtf_table
+
+# Latency target in seconds when the client does not send target_latency
+AUTO_TARGET_LATENCY = float(os.getenv('AUTO_TARGET_LATENCY', '60'))
+
+# Seconds to load each model's weights when it is not cached in this process
+MODEL_LOAD_SECONDS = {'tiny': 1, 'base': 2, 'small': 5, 'medium': 12, 'large': 25}
+
+def model_rtfs(decode_profile):
+    """
+    Real-time factor of every model for a decoding profile
+
+    Models not measured with the profile use a measurement from another
+    profile, then the nearest measured model scaled by the models' relative
+    cost; both count as estimates. Empty when nothing has been measured on
+    this host yet.
+
+    Returns:
+        dict: {model: (rtf, measured with this profile)}
+    """
+    table = get_rtf_table()
+    own = table.get(decode_profile, {})
+    measured = dict(own)
+    for profile, models in table.items():
+        for model, rtf in models.items():
+            measured.setdefault(model, rtf)
+    measured = {model: rtf for model, rtf in measured.items() if model in MODEL_IDS and rtf}
+    if not measured:
+        return {}
+
+    rtfs = {}
+    for model in MODEL_IDS:
+        if model in measured:
+            rtfs[model] = (measured[model], bool(own.get(model)))
+        else:
+            nearest = min(measured, key=lambda known: abs(MODEL_IDS.index(known) - MODEL_IDS.index(model)))
+            rtfs[model] = (measured[nearest] * MODEL_COST[model] / MODEL_COST[nearest], False)
+    return rtfs
+
+def predicted_queue_wait(backlog, base_rtf):
+    """
+    Seconds a new job is expected to wait for a worker
+
+    Args:
+        backlog (dict): Work ahead, from JobManager.backlog()
+        base_rtf (float): Real-time factor of the base model, which cost units are measured in
+    """
+    if not backlog['queued'] and backlog['running'] < backlog['workers']:
+        return 0.0
+    # Running jobs are on average half done
+    cost_ahead = backlog['queued_cost'] + backlog['running_cost'] / 2
+    return cost_ahead * base_rtf / MODEL_COST['base'] / backlog['workers']
+
+def select_model(duration, speaker_separation, decode_profile, target_latency, backlog, loaded=()):
+    """
+    Pick the largest model predicted to finish within the target latency
+
+    Args:
+        duration (float): Seconds of audio
+        speaker_separation (bool): Whether speakers are identified too
+        decode_profile (str): Decoding profile the request uses
+        target_latency (float): Seconds the client wants the result within, None for the default
+        backlog (dict): Work ahead, from JobManager.backlog()
+        loaded (list): Models already loaded, which start without a load delay
+
+    Returns:
+        tuple: (model, details reported in the response metadata)
+    """
+    target = target_latency or AUTO_TARGET_LATENCY
+    details = {'target_latency': target, 'duration': round(duration, 1)}
+
+    rtfs = model_rtfs(decode_profile)
+    if not rtfs:
+        details['reason'] = 'no real-time factors measured on this host yet'
+        return DEFAULT_MODEL, details
+
+    queue_wait = predicted_queue_wait(backlog, rtfs['base'][0])
+    factor = SPEAKER_COST_FACTOR if speaker_separation else 1.0
+    predictions = {
+        model: queue_wait + duration * rtf * factor + (0 if model in loaded else MODEL_LOAD_SECONDS[model])
+        for model, (rtf, _) in rtfs.items()
+    }
+
+    fitting = [model for model in MODEL_IDS if predictions[model] <= target]
+    if fitting:
+        model = max(fitting, key=MODEL_IDS.index)
+        details['reason'] = 'largest model predicted to meet the target'
+    else:
+        model = min(predictions, key=predictions.get)
+        details['reason'] = 'no model meets the target; using the fastest'
+
+    details.update({
+        'queue_wait': round(queue_wait, 2),
+        'predicted_latency': round(predictions[model], 2),
+        'rtf': round(rtfs[model][0], 4),
+        'rtf_measured': rtfs[model][1],
+        'predictions': {name: round(seconds, 2) for name, seconds in predictions.items()},
+    })
+    return model, details
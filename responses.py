@@ -0,0 +1,196 @@
+"""
+Fast, compressed JSON responses for ConvertAnything
+Transcription responses carry every Whisper segment and can run to several
+MB for long recordings. They are serialized with orjson (or ujson) when
+installed, sent without the segments' token ids unless `tokens=true` is
+asked for, and compressed with the best encoding the client accepts. With
+`Accept: application/x-ndjson` (or `format=ndjson`) a response is streamed
+as one JSON object per line instead: the response without its segments
+first, then one line per segment.
+"""
+
+import os
+import json
+import zlib
+
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bodies smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+
+# Levels that favour speed; transcripts compress well even at low settings
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+# NDJSON lines are compressed and sent in batches of about this many bytes
+NDJSON_FLUSH_BYTES = 64 * 1024
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def _default(value):
+    # numpy scalars and arrays from the models
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(value):
+    """Serialize to compact UTF-8 JSON with the fastest encoder available"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    if ujson is not None:
+        try:
+            return ujson.dumps(value, ensure_ascii=False).encode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+def without_tokens(value):
+    """Copy of a response with the token ids dropped from every segment list in it"""
+    if not isinstance(value, dict):
+        return value
+    copy = {}
+    for key, item in value.items():
+        if key == 'segments' and isinstance(item, list):
+            copy[key] = [{k: v for k, v in segment.items() if k != 'tokens'} if isinstance(segment, dict)
+                         else segment for segment in item]
+        else:
+            copy[key] = without_tokens(item)
+    return copy
+
+def _split_segments(value):
+    """Return (value without its segment list, the segment list) for the first segment list found"""
+    if not isinstance(value, dict):
+        return value, None
+    for key, item in value.items():
+        if key == 'segments' and isinstance(item, list):
+            return {k: v for k, v in value.items() if k != 'segments'}, item
+        if isinstance(item, dict):
+            header, segments = _split_segments(item)
+            if segments is not None:
+                return dict(value, **{key: header}), segments
+    return value, None
+
+def negotiate_encoding(accept_encoding):
+    """
+    Pick the response encoding from an Accept-Encoding header
+
+    Returns:
+        str: 'zstd', 'br' or 'gzip', or None to send the body as it is
+    """
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    # Faster to compress (zstd) or smaller (br) first, plain gzip as the fallback
+    available = [('zstd', zstandard), ('br', brotli), ('gzip', zlib)]
+    candidates = [name for name, module in available
+                  if module is not None and accepted.get(name, accepted.get('*', 0)) > 0]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda name: accepted.get(name, accepted.get('*', 0)))
+
+def compress(data, encoding):
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return zlib.compress(data, GZIP_LEVEL, wbits=31)
+
+def _stream_compressor(encoding):
+    """(compress and flush a chunk, finish) functions for a streamed body"""
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        return (lambda data: compressor.compress(data) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+                compressor.flush)
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return lambda data: compressor.process(data) + compressor.flush(), compressor.finish
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return lambda data: compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+def wants_tokens():
+    return request.args.get('tokens', '').lower() in ('1', 'true', 'yes')
+
+def wants_ndjson():
+    if request.args.get('format', '').lower() == 'ndjson':
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+def json_response(body, status=200):
+    """JSON response, compressed when the client accepts it and the body is large enough"""
+    data = dumps(body)
+    response = Response(data, status=status, mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    if len(data) >= COMPRESS_MIN_BYTES:
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is not None:
+            response.set_data(compress(data, encoding))
+            response.headers['Content-Encoding'] = encoding
+    return response
+
+def ndjson_response(body, status=200):
+    """Stream a response as its header line followed by one line per segment"""
+    header, segments = _split_segments(body)
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+
+    def generate():
+        write, finish = _stream_compressor(encoding) if encoding else (lambda data: data, lambda: b'')
+        buffer = [dumps(header), b'\n']
+        size = 0
+        for segment in segments or []:
+            line = dumps(segment)
+            buffer.append(line)
+            buffer.append(b'\n')
+            size += len(line) + 1
+            if size >= NDJSON_FLUSH_BYTES:
+                yield write(b''.join(buffer))
+                buffer = []
+                size = 0
+        yield write(b''.join(buffer)) + finish()
+
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(generate(), status=status, mimetype=NDJSON_MIMETYPE, headers=headers)
+
+def transcript_response(body, status=200):
+    """
+    Send a response holding a transcript the way the client asked for it
+
+    Token ids are left out unless the query string has tokens=true; NDJSON
+    is streamed for `Accept: application/x-ndjson` or format=ndjson.
+    """
+    if not wants_tokens():
+        body = without_tokens(body)
+    if wants_ndjson():
+        return ndjson_response(body, status)
+    return json_response(body, status)
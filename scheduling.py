@@ -0,0 +1,346 @@
+"""
+Fair scheduling of transcription work for ConvertAnything
+Work is measured in cost units: seconds of audio times the relative cost of
+the model that transcribes it (base = 1). Each client (a configured API key,
+else remote address) draws its requests from a token bucket of cost units, and queued
+jobs are started by weighted fair queueing across clients, so one client's
+batch cannot hold back everyone else's short requests. Small jobs go
+shortest first, and a worker is kept free for them.
+"""
+
+import os
+import hmac
+import math
+import time
+import hashlib
+import threading
+from collections import deque
+
+from performance import record_metric
+
+# Relative cost of one second of audio for each Whisper model on CPU
+MODEL_COST = {'tiny': 0.4, 'base': 1.0, 'small': 2.5, 'medium': 6.0, 'large': 12.0}
+
+# Extra cost of speaker separation (pyannote runs next to the transcription)
+SPEAKER_COST_FACTOR = 1.5
+
+# Cost units a client earns per second and the most it can save up; a rate of 0 disables limits
+CLIENT_COST_RATE = float(os.getenv('CLIENT_COST_RATE', '4'))
+CLIENT_COST_BURST = float(os.getenv('CLIENT_COST_BURST', '14400'))
+
+def _parse_weights(value):
+    weights = {}
+    for part in value.split(','):
+        client_id, _, weight = part.strip().rpartition('=')
+        if client_id:
+            try:
+                weights[client_id] = max(float(weight), 0.01)
+            except ValueError:
+                print(f"Warning: Ignoring bad client weight: {part}")
+    return weights
+
+# Share of the workers and of the cost budget per client, "key=2,other-key=0.5"; others get 1
+CLIENT_WEIGHTS = _parse_weights(os.getenv('CLIENT_WEIGHTS', ''))
+
+# API keys accepted as client identities, "key1,key2" (keys in CLIENT_WEIGHTS count too).
+# Any other key is ignored, so a caller cannot get a fresh budget by inventing keys.
+API_KEYS = [key.strip() for key in os.getenv('API_KEYS', '').split(',') if key.strip()] + list(CLIENT_WEIGHTS)
+
+# Jobs up to this cost are small: they run shortest first and may use the reserved workers
+SMALL_JOB_COST = float(os.getenv('SMALL_JOB_COST', '300'))
+
+# Workers only small jobs may use, so interactive requests never wait behind a batch
+SMALL_JOB_WORKERS = int(os.getenv('SMALL_JOB_WORKERS', '1'))
+
+# Queue waits kept per client for percentiles, and how long an idle client's state is kept
+QUEUE_WAIT_SAMPLES = 1000
+CLIENT_IDLE_SECONDS = 3600
+
+class RateLimited(Exception):
+    """Raised when a client has used up its cost budget for now"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def known_api_key(key):
+    """Whether an X-API-Key value is one of the configured API_KEYS"""
+    key = key.encode('utf-8')
+    return any(hmac.compare_digest(key, known.encode('utf-8')) for known in API_KEYS)
+
+def client_weight(client_id):
+    return CLIENT_WEIGHTS.get(client_id, 1.0)
+
+def client_label(client_id):
+    """Name a client in shared status output without revealing its API key"""
+    return hashlib.sha256(str(client_id).encode('utf-8')).hexdigest()[:12]
+
+def job_cost(duration, model, speaker_separation=False):
+    """
+    Cost units of transcribing audio
+
+    Args:
+        duration (float): Seconds of audio
+        model (str): Whisper model size
+        speaker_separation (bool): Whether speakers are identified too
+
+    Returns:
+        float: Cost, at least 1 so even empty requests count
+    """
+    cost = (duration or 0) * MODEL_COST.get(model, 1.0)
+    if speaker_separation:
+        cost *= SPEAKER_COST_FACTOR
+    return max(cost, 1.0)
+
+def percentiles(values, points=(50, 95, 99)):
+    """{'p50': ..., ...} of a list of numbers (None for an empty list)"""
+    values = sorted(values)
+    result = {}
+    for point in points:
+        if values:
+            result[f'p{point}'] = round(values[min(len(values) - 1, int(round(point / 100 * (len(values) - 1))))], 3)
+        else:
+            result[f'p{point}'] = None
+    return result
+
+class CostLimiter:
+    """
+    Token buckets of cost units, one per client
+
+    A request needs its cost in the bucket, or a full bucket if it costs more
+    than the bucket holds; the bucket then goes into debt for the rest.
+
+    Args:
+        rate (float): Cost units earned per second at weight 1
+        burst (float): Bucket size at weight 1
+    """
+
+    def __init__(self, rate=CLIENT_COST_RATE, burst=CLIENT_COST_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def _refill(self, client_id, now):
+        weight = client_weight(client_id)
+        tokens, updated = self._buckets.get(client_id, (self.burst * weight, now))
+        tokens = min(self.burst * weight, tokens + (now - updated) * self.rate * weight)
+        return tokens, weight
+
+    def charge(self, client_id, cost):
+        """
+        Take a request's cost from its client's bucket
+
+        Raises:
+            RateLimited: If the bucket does not hold enough yet, with the seconds to wait
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            tokens, weight = self._refill(client_id, now)
+            needed = min(cost, self.burst * weight)
+            if tokens < needed:
+                retry_after = math.ceil((needed - tokens) / (self.rate * weight))
+                raise RateLimited(
+                    f'Rate limit reached: this request costs {cost:.0f} units and '
+                    f'{max(tokens, 0):.0f} are available; retry in {retry_after}s',
+                    retry_after
+                )
+            self._buckets[client_id] = (tokens - cost, now)
+
+    def tokens(self, client_id):
+        """Cost units a client could spend right now (None when limits are disabled)"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            return round(self._refill(client_id, time.time())[0], 1)
+
+    def expire(self):
+        """Forget buckets that have filled up again"""
+        now = time.time()
+        with self._lock:
+            for client_id in list(self._buckets):
+                tokens, weight = self._refill(client_id, now)
+                if tokens >= self.burst * weight:
+                    del self._buckets[client_id]
+
+class QueueEntry:
+    """One queued item with the client and cost it is scheduled by"""
+
+    def __init__(self, item, client_id, cost, sequence):
+        self.item = item
+        self.client_id = client_id
+        self.cost = cost
+        self.small = cost <= SMALL_JOB_COST
+        self.sequence = sequence
+        self.queued_at = time.time()
+        self.wait = None
+
+class _ClientQueue:
+    def __init__(self, client_id):
+        self.weight = client_weight(client_id)
+        self.entries = []
+        self.running = 0
+        self.started = 0
+        self.finish = 0.0
+        self.waits = deque(maxlen=QUEUE_WAIT_SAMPLES)
+        self.last_active = time.time()
+
+    def candidate(self, large_allowed):
+        """The entry this client would start next: its smallest small job, else its oldest job"""
+        small = [entry for entry in self.entries if entry.small]
+        if small:
+            return min(small, key=lambda entry: (entry.cost, entry.sequence))
+        if large_allowed and self.entries:
+            return self.entries[0]
+        return None
+
+class FairQueue:
+    """
+    Weighted fair queue of work shared by a fixed number of workers
+
+    Each client has a virtual finish time that grows by cost / weight with
+    every job it starts. The next job is the one that would finish first in
+    virtual time, so a client with a long backlog falls behind newcomers
+    instead of making them wait, and short jobs win ties. Large jobs are kept
+    off the last SMALL_JOB_WORKERS workers.
+
+    Args:
+        workers (int): Number of workers taking entries
+        reserved (int): Workers kept for small jobs
+    """
+
+    def __init__(self, workers, reserved=SMALL_JOB_WORKERS):
+        self.workers = workers
+        # At least one worker always takes large jobs
+        self.reserved = max(0, min(reserved, workers - 1))
+        self._clients = {}
+        self._virtual_time = 0.0
+        self._sequence = 0
+        self._running_large = 0
+        self._running_cost = 0.0
+        self._cond = threading.Condition()
+
+    def _client(self, client_id):
+        client = self._clients.get(client_id)
+        if client is None:
+            client = self._clients[client_id] = _ClientQueue(client_id)
+        return client
+
+    def put(self, item, client_id, cost):
+        """Queue an item for a client; returns its QueueEntry"""
+        with self._cond:
+            self._sequence += 1
+            entry = QueueEntry(item, client_id, cost, self._sequence)
+            client = self._client(client_id)
+            client.entries.append(entry)
+            client.last_active = entry.queued_at
+            self._cond.notify()
+        return entry
+
+    def _select(self):
+        large_allowed = self._running_large < self.workers - self.reserved
+        best = None
+        for client in self._clients.values():
+            entry = client.candidate(large_allowed)
+            if entry is None:
+                continue
+            start = max(self._virtual_time, client.finish)
+            key = (start + entry.cost / client.weight, entry.sequence)
+            if best is None or key < best[0]:
+                best = (key, start, client, entry)
+        return best
+
+    def take(self):
+        """Block until an entry may start, then return it; call done() when it ends"""
+        with self._cond:
+            while True:
+                best = self._select()
+                if best is not None:
+                    break
+                self._cond.wait()
+
+            (finish, _), start, client, entry = best
+            client.entries.remove(entry)
+            client.finish = finish
+            client.running += 1
+            client.started += 1
+            self._virtual_time = start
+            self._running_cost += entry.cost
+            if not entry.small:
+                self._running_large += 1
+
+            entry.wait = time.time() - entry.queued_at
+            client.waits.append(entry.wait)
+            client.last_active = time.time()
+        record_metric('queue_wait_seconds', entry.wait)
+        return entry
+
+    def done(self, entry):
+        with self._cond:
+            client = self._client(entry.client_id)
+            client.running -= 1
+            client.last_active = time.time()
+            self._running_cost -= entry.cost
+            if not entry.small:
+                self._running_large -= 1
+            # A freed large slot may let a waiting worker take a large job
+            self._cond.notify_all()
+
+    def expire(self):
+        """Forget clients with nothing queued or running for CLIENT_IDLE_SECONDS"""
+        cutoff = time.time() - CLIENT_IDLE_SECONDS
+        with self._cond:
+            for client_id, client in list(self._clients.items()):
+                if not client.entries and not client.running and client.last_active < cutoff:
+                    del self._clients[client_id]
+
+    def backlog(self):
+        """Jobs and cost units queued and running, for predicting how long new work waits"""
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'queued': sum(len(client.entries) for client in self._clients.values()),
+                'queued_cost': sum(entry.cost for client in self._clients.values() for entry in client.entries),
+                'running': sum(client.running for client in self._clients.values()),
+                'running_cost': self._running_cost,
+            }
+
+    def _client_status(self, client):
+        now = time.time()
+        return {
+            'weight': client.weight,
+            'queued': len(client.entries),
+            'queued_cost': round(sum(entry.cost for entry in client.entries), 1),
+            'oldest_wait': round(now - min(entry.queued_at for entry in client.entries), 3)
+                           if client.entries else None,
+            'running': client.running,
+            'started': client.started,
+            'queue_wait': percentiles(client.waits),
+        }
+
+    def client_status(self, client_id):
+        """Queue state and wait percentiles of one client (None if it has no history)"""
+        with self._cond:
+            client = self._clients.get(client_id)
+            return self._client_status(client) if client is not None else None
+
+    def status(self):
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'small_job_workers': self.reserved,
+                'small_job_cost': SMALL_JOB_COST,
+                'queued': sum(len(client.entries) for client in self._clients.values()),
+                'running': sum(client.running for client in self._clients.values()),
+                'clients': {client_label(client_id): self._client_status(client)
+                            for client_id, client in self._clients.items()},
+            }
+
+# Shared by all requests in this process
+cost_limiter = CostLimiter()
@@ -6,6 +6,20 @@ class AudioTranscriber {
         this.currentFile = null;
         this.transcriptionResult = null;
         this.isProcessing = false;
+        this.currentJobId = null;
+        // Finished job whose exports the server can render
+        this.exportJobId = null;
+        this.serverExportFormats = ['txt', 'srt', 'vtt', 'json', 'pdf'];
+        // Files above this size are sent in parts that upload in parallel and retry one by one
+        this.chunkedUploadThreshold = 8 * 1024 * 1024;
+        this.uploadConcurrency = 4;
+        this.uploadAttempts = 3;
+        // File sent in place of currentFile, when the browser could shrink it
+        this.uploadFile = null;
+        // The server wants 16 kHz mono; sending just that skips its decode step.
+        // Already compressed audio is usually smaller as it is.
+        this.compactSampleRate = 16000;
+        this.compactExtensions = ['wav', 'flac', 'mp4', 'avi', 'mov'];
         
         this.initializeElements();
         this.bindEvents();
@@ -69,6 +83,9 @@ class AudioTranscriber {
             btn.addEventListener('click', () => this.exportTranscript(btn.dataset.format));
         });
         this.newTranscriptionBtn.addEventListener('click', this.resetApp.bind(this));
+        
+        // Let the server stop work nobody is waiting for
+        window.addEventListener('pagehide', () => this.cancelCurrentJob());
     }
 
     initializeApp() {
@@ -287,13 +304,277 @@ class AudioTranscriber {
         }
     }
 
-    async runTranscription() {
+    buildFormData(timeoutSeconds) {
         // Create form data for API request
         const formData = new FormData();
-        formData.append('audio', this.currentFile);
+        formData.append('audio', this.uploadFile);
+        this.appendOptions(formData, timeoutSeconds);
+        return formData;
+    }
+
+    appendOptions(formData, timeoutSeconds) {
         formData.append('model', this.modelSelect.value);
         formData.append('speaker_separation', this.speakerToggle.checked);
         formData.append('speaker_count', this.speakerCount.value);
+        // Server stops working on the request after this deadline
+        formData.append('timeout', timeoutSeconds);
+    }
+
+    async runTranscription() {
+        this.exportJobId = null;
+        this.updateProgress(1, 'Preparing audio...');
+        this.uploadFile = await this.compactAudio(this.currentFile);
+
+        if (this.uploadFile.size > this.chunkedUploadThreshold && await this.runChunkedUpload()) {
+            return;
+        }
+
+        // Prefer the job API: it returns a quick draft and refines it in place
+        const formData = this.buildFormData(30 * 60);
+        formData.append('draft', this.modelSelect.value !== 'tiny');
+
+        this.updateProgress(5, 'Uploading file to server...');
+        const response = await fetch(`${this.apiUrl}/jobs`, {
+            method: 'POST',
+            body: formData
+        });
+
+        // Backends without job support (e.g. serverless) use the direct endpoint
+        if (response.status === 404 || response.status === 405) {
+            return this.runDirectTranscription();
+        }
+
+        const data = await response.json().catch(() => ({}));
+        if (!response.ok || !data.success) {
+            throw new Error(data.error || response.statusText || 'Transcription service unavailable');
+        }
+
+        this.currentJobId = data.job_id;
+        try {
+            await this.pollJob(data.job_id);
+        } finally {
+            this.currentJobId = null;
+        }
+    }
+
+    async compactAudio(file) {
+        // Downmix and resample to 16 kHz mono 16-bit WAV in the browser when that
+        // makes the upload smaller; otherwise, or if the browser can't decode it, send the original
+        const extension = file.name.split('.').pop().toLowerCase();
+        const OfflineContext = window.OfflineAudioContext || window.webkitOfflineAudioContext;
+        if (!OfflineContext || !this.compactExtensions.includes(extension)) {
+            return file;
+        }
+
+        try {
+            const decoder = new OfflineContext(1, 1, this.compactSampleRate);
+            const decoded = await decoder.decodeAudioData(await file.arrayBuffer());
+            const length = Math.ceil(decoded.duration * this.compactSampleRate);
+            if (44 + length * 2 >= file.size) {
+                return file;
+            }
+
+            // Rendering into one channel at 16 kHz does both the downmix and the resample
+            const context = new OfflineContext(1, length, this.compactSampleRate);
+            const source = context.createBufferSource();
+            source.buffer = decoded;
+            source.connect(context.destination);
+            source.start();
+            const samples = (await context.startRendering()).getChannelData(0);
+
+            const wav = new DataView(new ArrayBuffer(44 + samples.length * 2));
+            const writeText = (offset, text) => [...text].forEach((c, i) => wav.setUint8(offset + i, c.charCodeAt(0)));
+            writeText(0, 'RIFF');
+            wav.setUint32(4, 36 + samples.length * 2, true);
+            writeText(8, 'WAVE');
+            writeText(12, 'fmt ');
+            wav.setUint32(16, 16, true);
+            wav.setUint16(20, 1, true);
+            wav.setUint16(22, 1, true);
+            wav.setUint32(24, this.compactSampleRate, true);
+            wav.setUint32(28, this.compactSampleRate * 2, true);
+            wav.setUint16(32, 2, true);
+            wav.setUint16(34, 16, true);
+            writeText(36, 'data');
+            wav.setUint32(40, samples.length * 2, true);
+            for (let i = 0; i < samples.length; i++) {
+                const sample = Math.max(-1, Math.min(1, samples[i]));
+                wav.setInt16(44 + i * 2, sample < 0 ? sample * 0x8000 : sample * 0x7FFF, true);
+            }
+
+            const name = file.name.replace(/\.[^/.]+$/, '') + '.wav';
+            console.log(`Compacted ${file.name}: ${this.formatFileSize(file.size)} -> ${this.formatFileSize(wav.byteLength)}`);
+            return new File([wav.buffer], name, { type: 'audio/wav' });
+        } catch (error) {
+            console.warn('Sending the original file, it could not be compacted:', error);
+            return file;
+        }
+    }
+
+    async runChunkedUpload() {
+        // A dropped connection only costs the parts in flight, and the server
+        // starts transcribing the beginning while the rest is still uploading
+        const formData = new FormData();
+        formData.append('filename', this.uploadFile.name);
+        formData.append('size', this.uploadFile.size);
+        this.appendOptions(formData, 30 * 60);
+
+        this.updateProgress(2, 'Starting upload...');
+        const response = await fetch(`${this.apiUrl}/uploads`, {
+            method: 'POST',
+            body: formData
+        });
+
+        // Backends without chunked uploads take the whole file in one request
+        if (response.status === 404 || response.status === 405) {
+            return false;
+        }
+
+        const upload = await response.json().catch(() => ({}));
+        if (!response.ok || !upload.success) {
+            throw new Error(upload.error || response.statusText || 'Upload could not be started');
+        }
+
+        this.currentJobId = upload.job_id;
+        try {
+            await this.uploadParts(upload);
+
+            this.updateProgress(15, 'Upload complete, finishing transcription...');
+            const commitResponse = await fetch(`${this.apiUrl}/uploads/${upload.upload_id}/commit`, {
+                method: 'POST'
+            });
+            const commit = await commitResponse.json().catch(() => ({}));
+            if (!commitResponse.ok || !commit.success) {
+                throw new Error(commit.error || 'Upload could not be completed');
+            }
+
+            this.currentJobId = commit.job_id;
+            await this.pollJob(commit.job_id);
+        } finally {
+            this.currentJobId = null;
+        }
+        return true;
+    }
+
+    async uploadParts(upload) {
+        let pending = Array.from({ length: upload.parts }, (_, index) => index);
+        let sent = 0;
+
+        for (let round = 0; round < this.uploadAttempts && pending.length; round++) {
+            const queue = [...pending];
+            const sendNext = async () => {
+                while (queue.length) {
+                    if (await this.uploadPart(upload, queue.shift())) {
+                        sent++;
+                        this.updateProgress(2 + Math.round(13 * sent / upload.parts),
+                            `Uploading file to server... (${sent}/${upload.parts} parts)`);
+                    }
+                }
+            };
+            await Promise.all(Array.from({ length: Math.min(this.uploadConcurrency, queue.length) }, sendNext));
+
+            // Ask the server which parts it has, then resend only the rest
+            const statusResponse = await fetch(`${this.apiUrl}/uploads/${upload.upload_id}`);
+            if (!statusResponse.ok) {
+                throw new Error('Upload expired on the server');
+            }
+            pending = (await statusResponse.json()).missing;
+        }
+
+        if (pending.length) {
+            throw new Error(`Upload failed: ${pending.length} parts could not be sent`);
+        }
+    }
+
+    async uploadPart(upload, index) {
+        const start = index * upload.part_size;
+        const body = await this.uploadFile.slice(start, start + upload.part_size).arrayBuffer();
+
+        // Let the server reject a part that was corrupted on the way
+        const headers = {};
+        if (window.crypto && window.crypto.subtle) {
+            const digest = new Uint8Array(await window.crypto.subtle.digest('SHA-256', body));
+            headers['X-Part-SHA256'] = Array.from(digest, byte => byte.toString(16).padStart(2, '0')).join('');
+        }
+
+        for (let attempt = 0; attempt < this.uploadAttempts; attempt++) {
+            try {
+                const response = await fetch(`${this.apiUrl}/uploads/${upload.upload_id}/parts/${index}`, {
+                    method: 'PUT',
+                    headers,
+                    body
+                });
+                if (response.ok) {
+                    return true;
+                }
+            } catch (error) {
+                console.warn(`Upload of part ${index} failed:`, error);
+            }
+            await this.delay(1000 * 2 ** attempt);
+        }
+        return false;
+    }
+
+    async pollJob(jobId) {
+        const stageLabels = {
+            queued: 'Waiting for a free worker...',
+            starting: 'Loading AI models...',
+            uploading: 'Waiting for the upload...',
+            transcribing_upload: 'Transcribing while the upload finishes...',
+            transcribing: 'Transcribing...',
+            draft: 'Draft ready, refining with the selected model...',
+            refining: 'Refining transcript...',
+            separating_speakers: 'Separating speakers...'
+        };
+        const deadline = Date.now() + 30 * 60 * 1000; // 30 minute limit
+        let draftShown = false;
+
+        while (Date.now() < deadline) {
+            const response = await fetch(`${this.apiUrl}/jobs/${jobId}`);
+            if (!response.ok) {
+                throw new Error('Lost track of the transcription job');
+            }
+            const job = await response.json();
+
+            if (job.status === 'completed') {
+                this.transcriptionResult = job.result.result;
+                this.exportJobId = jobId;
+                this.updateProgress(100, 'Complete!');
+                this.displayResults();
+                return;
+            }
+            if (job.status === 'failed' || job.status === 'cancelled') {
+                throw new Error(job.error || `Transcription ${job.status}`);
+            }
+
+            this.updateProgress(Math.max(15, job.progress), stageLabels[job.stage] || 'Processing with AI models...');
+
+            // Show the draft as soon as it exists and keep it updated
+            if (job.partial) {
+                this.transcriptionResult = job.partial;
+                this.displayResults();
+                if (!draftShown) {
+                    this.showStatus('Draft transcript ready. Refining in the background...', 'info');
+                    draftShown = true;
+                }
+            }
+
+            await this.delay(1000);
+        }
+
+        this.cancelCurrentJob();
+        throw new Error('Request timed out. Please try with a smaller file or check your connection.');
+    }
+
+    cancelCurrentJob() {
+        if (this.currentJobId) {
+            navigator.sendBeacon(`${this.apiUrl}/jobs/${this.currentJobId}/cancel`);
+            this.currentJobId = null;
+        }
+    }
+
+    async runDirectTranscription() {
+        const formData = this.buildFormData(5 * 60);
 
         try {
             // Update progress
@@ -391,11 +672,11 @@ class AudioTranscriber {
         this.speakersDetected.textContent = this.getSpeakerCount(result.segments);
         this.wordCount.textContent = this.getWordCount(result.text);
         
-        // Show results section
+        // Show results section, keeping the current tab when a draft is refreshed
+        const activeTab = this.resultsSection.style.display === 'block' ?
+            document.querySelector('.tab-btn.active')?.dataset.tab : null;
         this.showResultsSection();
-        
-        // Display initial tab (formatted)
-        this.switchTab('formatted');
+        this.switchTab(activeTab || 'formatted');
     }
 
     getSpeakerCount(segments) {
@@ -459,7 +740,7 @@ class AudioTranscriber {
         let html = '';
         segments.forEach(segment => {
             html += `
-                <div class="timeline-entry">
+                <div class="timeline-entry${segment.draft ? ' draft' : ''}">
                     <div class="timestamp">${this.formatTimestamp(segment.start)}</div>
                     <div class="timeline-speaker">${segment.speaker}</div>
                     <div class="timeline-text">${segment.text.trim()}</div>
@@ -511,6 +792,18 @@ class AudioTranscriber {
             this.currentFile.name.replace(/\.[^/.]+$/, '') : 
             'transcript';
 
+        // The server streams exports of finished jobs, so long transcripts
+        // are not rendered again here
+        if (this.exportJobId && this.serverExportFormats.includes(format)) {
+            const link = document.createElement('a');
+            link.href = `${this.apiUrl}/jobs/${this.exportJobId}/export?format=${format}`;
+            link.download = `${fileName}_transcript.${format}`;
+            document.body.appendChild(link);
+            link.click();
+            document.body.removeChild(link);
+            return;
+        }
+
         switch (format) {
             case 'txt':
                 this.exportAsText(result, fileName);
@@ -524,6 +817,9 @@ class AudioTranscriber {
             case 'srt':
                 this.exportAsSRT(result, fileName);
                 break;
+            case 'vtt':
+                this.exportAsVTT(result, fileName);
+                break;
             case 'pdf':
                 await this.exportAsPDF(result, fileName);
                 break;
@@ -607,6 +903,20 @@ class AudioTranscriber {
         this.downloadFile(content, `${fileName}_transcript.srt`, 'text/plain');
     }
 
+    exportAsVTT(result, fileName) {
+        let content = 'WEBVTT\n\n';
+        
+        result.segments.forEach(segment => {
+            const startTime = this.formatSRTTimestamp(segment.start).replace(',', '.');
+            const endTime = this.formatSRTTimestamp(segment.end).replace(',', '.');
+            
+            content += `${startTime} --> ${endTime}\n`;
+            content += `<v ${segment.speaker}>${segment.text.trim()}\n\n`;
+        });
+
+        this.downloadFile(content, `${fileName}_transcript.vtt`, 'text/vtt');
+    }
+
     async exportAsPDF(result, fileName) {
         const { jsPDF } = window.jspdf;
         const doc = new jsPDF();
@@ -765,8 +1075,10 @@ class AudioTranscriber {
     }
 
     resetApp() {
+        this.cancelCurrentJob();
         this.currentFile = null;
         this.transcriptionResult = null;
+        this.exportJobId = null;
         this.isProcessing = false;
         this.fileInput.value = '';
         
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Pre-fork production server for ConvertAnything
+Loads the configured Whisper models once in a master process, then forks
+worker processes that share the weights copy-on-write, so adding workers
+scales across cores without multiplying model RAM by the worker count.
+
+Signals (sent to the master):
+  HUP       Reload model weights in the master and replace all workers gracefully
+  TERM/INT  Stop accepting requests, let in-flight work finish, then exit
+"""
+
+import os
+import sys
+import gc
+import time
+import shutil
+import signal
+import socket
+import random
+import argparse
+import tempfile
+import threading
+import traceback
+
+# Seconds a stopping worker waits for in-flight requests and jobs
+GRACEFUL_TIMEOUT = 300
+
+# Workers failing sooner than this after starting are treated as crashing and
+# respawned with a delay instead of in a tight loop
+MIN_WORKER_LIFETIME = 5
+
+class RequestTracker:
+    """
+    WSGI middleware counting requests so a worker can be recycled and can
+    wait for in-flight requests before exiting
+    """
+
+    def __init__(self, app, on_request_done):
+        self.app = app
+        self.on_request_done = on_request_done
+        self.in_flight = 0
+        self.handled = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        from werkzeug.wsgi import ClosingIterator
+
+        with self._lock:
+            self.in_flight += 1
+        try:
+            app_iter = self.app(environ, start_response)
+        except Exception:
+            self._done()
+            raise
+        # The request only counts as finished once its body has been sent
+        return ClosingIterator(app_iter, [self._done])
+
+    def _done(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.handled += 1
+        self.on_request_done(self)
+
+class Worker:
+    """
+    A forked worker process serving requests from the shared listening socket
+    """
+
+    def __init__(self, listen_socket, args):
+        self.listen_socket = listen_socket
+        self.args = args
+        self.max_requests = args.max_requests + random.randint(0, args.max_requests_jitter) \
+            if args.max_requests else 0
+        self.server = None
+        self._stopping = threading.Event()
+
+    def run(self):
+        from werkzeug.serving import make_server
+        from app import app
+        from jobs import job_manager
+        import fleet
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop('terminated'))
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        # Split the cores between workers instead of every worker using all of them
+        try:
+            import torch
+            torch.set_num_threads(max(1, (os.cpu_count() or 1) // self.args.workers))
+        except ImportError:
+            pass
+
+        self.tracker = RequestTracker(app, self._after_request)
+        self.server = make_server(self.args.host, self.args.port, self.tracker,
+                                  threaded=True, fd=self.listen_socket.fileno())
+        # Each worker process registers separately when part of a fleet
+        fleet.start_heartbeat(port=self.args.port)
+        # Lets this worker pick up long jobs a dead worker left checkpointed
+        job_manager.start()
+        print(f"[worker {os.getpid()}] Ready")
+        self.server.serve_forever()
+
+        # serve_forever returned: wait for outstanding requests and jobs
+        deadline = time.time() + GRACEFUL_TIMEOUT
+        while time.time() < deadline and (self.tracker.in_flight or job_manager.active_count()):
+            time.sleep(0.5)
+        print(f"[worker {os.getpid()}] Exiting after {self.tracker.handled} requests")
+        os._exit(0)
+
+    def _after_request(self, tracker):
+        if self.max_requests and tracker.handled >= self.max_requests:
+            self.stop(f'recycling after {tracker.handled} requests')
+        elif self.args.max_worker_memory:
+            from admission import private_memory_mb
+
+            private_mb = private_memory_mb()
+            if private_mb and private_mb > self.args.max_worker_memory:
+                self.stop(f'recycling at {private_mb:.0f} MB private memory')
+
+    def stop(self, reason):
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        print(f"[worker {os.getpid()}] Stopping: {reason}")
+        # shutdown() blocks until serve_forever() returns, so call it off this thread
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+class Master:
+    """
+    Preloads models, forks workers and keeps the configured number running
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.workers = {}  # pid -> (generation, start time)
+        self.generation = 0
+        self.running = True
+        self.reload_requested = False
+
+    def preload_models(self):
+        import model_registry
+        import admission
+
+        model_registry.MAX_CACHED_MODELS = max(model_registry.MAX_CACHED_MODELS, len(self.args.preload) + 1)
+        for model_size in self.args.preload:
+            model_registry.get_whisper_model(model_size)
+        # Workers share these weights, so the memory budget counts them once
+        admission.SHARED_MODELS.clear()
+        admission.SHARED_MODELS.update(self.args.preload)
+        if self.args.preload_diarization:
+            model_registry.get_diarization_pipeline()
+
+        # Move everything loaded so far out of the garbage collector's reach so
+        # collections in the workers do not write to (and un-share) these pages
+        gc.collect()
+        gc.freeze()
+
+    def reload_models(self):
+        import model_registry
+
+        print(f"[master] Reloading models: {', '.join(self.args.preload) or 'none'}")
+        gc.unfreeze()
+        model_registry.unload_all()
+        self.preload_models()
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                Worker(self.listen_socket, self.args).run()
+            except Exception:
+                traceback.print_exc()
+            finally:
+                os._exit(1)
+        self.workers[pid] = (self.generation, time.time())
+        print(f"[master] Started worker {pid} (generation {self.generation})")
+
+    def stop_workers(self, generation=None):
+        for pid, (worker_generation, _) in list(self.workers.items()):
+            if generation is None or worker_generation == generation:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+    def reap_workers(self):
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            generation, started_at = self.workers.pop(pid, (None, 0))
+            exit_code = os.waitstatus_to_exitcode(status)
+            print(f"[master] Worker {pid} exited with status {exit_code}")
+            # Replace recycled or crashed workers of the current generation
+            if self.running and generation == self.generation:
+                if exit_code != 0 and time.time() - started_at < MIN_WORKER_LIFETIME:
+                    print(f"[master] Worker {pid} died right after starting, waiting before respawning")
+                    time.sleep(MIN_WORKER_LIFETIME)
+                self.spawn_worker()
+
+    def run(self):
+        self.listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listen_socket.bind((self.args.host, self.args.port))
+        self.listen_socket.listen(128)
+        self.listen_socket.set_inheritable(True)
+
+        # Import the application before forking so its code is shared too
+        import app  # noqa: F401
+        self.preload_models()
+
+        signal.signal(signal.SIGHUP, self._request_reload)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        for _ in range(self.args.workers):
+            self.spawn_worker()
+        print(f"[master] Serving on http://{self.args.host}:{self.args.port} with {self.args.workers} workers")
+
+        while self.running:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload_models()
+                old_generation = self.generation
+                self.generation += 1
+                for _ in range(self.args.workers):
+                    self.spawn_worker()
+                # Old workers finish their in-flight work before exiting
+                self.stop_workers(old_generation)
+            self.reap_workers()
+            time.sleep(0.5)
+
+        print("[master] Shutting down, waiting for workers to finish...")
+        self.stop_workers()
+        deadline = time.time() + GRACEFUL_TIMEOUT + 5
+        while self.workers and time.time() < deadline:
+            self.reap_workers()
+            time.sleep(0.5)
+        self.stop_workers()
+        self.listen_socket.close()
+
+    def _request_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def _request_stop(self, signum, frame):
+        self.running = False
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork production server for ConvertAnything")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to bind (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=int(os.getenv('API_PORT', '5001')),
+                       help="Port to bind (default: 5001)")
+    parser.add_argument("--workers", "-w", type=int, default=os.cpu_count() or 1,
+                       help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--preload", nargs="*",
+                       default=os.getenv('PRELOAD_MODELS', 'base').split(),
+                       choices=["tiny", "base", "small", "medium", "large"],
+                       help="Whisper models loaded once in the master (default: base)")
+    parser.add_argument("--preload-diarization", action="store_true",
+                       help="Also load the pyannote pipeline in the master")
+    parser.add_argument("--max-requests", type=int, default=0,
+                       help="Recycle a worker after this many requests (default: never)")
+    parser.add_argument("--max-requests-jitter", type=int, default=0,
+                       help="Random extra requests so workers do not recycle together")
+    parser.add_argument("--max-worker-memory", type=int, default=0,
+                       help="Recycle a worker whose private memory exceeds this many MB")
+
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        print("The pre-fork server needs os.fork(); use 'python app.py' on this platform")
+        sys.exit(1)
+
+    # Workers share job state through this directory so any of them can answer
+    # polls for a job another worker is running; must be set before importing app
+    own_state_dir = None
+    if not os.getenv('JOB_STATE_DIR'):
+        own_state_dir = tempfile.mkdtemp(prefix='convertanything_jobs_')
+        os.environ['JOB_STATE_DIR'] = own_state_dir
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Transcribe Audio AI'))
+    try:
+        Master(args).run()
+    finally:
+        # Workers leave through os._exit(), so only the master gets here
+        if own_state_dir:
+            shutil.rmtree(own_state_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
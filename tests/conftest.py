@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The API modules live at the top level and the transcription library next to them
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, 'Transcribe Audio AI'))
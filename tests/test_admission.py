@@ -0,0 +1,122 @@
+import os
+import json
+import threading
+import multiprocessing
+
+import pytest
+
+import admission
+from admission import AdmissionController, AdmissionRejected, MemoryEstimate, MODEL_MEMORY_MB
+
+@pytest.fixture(autouse=True)
+def no_models(monkeypatch):
+    # Requests run in this process, which has nothing loaded
+    monkeypatch.setattr(admission, 'inference_process', lambda: (os.getpid(), []))
+
+def controller(tmp_path, budget_mb=1000, shared=True):
+    return AdmissionController(budget_mb, str(tmp_path / 'calibration.json'),
+                               str(tmp_path / 'ledger') if shared else '')
+
+def estimate(mb, model_size='base'):
+    return MemoryEstimate(model_size, 'transcribe', mb, 1.0)
+
+def hold_admission(state_dir, mb, admitted, release):
+    admission.inference_process = lambda: (os.getpid(), [])
+    other = AdmissionController(1000, os.path.join(state_dir, 'calibration.json'),
+                                os.path.join(state_dir, 'ledger'))
+    with other.admit(estimate(mb)):
+        admitted.set()
+        release.wait(10)
+
+def test_requests_that_never_fit_are_rejected(tmp_path):
+    small = estimate(400, 'small')
+    assert controller(tmp_path).check(estimate(1500), [small]) is small
+    with pytest.raises(AdmissionRejected):
+        controller(tmp_path).check(estimate(1500))
+
+def test_budget_is_shared_by_processes(tmp_path):
+    context = multiprocessing.get_context('fork')
+    admitted, release = context.Event(), context.Event()
+    child = context.Process(target=hold_admission, args=(str(tmp_path), 600, admitted, release))
+    child.start()
+    try:
+        assert admitted.wait(10)
+        here = controller(tmp_path)
+        usage = here.host_usage()
+        assert (round(usage['committed_mb']), usage['running']) == (600, 1)
+        assert not here.fits(estimate(500), usage)
+        assert here.fits(estimate(300), usage)
+    finally:
+        release.set()
+        child.join(10)
+
+    usage = here.host_usage()
+    assert (usage['committed_mb'], usage['running']) == (0, 0)
+    assert here.fits(estimate(500), usage)
+
+def test_dead_processes_release_their_memory(tmp_path):
+    ledger = tmp_path / 'ledger'
+    ledger.mkdir()
+    dead = multiprocessing.get_context('fork').Process(target=lambda: None)
+    dead.start()
+    dead.join()
+    (ledger / f'{dead.pid}.json').write_text(json.dumps(
+        {'committed_mb': 900, 'running': 1, 'models_pid': dead.pid, 'models': ['small']}))
+
+    usage = controller(tmp_path).host_usage()
+    assert usage == {'committed_mb': 0, 'running': 0, 'weights_mb': 0}
+    assert not (ledger / f'{dead.pid}.json').exists()
+
+def test_weights_count_once_per_holding_process(tmp_path, monkeypatch):
+    ledger = tmp_path / 'ledger'
+    ledger.mkdir()
+    parent = os.getppid()
+    # Another worker using the same model server, and one holding its own copy
+    (ledger / f'{parent}.json').write_text(json.dumps(
+        {'committed_mb': 0, 'running': 0, 'models_pid': 1, 'models': ['base']}))
+    here = controller(tmp_path)
+
+    assert here.host_usage((1, ['base']))['weights_mb'] == MODEL_MEMORY_MB['base']
+    assert here.host_usage((os.getpid(), ['base']))['weights_mb'] == 2 * MODEL_MEMORY_MB['base']
+
+    # Weights loaded before serve.py forked are shared by every worker
+    monkeypatch.setattr(admission, 'SHARED_MODELS', {'base'})
+    assert here.host_usage((os.getpid(), ['base']))['weights_mb'] == MODEL_MEMORY_MB['base']
+
+def test_admission_waits_for_memory_in_this_process(tmp_path):
+    here = controller(tmp_path, shared=False)
+    first = here.admit(estimate(700))
+    with first:
+        assert not here.fits(estimate(400), here.host_usage())
+    assert here.fits(estimate(400), here.host_usage())
+    assert here.status()['committed_mb'] == 0
+
+def test_waiting_request_takes_a_fallback_that_fits_first(tmp_path):
+    here = controller(tmp_path, shared=False)
+    held, other = here.admit(estimate(500)), here.admit(estimate(400))
+    with held:
+        with other:
+            admitted = []
+            waiter = threading.Thread(target=lambda: admitted.append(
+                here.admit(estimate(600), fallbacks=[estimate(300, 'tiny')])), daemon=True)
+            waiter.start()
+            waiter.join(0.3)
+            assert admitted == []
+        # 600 MB still does not fit next to the 500 MB request, 300 MB does
+        waiter.join(5)
+        assert admitted[0].estimate.model_size == 'tiny'
+        with admitted[0]:
+            pass
+
+def test_model_server_is_asked_outside_the_condition(tmp_path, monkeypatch):
+    here = controller(tmp_path)
+    owned = []
+
+    def inference_process():
+        owned.append(here._cond._is_owned())
+        return os.getpid(), []
+
+    monkeypatch.setattr(admission, 'inference_process', inference_process)
+    with here.admit(estimate(100)):
+        pass
+    assert owned and not any(owned)
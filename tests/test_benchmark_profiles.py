@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+# The benchmark loads Whisper models
+pytest.importorskip('whisper')
+
+import benchmark_profiles
+
+def test_every_run_decodes_and_missing_rtf_prints_a_dash(monkeypatch, capsys):
+    runs = []
+    monkeypatch.setattr(benchmark_profiles, 'load_audio', lambda path: np.zeros(16000, dtype=np.float32))
+    monkeypatch.setattr(benchmark_profiles, 'transcribe_waveform',
+                        lambda audio, model_size, decode_profile: runs.append((model_size, decode_profile)))
+    monkeypatch.setattr(benchmark_profiles, 'get_rtf', lambda model, profile: 0.25 if profile == 'fast' else None)
+
+    benchmark_profiles.benchmark('sample.wav', ['tiny'], ['fast', 'accurate'])
+
+    assert runs == [('tiny', 'fast'), ('tiny', 'accurate')]
+    output = capsys.readouterr().out
+    assert 'Real-time factor: 0.250' in output
+    assert 'Real-time factor: -' in output
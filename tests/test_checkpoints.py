@@ -0,0 +1,68 @@
+import os
+import multiprocessing
+
+from checkpoints import CheckpointStore
+
+OPTIONS = {'model': 'base', 'language': None}
+
+def upload(tmp_path, name='upload.wav'):
+    path = tmp_path / name
+    path.write_bytes(b'RIFF audio')
+    return str(path)
+
+def run_until_crash(root, upload_path, started, crash):
+    # A worker that checkpoints two windows and is then killed outright
+    checkpoint = CheckpointStore(root).create('job1', upload_path, 'talk.WAV', OPTIONS, 1200, 3600)
+    checkpoint.save_progress({'windows_done': 1, 'segments': [{'text': ' one'}]})
+    checkpoint.save_progress({'windows_done': 2, 'segments': [{'text': ' one'}, {'text': ' two'}]})
+    started.set()
+    crash.wait(10)
+    os._exit(1)
+
+def test_job_resumes_from_its_last_window_after_a_crash(tmp_path):
+    root = str(tmp_path / 'checkpoints')
+    context = multiprocessing.get_context('fork')
+    started, crash = context.Event(), context.Event()
+    worker = context.Process(target=run_until_crash, args=(root, upload(tmp_path), started, crash))
+    worker.start()
+    store = CheckpointStore(root)
+    try:
+        assert started.wait(10)
+        # Still locked by the running worker
+        assert store.pending() == ['job1']
+        assert store.claim('job1') is None
+    finally:
+        crash.set()
+        worker.join(10)
+
+    checkpoint = store.claim('job1')
+    assert checkpoint is not None
+    assert checkpoint.request['filename'] == 'talk.WAV'
+    assert checkpoint.request['options'] == OPTIONS
+    assert 3500 < checkpoint.remaining_seconds() <= 3600
+    assert checkpoint.load_progress()['windows_done'] == 2
+    with open(checkpoint.audio_path, 'rb') as f:
+        assert f.read() == b'RIFF audio'
+    assert checkpoint.audio_path.endswith('audio.wav')
+
+    # Nobody else can take it while this process works on it
+    assert CheckpointStore(root).claim('job1') is None
+    checkpoint.finish()
+    assert store.pending() == []
+
+def test_new_checkpoint_has_no_progress(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'checkpoints'))
+    upload_path = upload(tmp_path)
+    checkpoint = store.create('job2', upload_path, 'talk.mp3', OPTIONS, 900, 60)
+    assert checkpoint.load_progress() is None
+    assert not os.path.exists(upload_path)
+    checkpoint.release()
+
+def test_unreadable_checkpoint_is_dropped(tmp_path):
+    root = tmp_path / 'checkpoints'
+    (root / 'job3').mkdir(parents=True)
+    (root / 'job3' / 'request.json').write_text('{not json')
+
+    store = CheckpointStore(str(root))
+    assert store.claim('job3') is None
+    assert not (root / 'job3').exists()
@@ -0,0 +1,75 @@
+import io
+import wave
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from compact_audio import compact_format, compact_duration, read_compact, SAMPLE_RATE
+
+def wav_bytes(samples, rate=SAMPLE_RATE, channels=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.astype('<i2').tobytes())
+    return buffer.getvalue()
+
+def float_wav_bytes(samples, data_size=None, extensible=False):
+    data = samples.astype('<f4').tobytes()
+    if extensible:
+        fmt = struct.pack('<HHIIHHHHI', 0xFFFE, 1, SAMPLE_RATE, SAMPLE_RATE * 4, 4, 32, 22, 32, 0)
+        fmt += struct.pack('<H', 3) + b'\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71'
+    else:
+        fmt = struct.pack('<HHIIHH', 3, 1, SAMPLE_RATE, SAMPLE_RATE * 4, 4, 32)
+    size = len(data) if data_size is None else data_size
+    # A LIST chunk before the data, as many encoders write
+    chunks = (b'fmt ' + struct.pack('<I', len(fmt)) + fmt + b'LIST' + struct.pack('<I', 3) + b'abc\x00'
+              + b'data' + struct.pack('<I', size) + data)
+    return b'RIFF' + struct.pack('<I', 4 + len(chunks)) + b'WAVE' + chunks
+
+def write(tmp_path, data, name='audio.wav'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+def test_pcm_wav_is_read_directly(tmp_path):
+    samples = np.array([0, 16384, -16384, 32767, -32768] * 1000)
+    path = write(tmp_path, wav_bytes(samples))
+
+    offset, length, dtype = compact_format(Path(path).read_bytes()[:4096])
+    assert (offset, length, dtype) == (44, samples.size * 2, np.dtype('<i2'))
+    audio = read_compact(path)
+    assert audio.dtype == np.float32
+    assert np.allclose(audio[:5], [0, 0.5, -0.5, 32767 / 32768, -1])
+    assert compact_duration(path) == samples.size / SAMPLE_RATE
+
+def test_float_wav_after_other_chunks(tmp_path):
+    samples = np.linspace(-1, 1, SAMPLE_RATE, dtype=np.float32)
+    for extensible in (False, True):
+        path = write(tmp_path, float_wav_bytes(samples, extensible=extensible))
+        assert np.array_equal(read_compact(path), samples)
+
+def test_streamed_wav_runs_to_the_end_of_the_file(tmp_path):
+    samples = np.ones(800, dtype=np.float32)
+    for size in (0, 0xFFFFFFFF):
+        path = write(tmp_path, float_wav_bytes(samples, data_size=size))
+        assert compact_format(Path(path).read_bytes())[1] is None
+        assert len(read_compact(path)) == 800
+        assert compact_duration(path) == 800 / SAMPLE_RATE
+
+def test_other_audio_needs_ffmpeg(tmp_path):
+    samples = np.zeros(1000)
+    assert compact_format(wav_bytes(samples, rate=44100)) is None
+    assert compact_format(wav_bytes(samples, channels=2)) is None
+    assert compact_format(b'ID3\x04' + b'\x00' * 100) is None
+    assert compact_format(b'RIFF\x00\x00\x00\x00AVI ') is None
+    # Header cut off before the format is known, or data before any fmt chunk
+    assert compact_format(wav_bytes(samples)[:30]) is None
+    assert compact_format(b'RIFF\x00\x00\x00\x00WAVEdata\x04\x00\x00\x00\x00\x00\x00\x00') is None
+
+    path = write(tmp_path, b'ID3' + b'\x00' * 100, 'talk.mp3')
+    assert read_compact(path) is None
+    assert compact_duration(path) is None
+    assert read_compact(str(tmp_path / 'missing.wav')) is None
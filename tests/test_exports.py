@@ -0,0 +1,114 @@
+import re
+import json
+import zlib
+
+import pytest
+
+import exports
+from exports import render_export, ExportCache
+
+RESULT = {
+    'text': ' Hello there. General (Kenobi) \\ café',
+    'language': 'en',
+    'duration': 3725.5,
+    'segments': [
+        {'start': 0.0, 'end': 2.5, 'text': ' Hello there.'},
+        {'start': 3661.25, 'end': 3725.5, 'text': ' General (Kenobi) \\ café'},
+    ],
+}
+
+SPEAKERS = dict(RESULT, segments=[dict(RESULT['segments'][0], speaker='Alice'),
+                                  dict(RESULT['segments'][1], speaker='Bob')])
+
+def render(result, output_format):
+    return b''.join(render_export(result, output_format, 'talk.wav', 'base'))
+
+def test_txt():
+    text = render(RESULT, 'txt').decode('utf-8')
+    assert text.startswith('AUDIO TRANSCRIPTION\n')
+    assert 'Source File: talk.wav' in text and 'Model Used: base' in text
+    assert text.endswith(RESULT['text'])
+
+    text = render(SPEAKERS, 'txt').decode('utf-8')
+    assert '[Alice] (00:00 - 00:02):\nHello there.' in text
+    assert '[61:01 - 62:05] Bob: General (Kenobi) \\ café\n' in text
+
+def test_srt():
+    assert render(SPEAKERS, 'srt').decode('utf-8') == (
+        '1\n00:00:00,000 --> 00:00:02,500\n[Alice] Hello there.\n\n'
+        '2\n01:01:01,250 --> 01:02:05,500\n[Bob] General (Kenobi) \\ café\n\n')
+
+def test_vtt():
+    assert render(SPEAKERS, 'vtt').decode('utf-8') == (
+        'WEBVTT\n\n'
+        '00:00:00.000 --> 00:00:02.500\n<v Alice>Hello there.\n\n'
+        '01:01:01.250 --> 01:02:05.500\n<v Bob>General (Kenobi) \\ café\n\n')
+
+def test_json_matches_the_result(monkeypatch):
+    # Small chunks, so the text is encoded in several slices
+    monkeypatch.setattr(exports, 'EXPORT_CHUNK_BYTES', 7)
+    exported = json.loads(render(SPEAKERS, 'json'))
+    export = exported.pop('export')
+    assert exported == SPEAKERS
+    assert (export['source_file'], export['model'], export['speaker_count']) == ('talk.wav', 'base', 2)
+
+def test_chunks_stay_near_the_chunk_size(monkeypatch):
+    monkeypatch.setattr(exports, 'EXPORT_CHUNK_BYTES', 100)
+    segments = [{'start': float(i), 'end': i + 1.0, 'text': f' segment {i}'} for i in range(500)]
+    chunks = list(render_export({'text': '', 'segments': segments}, 'srt'))
+    assert len(chunks) > 10
+    assert all(len(chunk) < 200 for chunk in chunks)
+
+def pdf_objects(data):
+    """{object id: body}, checking every xref offset points at its object"""
+    start = int(re.search(rb'startxref\n(\d+)\n%%EOF\n$', data).group(1))
+    table = data[start:].split(b'trailer')[0].split(b'\n')[3:-1]
+    objects = {}
+    for object_id, entry in enumerate(table, 1):
+        offset = int(entry[:10])
+        assert data[offset:].startswith(b'%d 0 obj\n' % object_id)
+        objects[object_id] = data[offset:data.index(b'\nendobj\n', offset)]
+    return objects
+
+def page_text(objects):
+    text = b''
+    for body in objects.values():
+        if b'/FlateDecode' in body:
+            stream = body[body.index(b'stream\n') + 7:body.rindex(b'\nendstream')]
+            text += zlib.decompress(stream)
+    return text
+
+def test_pdf():
+    data = render(SPEAKERS, 'pdf')
+    assert data.startswith(b'%PDF-1.4\n')
+    objects = pdf_objects(data)
+    assert b'/Count 1' in objects[2]
+
+    text = page_text(objects)
+    assert b'(Speakers: 2) Tj' in text
+    assert b'([61:01] Bob:) Tj' in text
+    # Parentheses and backslashes are escaped, other text is WinAnsi
+    assert b'(General \\(Kenobi\\) \\\\ caf\xe9) Tj' in text
+
+def test_long_pdf_breaks_into_pages():
+    segments = [{'start': i * 5.0, 'end': i * 5.0 + 5, 'text': ' words ' * 40} for i in range(200)]
+    objects = pdf_objects(render({'text': '', 'duration': 1000, 'segments': segments}, 'pdf'))
+    pages = int(re.search(rb'/Count (\d+)', objects[2]).group(1))
+    assert pages > 10
+    assert sum(b'/Type /Page ' in body for body in objects.values()) == pages
+
+def test_unknown_format_is_refused():
+    with pytest.raises(ValueError):
+        render_export(RESULT, 'docx')
+
+def test_cache_keeps_only_complete_exports(tmp_path):
+    cache = ExportCache(str(tmp_path))
+    stopped = cache.stream('job1', 'txt', iter([b'one', b'two']))
+    next(stopped)
+    stopped.close()
+    assert cache.get('job1', 'txt') is None
+    assert list(tmp_path.iterdir()) == []
+
+    assert b''.join(cache.stream('job1', 'txt', iter([b'one', b'two']))) == b'onetwo'
+    with open(cache.get('job1', 'txt'), 'rb') as f:
+        assert f.read() == b'onetwo'
@@ -0,0 +1,71 @@
+import time
+import threading
+
+import jobs
+from jobs import JobManager, JobWaiting
+
+def test_waiting_job_leaves_its_slot_to_others():
+    manager = JobManager(workers=1)
+    arrived = threading.Event()
+    passes = []
+
+    def wait_for(job):
+        arrived.wait(10)
+        arrived.clear()
+        return 0.5
+
+    def run_upload(job):
+        passes.append(job.id)
+        if len(passes) < 2:
+            raise JobWaiting()
+        return {'passes': len(passes)}
+
+    upload = manager.submit(run_upload, {}, wait_for=wait_for)
+    assert upload.status == 'waiting'
+
+    # The only worker is free for other jobs while the upload waits
+    other = manager.submit(lambda job: {'ok': True}, {})
+    assert other.wait(10) and other.status == 'completed'
+    assert passes == []
+
+    arrived.set()
+    for _ in range(100):
+        if upload.status == 'waiting' and passes:
+            break
+        time.sleep(0.05)
+    assert passes == [upload.id] and upload.status == 'waiting'
+
+    arrived.set()
+    assert upload.wait(10)
+    assert upload.status == 'completed' and upload.result == {'passes': 2}
+
+def test_job_cancelled_while_waiting_still_finishes():
+    manager = JobManager(workers=1)
+    finished = []
+
+    def wait_for(job):
+        while True:
+            job.cancel_token.check()
+            time.sleep(0.05)
+
+    job = manager.submit(lambda job: {}, {}, on_finish=finished.append, wait_for=wait_for)
+    job.cancel('client disconnected')
+
+    assert job.wait(10)
+    assert job.status == 'cancelled' and finished == [job]
+
+def test_resumed_job_is_not_abandoned_before_its_first_poll(monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_ABANDON_SECONDS', 0)
+    manager = JobManager(workers=1)
+    release = threading.Event()
+    resumed = manager.submit(lambda job: release.wait(10) and {}, {}, await_client=True)
+
+    time.sleep(0.01)
+    manager.reap()
+    assert not resumed.is_cancelled()
+
+    manager.get(resumed.id)
+    time.sleep(0.01)
+    manager.reap()
+    assert resumed.cancel_token.reason == 'abandoned'
+    release.set()
@@ -0,0 +1,42 @@
+import language_hints
+from language_hints import LanguageHintCache
+
+def test_confident_detection_becomes_a_hint():
+    hints = LanguageHintCache()
+    hints.remember('key-a', 'zoom', 'de', {'probability': 0.95, 'seconds': 0.2})
+
+    assert hints.get('key-a', 'zoom') == 'de'
+    # The client's other sources fall back to its own hint
+    assert hints.get('key-a', 'phone') == 'de'
+    assert hints.get('key-b', 'zoom') is None
+
+def test_unsure_detection_is_not_remembered():
+    hints = LanguageHintCache()
+    hints.remember('key-a', None, 'nl', {'probability': 0.4, 'seconds': 0.2})
+    assert hints.get('key-a') is None
+
+def test_explicit_language_does_not_create_a_hint():
+    hints = LanguageHintCache()
+    # language= in the request skips detection
+    hints.remember('key-a', 'zoom', 'fr', None)
+    assert hints.get('key-a', 'zoom') is None
+
+def test_using_a_hint_does_not_refresh_it(monkeypatch):
+    hints = LanguageHintCache(ttl=100)
+    now = [1000.0]
+    monkeypatch.setattr(language_hints.time, 'time', lambda: now[0])
+    hints.remember('key-a', None, 'de', {'probability': 0.95, 'seconds': 0.2})
+
+    # Transcriptions that used the hint skip detection and report none
+    now[0] += 60
+    assert hints.get('key-a') == 'de'
+    hints.remember('key-a', None, 'de', None)
+
+    now[0] += 60
+    assert hints.get('key-a') is None
+
+def test_forget_drops_the_hint():
+    hints = LanguageHintCache()
+    hints.remember('key-a', 'zoom', 'de', {'probability': 0.95, 'seconds': 0.2})
+    hints.forget('key-a', 'zoom')
+    assert hints.get('key-a', 'zoom') is None
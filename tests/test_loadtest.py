@@ -0,0 +1,78 @@
+import json
+import argparse
+from collections import Counter
+
+import pytest
+
+from loadtest import load_mix, summarize
+
+def options(**overrides):
+    defaults = {'trace': None, 'mix': None, 'requests': 0, 'durations': '10,30,120', 'formats': 'wav',
+                'models': 'base', 'speakers': 0.0, 'seed': 1}
+    return argparse.Namespace(**dict(defaults, **overrides))
+
+def test_trace_is_replayed_in_order(tmp_path):
+    trace = tmp_path / 'trace.jsonl'
+    entries = [{'duration': 10 * i, 'format': 'wav', 'model': 'base', 'speaker_separation': False, 'at': i}
+               for i in range(1, 6)]
+    trace.write_text('\n'.join(json.dumps(entry) for entry in entries) + '\n\n')
+
+    assert load_mix(options(trace=str(trace))) == entries
+    assert load_mix(options(trace=str(trace), requests=2)) == entries[:2]
+
+def test_command_line_mix_follows_the_weights():
+    requests = load_mix(options(requests=4000, durations='10=3,120=1', models='base,small=0', speakers=0.25))
+
+    assert len(requests) == 4000
+    assert {request['model'] for request in requests} == {'base'}
+    durations = Counter(request['duration'] for request in requests)
+    assert durations[10.0] / 4000 == pytest.approx(0.75, abs=0.03)
+    speakers = sum(request['speaker_separation'] for request in requests)
+    assert speakers / 4000 == pytest.approx(0.25, abs=0.03)
+
+def test_mix_file_sample_is_repeatable(tmp_path):
+    mix = tmp_path / 'mix.json'
+    mix.write_text(json.dumps({'requests': [
+        {'duration': 30, 'format': 'mp3', 'model': 'small', 'speaker_separation': True, 'weight': 1},
+        {'duration': 600, 'format': 'wav', 'model': 'base', 'weight': 0},
+    ]}))
+
+    first = load_mix(options(mix=str(mix), requests=20))
+    assert first == load_mix(options(mix=str(mix), requests=20))
+    assert {request['format'] for request in first} == {'mp3'}
+    # Samples are copies, so a run can annotate them
+    first[0]['index'] = 0
+    assert 'index' not in first[1]
+
+def test_empty_mix_is_refused():
+    with pytest.raises(SystemExit):
+        load_mix(options(models='base=0'))
+
+def record(status, latency, model='base', duration=30.0, **extra):
+    return dict({'status': status, 'latency': latency, 'model': model, 'duration': duration}, **extra)
+
+def test_summary():
+    records = [record(200, 1.0, overhead=0.2), record(200, 2.0, overhead=0.1), record(200, 4.0, 'small', overhead=0.3),
+               record(429, 0.1), record(None, 0.0)]
+
+    report = summarize(records, 10.0, 300.0, [300.0, 512.34, 400.0], 350.0)
+
+    assert (report['requests'], report['ok']) == (5, 3)
+    assert report['errors'] == {'429': 1, 'connection': 1}
+    assert report['error_rate'] == 0.4
+    assert report['throughput_rps'] == 0.3
+    assert report['audio_seconds_per_second'] == 9.0
+    # Failed requests do not count towards the latencies
+    assert report['latency'] == {'p50': 2.0, 'p95': 4.0, 'p99': 4.0, 'mean': 2.3333, 'max': 4.0}
+    assert report['overhead']['max'] == 0.3
+    assert report['by_model']['base']['count'] == 2
+    assert report['by_model']['small']['p50'] == 4.0
+    assert report['rss_mb'] == {'start': 300.0, 'peak': 512.3, 'end': 350.0}
+
+def test_summary_of_a_run_without_answers():
+    report = summarize([record(500, 0.5)], 0, None, [], None)
+    assert report['error_rate'] == 1.0
+    assert report['throughput_rps'] is None
+    assert report['latency']['p50'] is None
+    assert report['overhead'] is None
+    assert report['rss_mb'] == {'start': None, 'peak': None, 'end': None}
@@ -0,0 +1,33 @@
+import pytest
+
+# The registry imports whisper, though these tests never load real weights
+pytest.importorskip('whisper')
+
+import model_registry
+from model_registry import get_whisper_model, model_in_use, loaded_models
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(model_registry.whisper, 'load_model', lambda size: object())
+    monkeypatch.setattr(model_registry, 'MAX_CACHED_MODELS', 2)
+    model_registry.unload_all()
+    yield
+    model_registry.unload_all()
+
+def test_least_recently_used_model_is_evicted():
+    get_whisper_model('tiny')
+    get_whisper_model('base')
+    get_whisper_model('tiny')
+    get_whisper_model('small')
+    assert loaded_models() == ['tiny', 'small']
+
+def test_model_in_use_is_not_evicted():
+    tiny = get_whisper_model('tiny')
+    with model_in_use('tiny'):
+        get_whisper_model('base')
+        get_whisper_model('small')
+        assert 'tiny' in loaded_models()
+        # Still the same weights, not a second copy
+        assert get_whisper_model('tiny') is tiny
+    # Trimmed back to the limit once it is released
+    assert len(loaded_models()) == 2
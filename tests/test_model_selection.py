@@ -0,0 +1,53 @@
+import pytest
+
+import model_selection
+from model_selection import select_model, model_rtfs
+
+RTFS = {'tiny': 0.02, 'base': 0.05, 'small': 0.12, 'medium': 0.3, 'large': 0.6}
+IDLE = {'workers': 2, 'queued': 0, 'queued_cost': 0.0, 'running': 0, 'running_cost': 0.0}
+
+@pytest.fixture
+def measured(monkeypatch):
+    table = {'balanced': dict(RTFS)}
+    monkeypatch.setattr(model_selection, 'get_rtf_table', lambda: table)
+    return table
+
+def test_default_model_until_something_is_measured(monkeypatch):
+    monkeypatch.setattr(model_selection, 'get_rtf_table', lambda: {})
+    model, details = select_model(100, False, 'balanced', 60, IDLE)
+    assert model == 'base'
+    assert 'no real-time factors' in details['reason']
+
+def test_largest_model_within_the_target(measured):
+    model, details = select_model(100, False, 'balanced', 60, IDLE)
+    # medium: 30 s of decoding and 12 s to load; large would take 85 s
+    assert model == 'medium'
+    assert details['predicted_latency'] == 42
+    assert details['rtf_measured'] is True
+
+def test_loaded_model_skips_the_load_time(measured):
+    assert select_model(100, False, 'balanced', 60, IDLE, loaded=['large'])[0] == 'large'
+
+def test_speaker_separation_costs_more(measured):
+    assert select_model(100, True, 'balanced', 50, IDLE)[0] == 'small'
+
+def test_queued_work_pushes_towards_smaller_models(measured):
+    backlog = dict(IDLE, queued=1, queued_cost=2000.0)
+    model, details = select_model(100, False, 'balanced', 60, backlog)
+    assert details['queue_wait'] == 50
+    assert model == 'base'
+
+def test_fastest_model_when_none_fits(measured):
+    model, details = select_model(10000, False, 'balanced', 60, IDLE)
+    assert model == 'tiny'
+    assert 'no model meets the target' in details['reason']
+
+def test_unmeasured_models_are_scaled_from_the_nearest(measured):
+    measured['balanced'] = {'base': 0.05}
+    measured['fast'] = {'tiny': 0.01}
+    rtfs = model_rtfs('balanced')
+    assert rtfs['base'] == (0.05, True)
+    # Measured with another profile, so only an estimate for this one
+    assert rtfs['tiny'] == (0.01, False)
+    assert rtfs['small'][0] == pytest.approx(0.125)
+    assert rtfs['small'][1] is False
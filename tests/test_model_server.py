@@ -0,0 +1,84 @@
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+from cancellation import CancelToken, DeadlineExceeded
+from model_server import ModelServerClient, ModelServerError, send_frame, recv_frame, FRAME_HEADER
+
+@pytest.fixture
+def pair():
+    left, right = socket.socketpair()
+    yield left, right
+    left.close()
+    right.close()
+
+def send_slowly(sock, data, step):
+    # Deliver the bytes in small pieces, as a busy connection would
+    def run():
+        for start in range(0, len(data), step):
+            sock.sendall(data[start:start + step])
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+def test_frame_round_trip(pair):
+    audio = np.linspace(-1, 1, 16000 * 5, dtype=np.float32)
+    # Large enough that the socket buffer fills before the reader starts
+    sender = threading.Thread(target=send_frame, args=(pair[0], {'op': 'transcribe', 'rtf': np.float32(0.25),
+                                                                 'tokens': np.arange(3)}, audio), daemon=True)
+    sender.start()
+    header, received = recv_frame(pair[1])
+    sender.join(5)
+
+    assert header == {'op': 'transcribe', 'rtf': 0.25, 'tokens': [0, 1, 2]}
+    assert np.array_equal(received, audio)
+    # torch.from_numpy() needs a writable array
+    assert received.flags.writeable
+
+def test_frame_without_audio(pair):
+    send_frame(pair[0], {'op': 'ping'})
+    assert recv_frame(pair[1]) == ({'op': 'ping'}, None)
+
+class Recorder:
+    def __init__(self):
+        self.data = bytearray()
+
+    def sendall(self, data):
+        self.data += data
+
+def test_frame_split_across_reads(pair):
+    frame = Recorder()
+    send_frame(frame, {'op': 'diarize', 'with_embeddings': True}, np.ones(1000, dtype=np.float32))
+
+    sender = send_slowly(pair[0], bytes(frame.data), 7)
+    header, audio = recv_frame(pair[1])
+    sender.join(5)
+    assert header == {'op': 'diarize', 'with_embeddings': True}
+    assert np.array_equal(audio, np.ones(1000, dtype=np.float32))
+
+def test_peer_closed_between_frames(pair):
+    pair[0].close()
+    assert recv_frame(pair[1]) == (None, None)
+
+def test_peer_closed_mid_frame(pair):
+    pair[0].sendall(FRAME_HEADER.pack(b'CAMS', 100, 0) + b'{"op"')
+    pair[0].close()
+    with pytest.raises(ConnectionError):
+        recv_frame(pair[1])
+
+def test_bad_magic_is_refused(pair):
+    pair[0].sendall(FRAME_HEADER.pack(b'HTTP', 2, 0) + b'{}')
+    with pytest.raises(ModelServerError):
+        recv_frame(pair[1])
+
+def test_request_fails_fast_once_the_deadline_is_spent(tmp_path, monkeypatch):
+    token = CancelToken(60)
+    # Right at the deadline: check() still passes but nothing is left to send
+    monkeypatch.setattr(token, 'remaining', lambda: 0.0)
+    client = ModelServerClient(str(tmp_path / 'missing.sock'))
+
+    with pytest.raises(DeadlineExceeded):
+        client.request('ping', cancel_token=token)
+    assert token.reason == 'deadline exceeded'
@@ -0,0 +1,9 @@
+from ownership import owner_key
+
+def test_owner_is_a_digest_of_the_client():
+    assert owner_key('secret-key') == owner_key('secret-key')
+    assert 'secret-key' not in owner_key('secret-key')
+    assert owner_key('secret-key') != owner_key('other-key')
+
+def test_command_line_runs_have_no_owner():
+    assert owner_key(None) == ''
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+# Both passes cut the waveform at Whisper's sample rate
+pytest.importorskip('whisper')
+
+import progressive
+from progressive import draft_then_refine, plan_windows
+
+SAMPLE_RATE = 16000
+
+class ScriptedModel:
+    """Returns one segment per 10 seconds of each clip, labelled with the model's name"""
+
+    is_multilingual = True
+
+    def __init__(self, name):
+        self.name = name
+        self.clips = []
+
+    def transcribe(self, clip, **options):
+        seconds = len(clip) / SAMPLE_RATE
+        self.clips.append((seconds, options.get('initial_prompt')))
+        starts = np.arange(0, seconds, 10.0)
+        segments = [{'start': float(start), 'end': float(min(start + 10, seconds)), 'text': f' {self.name}'}
+                    for start in starts]
+        return {'text': ''.join(s['text'] for s in segments), 'segments': segments}
+
+@pytest.fixture
+def models(monkeypatch):
+    loaded = {}
+    monkeypatch.setattr(progressive, 'get_whisper_model', lambda size: loaded.setdefault(size, ScriptedModel(size)))
+    monkeypatch.setattr(progressive, 'record_rtf', lambda *args: None)
+    return loaded
+
+def test_windows_start_on_draft_boundaries():
+    segments = [{'start': float(start)} for start in range(0, 100, 10)]
+    assert plan_windows(segments, 100.0) == [(0.0, 30.0), (30.0, 60.0), (60.0, 90.0), (90.0, 100.0)]
+    # A short tail joins the previous window
+    assert plan_windows(segments, 95.0) == [(0.0, 30.0), (30.0, 60.0), (60.0, 95.0)]
+    # A short recording is one window
+    assert plan_windows(segments[:2], 20.0) == [(0.0, 20.0)]
+
+def test_draft_comes_first_then_each_window_replaces_it_in_order(models):
+    updates = []
+    audio = np.zeros(SAMPLE_RATE * 65, dtype=np.float32)
+
+    result = draft_then_refine(audio, 'small', language='en',
+                               on_update=lambda stage, partial, progress: updates.append(
+                                   (stage, progress, partial['refined_until'], [s['text'] for s in partial['segments']])))
+
+    assert [update[:3] for update in updates] == [
+        ('draft', 10, 0.0), ('refining', 55, 30.0), ('refining', 100, 65.0)]
+    assert updates[0][3] == [' tiny'] * 7
+    # The first window's refined segments are spliced in ahead of the rest of the draft
+    assert updates[1][3] == [' small'] * 3 + [' tiny'] * 4
+    assert updates[2][3] == [' small'] * 7
+
+    assert [s['id'] for s in result['segments']] == list(range(7))
+    assert result['segments'][-1]['end'] == 65.0
+    assert not any(s.get('draft') for s in result['segments'])
+    # Later windows are conditioned on the text refined so far
+    assert models['small'].clips == [(30.0, None), (35.0, ' small' * 3)]
+
+def test_draft_model_requested_returns_the_draft(models):
+    updates = []
+    result = draft_then_refine(np.zeros(SAMPLE_RATE * 20, dtype=np.float32), progressive.DRAFT_MODEL, language='en',
+                               on_update=lambda stage, partial, progress: updates.append(stage))
+    assert updates == ['draft']
+    assert result['duration'] == 20.0
+    assert not any('draft' in s for s in result['segments'])
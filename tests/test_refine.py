@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+# Re-decoding cuts clips at Whisper's sample rate
+pytest.importorskip('whisper')
+
+import refine
+from refine import find_refine_spans, needs_refinement, refine_low_confidence
+
+def segment(start, end, text, avg_logprob=-0.3, compression_ratio=1.2, no_speech_prob=0.1):
+    return {'start': start, 'end': end, 'text': text, 'avg_logprob': avg_logprob,
+            'compression_ratio': compression_ratio, 'no_speech_prob': no_speech_prob}
+
+class LargerModel:
+    """Answers every clip with one segment at the given confidence"""
+
+    def __init__(self, avg_logprob):
+        self.avg_logprob = avg_logprob
+        self.calls = []
+
+    def transcribe(self, clip, **options):
+        self.calls.append((len(clip), options))
+        return {'segments': [segment(0.0, len(clip) / 16000, ' refined', self.avg_logprob)]}
+
+@pytest.fixture
+def larger(monkeypatch):
+    def use(avg_logprob):
+        model = LargerModel(avg_logprob)
+        monkeypatch.setattr(refine, 'get_whisper_model', lambda size: model)
+        return model
+    return use
+
+def test_thresholds():
+    assert not needs_refinement(segment(0, 1, 'fine'))
+    assert needs_refinement(segment(0, 1, 'unsure', avg_logprob=-1.4))
+    assert needs_refinement(segment(0, 1, 'repeated', compression_ratio=3.0))
+    # Quiet and unsure is silence, which a larger model would only hallucinate into
+    assert not needs_refinement(segment(0, 1, '', avg_logprob=-1.4, no_speech_prob=0.9))
+
+def test_neighbouring_weak_segments_form_one_span():
+    segments = [segment(0, 2, 'a'), segment(2, 4, 'b', -1.5), segment(4.5, 6, 'c', -1.5),
+                segment(6, 8, 'd'), segment(8, 9, 'e', -1.5), segment(12, 13, 'f', -1.5)]
+    assert find_refine_spans(segments) == [(1, 2), (4, 4), (5, 5)]
+
+def test_weak_span_is_redecoded_and_spliced_in(larger):
+    model = larger(-0.2)
+    result = {'language': 'de', 'segments': [segment(0, 2, ' one'), segment(2, 4, ' two', -1.5),
+                                             segment(4, 6, ' three')]}
+
+    refined = refine_low_confidence(np.zeros(16000 * 6, dtype=np.float32), result, 'small', {})
+
+    assert [s['text'] for s in refined['segments']] == [' one', ' refined', ' three']
+    assert [(s['start'], s['end']) for s in refined['segments']] == [(0, 2), (2.0, 4.0), (4, 6)]
+    assert [s['id'] for s in refined['segments']] == [0, 1, 2]
+    assert refined['text'] == ' one refined three'
+    assert refined['refinement'] == {'model': 'small', 'spans': 1, 'segments_refined': 1, 'seconds_refined': 2}
+
+    # Only the weak span is decoded, in the first pass's language, after the preceding text
+    length, options = model.calls[0]
+    assert length == 2 * 16000
+    assert options['language'] == 'de'
+    assert options['initial_prompt'] == 'one'
+
+def test_first_pass_is_kept_when_the_larger_model_is_no_better(larger):
+    larger(-2.0)
+    result = {'segments': [segment(0, 2, ' one', -1.5), segment(2, 4, ' two')]}
+
+    refined = refine_low_confidence(np.zeros(16000 * 4, dtype=np.float32), result, 'small', {})
+
+    assert [s['text'] for s in refined['segments']] == [' one', ' two']
+    assert refined['refinement']['segments_refined'] == 0
+
+def test_confident_result_loads_no_model(monkeypatch):
+    monkeypatch.setattr(refine, 'get_whisper_model', lambda size: pytest.fail('loaded a model'))
+    result = {'segments': [segment(0, 2, ' one')]}
+    assert refine_low_confidence(np.zeros(32000, dtype=np.float32), result, 'small', {})['refinement']['spans'] == 0
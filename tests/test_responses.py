@@ -0,0 +1,88 @@
+import json
+import zlib
+
+import numpy as np
+import pytest
+from flask import Flask
+
+import responses
+from responses import negotiate_encoding, transcript_response, without_tokens
+
+SEGMENTS = [{'id': i, 'start': i * 2.0, 'end': i * 2.0 + 2, 'text': f' words {i} é', 'tokens': [50364, i]}
+            for i in range(300)]
+BODY = {'success': True, 'result': {'text': 'all the words', 'segments': SEGMENTS, 'duration': np.float32(600)},
+        'metadata': {'model': 'base'}}
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.add_url_rule('/transcript', 'transcript', lambda: transcript_response(BODY))
+    return app.test_client()
+
+@pytest.fixture
+def gzip_only(monkeypatch):
+    monkeypatch.setattr(responses, 'brotli', None)
+    monkeypatch.setattr(responses, 'zstandard', None)
+
+def test_negotiation_follows_the_client_preferences(monkeypatch, gzip_only):
+    assert negotiate_encoding('gzip, deflate') == 'gzip'
+    assert negotiate_encoding('*') == 'gzip'
+    assert negotiate_encoding('br') is None
+    assert negotiate_encoding('gzip;q=0') is None
+    assert negotiate_encoding('') is None
+
+    # Every encoding installed: ties go to the fastest, otherwise to the quality
+    monkeypatch.setattr(responses, 'brotli', object())
+    monkeypatch.setattr(responses, 'zstandard', object())
+    assert negotiate_encoding('gzip, br, zstd') == 'zstd'
+    assert negotiate_encoding('gzip;q=1.0, br;q=0.8, zstd;q=0.5') == 'gzip'
+    assert negotiate_encoding('br, *;q=0.1') == 'br'
+    assert negotiate_encoding('zstd;q=bad, br') == 'br'
+
+def test_token_ids_are_left_out_unless_asked_for(client):
+    body = client.get('/transcript').get_json()
+    assert 'tokens' not in body['result']['segments'][0]
+    assert body['result']['duration'] == 600
+
+    body = client.get('/transcript?tokens=true').get_json()
+    assert body['result']['segments'][0]['tokens'] == [50364, 0]
+    # The stored result keeps them either way
+    assert without_tokens(BODY) is not BODY and 'tokens' in SEGMENTS[0]
+
+def test_large_json_is_gzipped(client, gzip_only):
+    response = client.get('/transcript', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert json.loads(zlib.decompress(response.data, 31))['result']['segments'][1]['text'] == ' words 1 é'
+
+    assert 'Content-Encoding' not in client.get('/transcript').headers
+
+def ndjson_lines(data):
+    assert data.endswith(b'\n')
+    return [json.loads(line) for line in data.split(b'\n')[:-1]]
+
+def test_ndjson_is_the_header_then_one_line_per_segment(client, monkeypatch):
+    monkeypatch.setattr(responses, 'NDJSON_FLUSH_BYTES', 1000)
+    for query, headers in (('?format=ndjson', {}), ('', {'Accept': 'application/x-ndjson'})):
+        response = client.get('/transcript' + query, headers=headers)
+        assert response.mimetype == 'application/x-ndjson'
+        assert response.is_streamed
+
+        lines = ndjson_lines(response.data)
+        assert lines[0] == {'success': True, 'result': {'text': 'all the words', 'duration': 600},
+                            'metadata': {'model': 'base'}}
+        assert lines[1:] == [{k: v for k, v in s.items() if k != 'tokens'} for s in SEGMENTS]
+
+def test_streamed_gzip_decodes_to_the_same_lines(client, monkeypatch, gzip_only):
+    monkeypatch.setattr(responses, 'NDJSON_FLUSH_BYTES', 1000)
+    plain = client.get('/transcript?format=ndjson').data
+
+    response = client.get('/transcript?format=ndjson', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    chunks = list(response.response)
+    assert len(chunks) > 5
+    # Each batch is flushed, so what has arrived so far decodes on its own
+    decoder = zlib.decompressobj(31)
+    first = decoder.decompress(chunks[0])
+    assert first.endswith(b'\n') and len(first) >= 1000
+    assert first + b''.join(decoder.decompress(chunk) for chunk in chunks[1:]) == plain
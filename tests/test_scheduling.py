@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+import scheduling
+from scheduling import CostLimiter, FairQueue, RateLimited
+
+def take_all(queue):
+    taken = []
+    while queue.backlog()['queued']:
+        entry = queue.take()
+        taken.append(entry.item)
+        queue.done(entry)
+    return taken
+
+def test_newcomer_is_not_stuck_behind_a_batch():
+    queue = FairQueue(1, reserved=0)
+    for name in ('a1', 'a2', 'a3'):
+        queue.put(name, 'batch', 1000)
+    queue.put('b1', 'newcomer', 1000)
+
+    assert take_all(queue) == ['a1', 'b1', 'a2', 'a3']
+
+def test_weights_share_the_workers(monkeypatch):
+    monkeypatch.setitem(scheduling.CLIENT_WEIGHTS, 'heavy', 2.0)
+    queue = FairQueue(1, reserved=0)
+    for i in range(4):
+        queue.put(f'h{i}', 'heavy', 1000)
+        queue.put(f'l{i}', 'light', 1000)
+
+    assert take_all(queue)[:6] == ['h0', 'l0', 'h1', 'h2', 'l1', 'h3']
+
+def test_small_jobs_go_shortest_first():
+    queue = FairQueue(1, reserved=0)
+    queue.put('long', 'a', 200)
+    queue.put('short', 'a', 10)
+    queue.put('large', 'a', 1000)
+
+    assert take_all(queue) == ['short', 'long', 'large']
+
+def test_reserved_worker_only_takes_small_jobs():
+    queue = FairQueue(2, reserved=1)
+    queue.put('large1', 'a', 1000)
+    queue.put('large2', 'a', 1000)
+    first = queue.take()
+    assert first.item == 'large1'
+
+    taken = []
+    worker = threading.Thread(target=lambda: taken.append(queue.take()), daemon=True)
+    worker.start()
+    worker.join(0.2)
+    # The second worker is kept for small jobs while a large one runs
+    assert taken == []
+
+    queue.put('small', 'b', 10)
+    worker.join(5)
+    assert [entry.item for entry in taken] == ['small']
+
+    queue.done(taken[0])
+    queue.done(first)
+    assert queue.take().item == 'large2'
+
+def test_bucket_limits_spending():
+    limiter = CostLimiter(rate=1, burst=100)
+    limiter.charge('a', 60)
+    with pytest.raises(RateLimited) as error:
+        limiter.charge('a', 60)
+    assert error.value.retry_after == 20
+    # Other clients have their own bucket
+    limiter.charge('b', 100)
+
+def test_request_larger_than_the_bucket_goes_into_debt():
+    limiter = CostLimiter(rate=1, burst=100)
+    limiter.charge('a', 500)
+    assert limiter.tokens('a') == pytest.approx(-400, abs=1)
+    with pytest.raises(RateLimited) as error:
+        limiter.charge('a', 1)
+    assert error.value.retry_after >= 400
+
+def test_weighted_client_has_a_larger_bucket(monkeypatch):
+    monkeypatch.setitem(scheduling.CLIENT_WEIGHTS, 'vip', 2.0)
+    limiter = CostLimiter(rate=1, burst=100)
+    assert (limiter.tokens('vip'), limiter.tokens('other')) == (200, 100)
+    limiter.charge('vip', 150)
+    limiter.charge('vip', 50)
+
+def test_disabled_limiter_accepts_everything():
+    limiter = CostLimiter(rate=0)
+    limiter.charge('a', 10 ** 9)
+    assert limiter.tokens('a') is None
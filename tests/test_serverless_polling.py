@@ -0,0 +1,92 @@
+import os
+import json
+import threading
+import importlib.util
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+import pytest
+
+import client_identity
+from conftest import ROOT
+
+spec = importlib.util.spec_from_file_location('serverless_polling', os.path.join(ROOT, 'api', 'transcribe.py'))
+serverless = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(serverless)
+
+TOKEN = 'fleet-secret'
+JOB = {'id': 'abc123', 'status': 'running', 'progress': 0.5}
+
+class ProtectedWorker(BaseHTTPRequestHandler):
+    """Answers like a fleet worker: nothing under /api/ without the token"""
+
+    def do_GET(self):
+        if self.headers.get('X-Fleet-Token') != TOKEN:
+            return self._reply(403, {'error': 'Invalid fleet token'})
+        if self.path != '/api/jobs/abc123':
+            return self._reply(404, {'error': 'Job not found'})
+        self._reply(200, JOB)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('X-Fleet-Token') != TOKEN:
+            return self._reply(403, {'error': 'Invalid fleet token'})
+        self._reply(202, {'job_id': 'abc123'})
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+def serve(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+@pytest.fixture
+def function(monkeypatch):
+    worker, worker_url = serve(ProtectedWorker)
+    monkeypatch.setattr(serverless, 'FORWARDING_SECRET', TOKEN)
+    monkeypatch.setattr(client_identity, 'FORWARDING_SECRET', TOKEN)
+    monkeypatch.setattr(serverless, 'TRANSCRIBE_WORKER_URLS', [worker_url])
+    monkeypatch.setattr(serverless, 'TRANSCRIBE_PUBLIC_URL', '')
+    monkeypatch.setattr(serverless, 'SERVERLESS_WAIT_SECONDS', 0)
+    server, url = serve(serverless.handler)
+    yield url
+    server.shutdown()
+    worker.shutdown()
+
+def fetch(url, data=None, headers=None):
+    try:
+        with urlopen(Request(url, data=data, headers=headers or {}), timeout=10) as response:
+            return response.status, dict(response.headers), json.loads(response.read())
+    except HTTPError as e:
+        return e.code, dict(e.headers), json.loads(e.read())
+
+def test_poll_carries_the_fleet_token(function):
+    assert serverless.get_job(serverless.TRANSCRIBE_WORKER_URLS[0], 'abc123') == (200, JOB)
+
+def test_unfinished_job_is_polled_through_the_function(function):
+    boundary = 'form7MA4'
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="audio"; filename="a.wav"\r\n\r\n'
+            f'RIFF\r\n--{boundary}--\r\n').encode('latin-1')
+    status, headers, reply = fetch(f'{function}/api/transcribe', body,
+                                   {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    assert status == 202
+    assert reply['status_url'] == '/api/transcribe?job_id=abc123&worker=0'
+    assert headers['Location'] == reply['status_url']
+
+    # The browser never needs the token the worker asks for
+    status, _, job = fetch(function + reply['status_url'])
+    assert (status, job) == (200, JOB)
+
+def test_poll_for_an_unknown_worker_is_refused(function):
+    assert fetch(f'{function}/api/transcribe?job_id=abc123&worker=3')[0] == 404
+    assert fetch(f'{function}/api/transcribe?job_id=../health&worker=0')[0] == 404
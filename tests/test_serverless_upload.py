@@ -0,0 +1,80 @@
+import os
+import importlib.util
+
+import pytest
+
+from conftest import ROOT
+
+# api/ is deployed as separate functions, not a package
+spec = importlib.util.spec_from_file_location('serverless_transcribe', os.path.join(ROOT, 'api', 'transcribe.py'))
+serverless = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(serverless)
+
+BOUNDARY = b'----form7MA4YWxk'
+# File bytes that look like the start of a delimiter
+AUDIO = b'RIFF\r\n--' + bytes(range(256)) * 3 + b'\r\n----form7MA4' + b'\x00' * 100
+
+def body(audio=AUDIO):
+    return (
+        b'--' + BOUNDARY + b'\r\n'
+        b'Content-Disposition: form-data; name="model"\r\n\r\n'
+        b'small\r\n'
+        b'--' + BOUNDARY + b'\r\n'
+        b'Content-Disposition: form-data; name="audio"; filename="talk.wav"\r\n'
+        b'Content-Type: audio/wav\r\n\r\n' + audio + b'\r\n'
+        b'--' + BOUNDARY + b'\r\n'
+        b'Content-Disposition: form-data; name="language"\r\n\r\n'
+        b'en\r\n'
+        b'--' + BOUNDARY + b'--\r\n'
+    )
+
+def parse(chunks):
+    parser = serverless.MultipartParser(BOUNDARY)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser
+
+def check(parser):
+    assert parser.finished
+    assert parser.field('model') == 'small'
+    assert parser.field('language') == 'en'
+    assert parser.files == {'audio': {'filename': 'talk.wav', 'size': len(AUDIO)}}
+
+def test_whole_body():
+    check(parse([body()]))
+
+def test_every_split_point():
+    data = body()
+    for split in range(1, len(data)):
+        check(parse([data[:split], data[split:]]))
+
+def test_byte_at_a_time():
+    data = body()
+    check(parse([data[i:i + 1] for i in range(len(data))]))
+
+def test_field_is_not_reported_until_complete():
+    data = body()
+    parser = parse([data[:data.index(b'small') + 3]])
+    assert parser.field('model') is None
+
+    parser.feed(data[data.index(b'small') + 3:])
+    assert parser.field('model') == 'small'
+
+def test_malformed_boundary():
+    with pytest.raises(ValueError):
+        parse([b'--' + BOUNDARY + b'XX'])
+
+def test_long_field_is_refused():
+    data = (b'--' + BOUNDARY + b'\r\nContent-Disposition: form-data; name="language"\r\n\r\n'
+            + b'x' * (serverless.FIELD_MAX_BYTES + 100))
+    with pytest.raises(ValueError):
+        parse([data])
+
+def test_file_size_is_counted_without_buffering():
+    audio = b'\x01' * (3 * serverless.STREAM_CHUNK_BYTES + 5)
+    data = body(audio)
+    parser = serverless.MultipartParser(BOUNDARY)
+    for start in range(0, len(data), serverless.STREAM_CHUNK_BYTES):
+        parser.feed(data[start:start + serverless.STREAM_CHUNK_BYTES])
+        assert len(parser._buffer) <= serverless.STREAM_CHUNK_BYTES + len(parser.delimiter)
+    assert parser.files['audio']['size'] == len(audio)
@@ -0,0 +1,47 @@
+import numpy as np
+
+from speaker_index import SpeakerIndex
+
+def voice(seed):
+    return np.random.default_rng(seed).standard_normal(192).astype(np.float32)
+
+def test_recurring_speaker_keeps_identity(tmp_path):
+    index = SpeakerIndex(str(tmp_path / 'speakers.db'))
+    first = index.identify({'A': voice(1)}, 'key-a')
+    again = index.identify({'SPEAKER_00': voice(1) + 0.05 * voice(2)}, 'key-a')
+
+    assert again['SPEAKER_00']['speaker_id'] == first['A']['speaker_id']
+    assert [s['recordings'] for s in index.list('key-a')] == [2]
+
+def test_clients_do_not_share_identities(tmp_path):
+    index = SpeakerIndex(str(tmp_path / 'speakers.db'))
+    alice = index.enroll('Alice', voice(1), 'key-a')
+
+    # The same voice in another client's recording is a new, anonymous identity
+    identities = index.identify({'A': voice(1)}, 'key-b')
+    assert identities['A']['speaker_id'] != alice['speaker_id']
+    assert identities['A']['label'].startswith('Speaker #')
+
+    assert [s['name'] for s in index.list('key-b')] == [None]
+    assert index.get(alice['speaker_id'], 'key-b') is None
+    assert index.rename(alice['speaker_id'], 'Mallory', 'key-b') is None
+    assert not index.delete(alice['speaker_id'], 'key-b')
+    assert index.get(alice['speaker_id'], 'key-a')['name'] == 'Alice'
+    assert index.identify({'A': voice(1)}, 'key-a')['A']['name'] == 'Alice'
+
+def test_owner_can_rename_and_delete(tmp_path):
+    index = SpeakerIndex(str(tmp_path / 'speakers.db'))
+    speaker_id = index.identify({'A': voice(3)}, 'key-a')['A']['speaker_id']
+
+    assert index.rename(speaker_id, 'Bob', 'key-a')['name'] == 'Bob'
+    assert index.delete(speaker_id, 'key-a')
+    assert index.list('key-a') == []
+
+def test_command_line_identities_stay_out_of_client_lookups(tmp_path):
+    index = SpeakerIndex(str(tmp_path / 'speakers.db'))
+    local = index.enroll('Carol', voice(4), None)
+
+    # Looking up without remembering neither matches nor adds anything for the client
+    assert index.identify({'A': voice(4)}, 'key-a', remember=False) == {}
+    assert index.list('key-a') == []
+    assert index.identify({'A': voice(4)}, None)['A']['speaker_id'] == local['speaker_id']
@@ -0,0 +1,49 @@
+from transcripts import TranscriptStore, fts_query
+
+def response(*texts):
+    segments = [{'start': i * 5.0, 'end': i * 5.0 + 5, 'speaker': None, 'text': text}
+                for i, text in enumerate(texts)]
+    return {'result': {'segments': segments, 'language': 'en', 'duration': len(texts) * 5.0},
+            'metadata': {'filename': 'meeting.wav', 'model': 'base'}}
+
+def test_search_finds_phrase_with_offset(tmp_path):
+    store = TranscriptStore(str(tmp_path / 'transcripts.db'))
+    store.add('job1', response('hello there', 'the budget review is late'), 'key-a')
+
+    results = store.search('"budget review"', 'key-a')
+
+    assert [(r['job_id'], r['start']) for r in results] == [('job1', 5.0)]
+    assert results[0]['snippet'] == 'the [budget review] is late'
+
+def test_clients_only_find_their_own_transcripts(tmp_path):
+    store = TranscriptStore(str(tmp_path / 'transcripts.db'))
+    store.add('job-a', response('quarterly salary figures'), 'key-a')
+    store.add('job-b', response('salary review for the team'), 'key-b')
+
+    assert [r['job_id'] for r in store.search('salary', 'key-a')] == ['job-a']
+    assert [r['job_id'] for r in store.search('salary', 'key-b')] == ['job-b']
+    assert store.search('quarterly', 'key-b') == []
+    assert store.search('quarterly', 'key-b', job_id='job-a') == []
+
+def test_readding_a_job_replaces_it(tmp_path):
+    store = TranscriptStore(str(tmp_path / 'transcripts.db'))
+    store.add('job1', response('first draft'), 'key-a')
+    store.add('job1', response('final version'), 'key-a')
+
+    assert store.search('draft', 'key-a') == []
+    assert len(store.search('final', 'key-a')) == 1
+    assert store.stats()['transcripts'] == 1
+
+def test_readded_job_belongs_to_its_new_client(tmp_path):
+    store = TranscriptStore(str(tmp_path / 'transcripts.db'))
+    store.add('job1', response('budget figures'), 'key-a')
+    store.add('job1', response('budget figures'), 'key-b')
+
+    assert store.search('budget', 'key-a') == []
+    assert [r['job_id'] for r in store.search('budget', 'key-b')] == ['job1']
+
+def test_fts_query_keeps_user_input_literal():
+    assert fts_query('budget review') == '"budget" "review"'
+    assert fts_query('"budget review" plan*') == '"budget review" "plan"*'
+    assert fts_query('a"b OR NOT') == '"ab" "OR" "NOT"'
+    assert fts_query('  ') == ''
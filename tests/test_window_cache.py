@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+# window_cache runs Whisper for windows it has not seen
+pytest.importorskip('whisper')
+
+from window_cache import Fingerprint, WindowCache, find_windows
+
+SAMPLE_RATE = 16000
+
+def speech_like(seconds, seed, level=0.1):
+    """Noise bursts at a steady level with short pauses, like even speech"""
+    rng = np.random.default_rng(seed)
+    audio = (rng.standard_normal(int(seconds * SAMPLE_RATE)) * level).astype(np.float32)
+    for start in range(0, len(audio), 3 * SAMPLE_RATE):
+        audio[start:start + SAMPLE_RATE // 2] *= 0.001
+    return audio
+
+def speech_with_pauses(seconds, seed):
+    """Bursts of varying length and level separated by pauses of varying length"""
+    rng = np.random.default_rng(seed)
+    parts = []
+    while sum(len(part) for part in parts) < seconds * SAMPLE_RATE:
+        parts.append(rng.standard_normal(int(rng.uniform(1, 6) * SAMPLE_RATE)) * rng.uniform(0.05, 0.3))
+        parts.append(rng.standard_normal(int(rng.uniform(0.2, 1.2) * SAMPLE_RATE)) * 0.002)
+    return np.concatenate(parts)[:int(seconds * SAMPLE_RATE)].astype(np.float32)
+
+def keys(audio):
+    return [Fingerprint(audio[start:end]).key for start, end in find_windows(audio)]
+
+def test_same_audio_has_the_same_key():
+    clip = speech_like(20, seed=1)
+    assert Fingerprint(clip).key == Fingerprint(clip.copy()).key
+
+def test_similar_sounding_recordings_differ():
+    assert Fingerprint(speech_like(20, seed=1)).key != Fingerprint(speech_like(20, seed=2)).key
+
+def test_a_single_changed_sample_differs():
+    clip = speech_like(20, seed=1)
+    changed = clip.copy()
+    changed[12345] += 1e-4
+    assert Fingerprint(clip).key != Fingerprint(changed).key
+
+def test_cache_returns_results_only_for_the_same_audio(tmp_path):
+    cache = WindowCache(str(tmp_path), max_mb=10)
+    clip, other = speech_like(20, seed=1), speech_like(20, seed=2)
+    cache.put('transcripts', Fingerprint(clip), 'base', {'segments': [{'text': 'private words'}]})
+
+    assert cache.get('transcripts', Fingerprint(clip.copy()), 'base') == {'segments': [{'text': 'private words'}]}
+    assert cache.get('transcripts', Fingerprint(other), 'base') is None
+    assert cache.get('transcripts', Fingerprint(clip), 'small') is None
+
+def test_windows_cover_the_recording():
+    audio = speech_with_pauses(300, seed=3)
+    windows = find_windows(audio)
+    assert windows[0][0] == 0 and windows[-1][1] == len(audio)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(windows, windows[1:]))
+    assert all(0 < end - start <= 30 * SAMPLE_RATE for start, end in windows)
+
+def test_windows_before_the_end_survive_a_growing_recording():
+    audio = speech_like(120, seed=3)
+    grown = np.concatenate([audio, speech_like(60, seed=4)])
+    first = keys(audio)[:-1]
+    assert first and set(first) <= set(keys(grown))
+
+@pytest.mark.parametrize('trimmed', [1, 77, 1234, 7 * SAMPLE_RATE + 33])
+def test_trimmed_copy_reuses_cached_windows(tmp_path, trimmed):
+    cache = WindowCache(str(tmp_path), max_mb=10)
+    audio = speech_with_pauses(300, seed=3)
+    for start, end in find_windows(audio):
+        cache.put('transcripts', Fingerprint(audio[start:end]), 'base', {'start': start})
+
+    copy = audio[trimmed:]
+    hits = [cache.get('transcripts', Fingerprint(copy[start:end]), 'base') for start, end in find_windows(copy)]
+    # Only the windows at the cut may change
+    assert sum(hit is None for hit in hits) <= 2
+    assert all(hit['start'] == start + trimmed
+               for hit, (start, _) in zip(hits, find_windows(copy)) if hit is not None)
+
+def test_trimmed_copy_with_digital_silence_keeps_its_cuts():
+    audio = speech_with_pauses(300, seed=5)
+    audio[np.abs(audio) < 0.01] = 0
+    original = set(keys(audio))
+    copy = keys(audio[1234:])
+    assert sum(key not in original for key in copy) <= 2
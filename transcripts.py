@@ -0,0 +1,210 @@
+"""
+Transcript store for ConvertAnything
+Keeps every finished transcript's segments, with speaker and timing, in an
+SQLite database with an FTS5 full-text index over their text, so a phrase
+can be found, with its offset in the audio, without transcribing again.
+Each transcript belongs to the client that submitted it, and searches only
+see the caller's own transcripts.
+"""
+
+import os
+import re
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from ownership import owner_key
+
+# Database file; empty disables the store
+TRANSCRIPT_DB = os.getenv(
+    'TRANSCRIPT_DB',
+    str(Path.home() / '.cache' / 'convertanything' / 'transcripts.db')
+)
+
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 500
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS transcripts (
+    id INTEGER PRIMARY KEY,
+    job_id TEXT UNIQUE,
+    owner TEXT,
+    filename TEXT,
+    language TEXT,
+    duration REAL,
+    model TEXT,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    transcript_id INTEGER NOT NULL REFERENCES transcripts(id) ON DELETE CASCADE,
+    start REAL,
+    end REAL,
+    speaker TEXT,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS segments_transcript ON segments(transcript_id);
+CREATE INDEX IF NOT EXISTS transcripts_owner ON transcripts(owner);
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+    text, content='segments', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+'''
+
+def fts_query(query):
+    """
+    Turn a search box query into an FTS5 expression
+
+    Words must all appear; "quoted text" must appear as a phrase, and a
+    trailing * matches word prefixes. Everything else is taken literally,
+    so user input cannot produce an FTS5 syntax error.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+        text = phrase or word.replace('"', '')
+        prefix = not phrase and text.endswith('*')
+        text = text.rstrip('*').strip()
+        if text:
+            terms.append('"' + text.replace('"', '""') + '"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+class TranscriptStore:
+    """
+    SQLite transcript store shared by the threads and processes on a host
+
+    Args:
+        path (str): Database file
+    """
+
+    def __init__(self, path=TRANSCRIPT_DB):
+        self.path = path
+        self._local = threading.local()
+        self._schema_ready = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10)
+            # Readers keep searching while a finished job is being indexed
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA foreign_keys=ON')
+            self._local.connection = connection
+        with self._lock:
+            if not self._schema_ready:
+                connection.executescript(SCHEMA)
+                self._schema_ready = True
+        return connection
+
+    def add(self, job_id, response, client_id):
+        """
+        Index a finished transcription, replacing an earlier one with the same job id
+
+        Args:
+            job_id (str): Job the transcript came from
+            response (dict): Transcription response with 'result' and 'metadata'
+            client_id (str): Client that submitted the job and may search it
+        """
+        result = response.get('result') or {}
+        metadata = response.get('metadata') or {}
+        connection = self._connect()
+        with connection:
+            self._delete(connection, job_id)
+            cursor = connection.execute(
+                'INSERT INTO transcripts (job_id, owner, filename, language, duration, model, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, owner_key(client_id), metadata.get('filename'), result.get('language'), result.get('duration'),
+                 metadata.get('model'), metadata.get('processed_at') or datetime.now().isoformat())
+            )
+            transcript_id = cursor.lastrowid
+            connection.executemany(
+                'INSERT INTO segments (transcript_id, start, end, speaker, text) VALUES (?, ?, ?, ?, ?)',
+                ((transcript_id, segment.get('start'), segment.get('end'), segment.get('speaker'),
+                  segment.get('text', '').strip())
+                 for segment in result.get('segments', []))
+            )
+            # The index is external-content, so it is fed the new rows explicitly
+            connection.execute(
+                'INSERT INTO segments_fts (rowid, text) SELECT id, text FROM segments WHERE transcript_id = ?',
+                (transcript_id,)
+            )
+
+    def _delete(self, connection, job_id):
+        row = connection.execute('SELECT id FROM transcripts WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None:
+            return
+        connection.execute(
+            "INSERT INTO segments_fts (segments_fts, rowid, text) "
+            "SELECT 'delete', id, text FROM segments WHERE transcript_id = ?",
+            (row[0],)
+        )
+        connection.execute('DELETE FROM segments WHERE transcript_id = ?', (row[0],))
+        connection.execute('DELETE FROM transcripts WHERE id = ?', (row[0],))
+
+    def delete(self, job_id):
+        """Remove a transcript and its index entries"""
+        connection = self._connect()
+        with connection:
+            self._delete(connection, job_id)
+
+    def search(self, query, client_id, limit=SEARCH_DEFAULT_LIMIT, job_id=None):
+        """
+        Find segments of a client's transcripts containing the query, best matches first
+
+        Args:
+            query (str): Words, "phrases" and prefix* terms, see fts_query()
+            client_id (str): Client whose transcripts are searched
+            limit (int): Maximum number of segments to return
+            job_id (str): Only search this job's transcript
+
+        Returns:
+            list: {job_id, filename, start, end, speaker, text, snippet} per match
+        """
+        expression = fts_query(query)
+        if not expression:
+            return []
+        sql = (
+            "SELECT t.job_id, t.filename, s.start, s.end, s.speaker, s.text, "
+            "snippet(segments_fts, 0, '[', ']', '...', 16) "
+            "FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid "
+            "JOIN transcripts t ON t.id = s.transcript_id "
+            "WHERE segments_fts MATCH ? AND t.owner = ?"
+        )
+        params = [expression, owner_key(client_id)]
+        if job_id:
+            sql += " AND t.job_id = ?"
+            params.append(job_id)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(max(1, min(limit, SEARCH_MAX_LIMIT)))
+
+        rows = self._connect().execute(sql, params).fetchall()
+        return [
+            {'job_id': job, 'filename': filename, 'start': start, 'end': end,
+             'speaker': speaker, 'text': text, 'snippet': snippet}
+            for job, filename, start, end, speaker, text, snippet in rows
+        ]
+
+    def stats(self):
+        """Number of transcripts and segments, and hours of audio, in the whole store"""
+        row = self._connect().execute(
+            'SELECT COUNT(*), COALESCE(SUM(duration), 0) FROM transcripts'
+        ).fetchone()
+        segments = self._connect().execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+        return {'transcripts': row[0], 'segments': segments, 'hours': round(row[1] / 3600, 2)}
+
+# Shared by all requests in this process
+transcript_store = TranscriptStore()
+
+def index_finished_job(job):
+    """Job finish hook: add completed transcriptions to the store"""
+    if job.status != 'completed' or not transcript_store.enabled:
+        return
+    started = time.time()
+    transcript_store.add(job.id, job.result, job.client_id)
+    print(f"Indexed transcript of job {job.id} in {time.time() - started:.2f}s")
@@ -0,0 +1,356 @@
+"""
+Resumable chunked uploads for ConvertAnything
+Large files arrive as numbered parts that clients may send in parallel and
+retry one by one. Each part is verified and written at its offset in the
+upload, so after a dropped connection only the missing parts are sent
+again, and the leading bytes can be decoded before the last part arrives.
+"""
+
+import os
+import json
+import time
+import uuid
+import wave
+import shutil
+import hashlib
+import threading
+import subprocess
+
+import numpy as np
+
+from compact_audio import compact_format, SAMPLE_RATE
+
+# Where upload sessions are assembled; shared by the worker processes on a host
+UPLOAD_SESSION_DIR = os.getenv('UPLOAD_SESSION_DIR', os.path.join('temp_uploads', 'sessions'))
+
+# Part size offered to clients, and the range they may choose from
+UPLOAD_PART_SIZE = int(os.getenv('UPLOAD_PART_SIZE', str(8 * 1024 * 1024)))
+UPLOAD_PART_SIZE_LIMITS = (256 * 1024, 64 * 1024 * 1024)
+
+# Uploads that receive nothing for this long are discarded
+UPLOAD_SESSION_SECONDS = int(os.getenv('UPLOAD_SESSION_SECONDS', '3600'))
+
+class UploadError(Exception):
+    """Raised when a part or a commit does not match the upload"""
+
+def _write_json(path, data):
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+class UploadSession:
+    """
+    One upload being assembled on disk
+
+    Parts are written straight into a file of the final size; a marker file
+    per part records that it arrived intact, so any worker process can
+    accept parts and any other can see how far the upload has got.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'session.json'), 'r', encoding='utf-8') as f:
+            self.info = json.load(f)
+        self.id = self.info['upload_id']
+        self.filename = self.info['filename']
+        self.size = self.info['size']
+        self.part_size = self.info['part_size']
+        self.options = self.info['options']
+        self.data_path = os.path.join(path, 'data')
+
+    @property
+    def part_count(self):
+        return max(1, -(-self.size // self.part_size))
+
+    @property
+    def job_id(self):
+        return self.info.get('job_id')
+
+    def set_job(self, job_id):
+        self.info['job_id'] = job_id
+        _write_json(os.path.join(self.path, 'session.json'), self.info)
+
+    def part_length(self, index):
+        return min(self.part_size, self.size - index * self.part_size)
+
+    def write_part(self, index, data, sha256=None):
+        """
+        Verify a part and write it at its offset
+
+        Args:
+            index (int): Part number, from 0
+            data (bytes): The part's bytes
+            sha256 (str): Hex digest the client computed, checked when given
+
+        Raises:
+            UploadError: If the part is out of range, the wrong length or corrupt
+        """
+        if self.committed:
+            raise UploadError('Upload is already complete')
+        if not 0 <= index < self.part_count:
+            raise UploadError(f'Part {index} is out of range (0-{self.part_count - 1})')
+        if len(data) != self.part_length(index):
+            raise UploadError(f'Part {index} must be {self.part_length(index)} bytes, got {len(data)}')
+        digest = hashlib.sha256(data).hexdigest()
+        if sha256 and sha256.lower() != digest:
+            raise UploadError(f'Part {index} failed its checksum')
+
+        fd = os.open(self.data_path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, index * self.part_size)
+        finally:
+            os.close(fd)
+        # The marker goes last, so a part counts only once all its bytes are written
+        _write_json(os.path.join(self.path, 'parts', str(index)), {'sha256': digest})
+
+    def received(self):
+        """Numbers of the parts that have arrived"""
+        try:
+            return sorted(int(name) for name in os.listdir(os.path.join(self.path, 'parts')) if name.isdigit())
+        except OSError:
+            return []
+
+    def missing(self):
+        received = set(self.received())
+        return [index for index in range(self.part_count) if index not in received]
+
+    def contiguous_bytes(self):
+        """Length of the upload's prefix that has fully arrived"""
+        count = 0
+        for index in self.received():
+            if index != count:
+                break
+            count += 1
+        return min(count * self.part_size, self.size)
+
+    def read(self, start, end):
+        with open(self.data_path, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    @property
+    def committed(self):
+        return os.path.exists(os.path.join(self.path, 'committed'))
+
+    def commit(self, sha256=None):
+        """
+        Mark the upload complete once every part is in
+
+        Raises:
+            UploadError: If parts are missing or the whole file fails its checksum
+        """
+        missing = self.missing()
+        if missing:
+            raise UploadError(f'{len(missing)} parts are still missing')
+        expected = sha256 or self.info.get('sha256')
+        if expected:
+            digest = hashlib.sha256()
+            with open(self.data_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+            if digest.hexdigest() != expected.lower():
+                raise UploadError('Upload failed its checksum')
+        with open(os.path.join(self.path, 'committed'), 'w'):
+            pass
+
+    def idle_seconds(self):
+        """Seconds since the upload last received a part"""
+        try:
+            return time.time() - max(os.path.getmtime(os.path.join(self.path, 'parts')),
+                                     os.path.getmtime(os.path.join(self.path, 'session.json')))
+        except OSError:
+            return 0
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def to_dict(self):
+        received = self.received()
+        return {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'part_size': self.part_size,
+            'parts': self.part_count,
+            'received': len(received),
+            'missing': [index for index in range(self.part_count) if index not in set(received)],
+            'committed': self.committed,
+            'job_id': self.job_id,
+        }
+
+class UploadStore:
+    """
+    Directory of upload sessions
+
+    Args:
+        root (str): Directory holding one subdirectory per upload
+    """
+
+    def __init__(self, root=UPLOAD_SESSION_DIR):
+        self.root = root
+
+    def create(self, filename, size, options, part_size=None, sha256=None):
+        """
+        Start an upload of a known size
+
+        Args:
+            filename (str): Original file name
+            size (int): Total size in bytes
+            options (dict): Transcription options for the upload
+            part_size (int): Part size the client wants, within UPLOAD_PART_SIZE_LIMITS
+            sha256 (str): Hex digest of the whole file, checked on commit when given
+
+        Returns:
+            UploadSession
+        """
+        if size <= 0:
+            raise UploadError('Upload size must be positive')
+        part_size = min(max(part_size or UPLOAD_PART_SIZE, UPLOAD_PART_SIZE_LIMITS[0]), UPLOAD_PART_SIZE_LIMITS[1])
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self.root, upload_id)
+        os.makedirs(os.path.join(path, 'parts'))
+        with open(os.path.join(path, 'data'), 'wb') as f:
+            f.truncate(size)
+        _write_json(os.path.join(path, 'session.json'), {
+            'upload_id': upload_id,
+            'filename': filename,
+            'size': size,
+            'part_size': part_size,
+            'sha256': sha256,
+            'options': options,
+            'created_at': time.time(),
+        })
+        return UploadSession(path)
+
+    def get(self, upload_id):
+        """Return an upload session by id, or None"""
+        if not upload_id.isalnum():
+            return None
+        try:
+            return UploadSession(os.path.join(self.root, upload_id))
+        except (OSError, ValueError):
+            return None
+
+    def expire(self):
+        """Discard uploads nobody has sent a part to for UPLOAD_SESSION_SECONDS"""
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+        for name in names:
+            session = self.get(name)
+            if session is not None and session.idle_seconds() > UPLOAD_SESSION_SECONDS:
+                print(f"Upload {name} expired")
+                session.remove()
+
+# Shared by all requests in this process
+upload_store = UploadStore()
+
+class PrefixDecoder:
+    """
+    Decode a file to 16 kHz mono samples while its bytes are still arriving
+
+    Bytes are piped into ffmpeg as they come. Formats ffmpeg cannot read
+    without seeking (e.g. MP4 with its index at the end) fail here and are
+    decoded from the finished file instead. Compact 16-bit uploads are
+    already samples and skip ffmpeg.
+    """
+
+    def __init__(self):
+        self.failed = False
+        self._pcm = bytearray()
+        self._lock = threading.Lock()
+        self._process = None
+        # Bytes of the compact upload's header still to skip, and of samples still to come
+        self._skip = None
+        self._remaining = None
+
+    def _start(self, head):
+        layout = compact_format(head)
+        if layout is not None and layout[2].kind == 'i':
+            self._skip, self._remaining = layout[0], layout[1]
+            return
+        try:
+            self._process = subprocess.Popen(
+                ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', 'pipe:0',
+                 '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), 'pipe:1'],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+        except OSError as e:
+            print(f"Warning: Cannot decode uploads while they arrive: {e}")
+            self.failed = True
+            return
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        fd = self._process.stdout.fileno()
+        while True:
+            chunk = os.read(fd, 1 << 16)
+            if not chunk:
+                break
+            with self._lock:
+                self._pcm.extend(chunk)
+
+    def feed(self, data):
+        if self._process is None and self._skip is None and not self.failed:
+            self._start(data)
+        if self.failed:
+            return
+        if self._skip is not None:
+            data = data[self._skip:]
+            self._skip = 0
+            if self._remaining is not None:
+                data = data[:self._remaining]
+                self._remaining -= len(data)
+            with self._lock:
+                self._pcm.extend(data)
+            return
+        try:
+            self._process.stdin.write(data)
+            self._process.stdin.flush()
+        except OSError:
+            self.failed = True
+
+    @property
+    def seconds(self):
+        """Duration decoded so far"""
+        with self._lock:
+            return len(self._pcm) / 2 / SAMPLE_RATE
+
+    def samples(self):
+        """Copy of the samples decoded so far, as float32"""
+        with self._lock:
+            pcm = bytes(self._pcm[:len(self._pcm) // 2 * 2])
+        return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+    def finish(self):
+        """Wait for ffmpeg to decode the rest; returns False if decoding failed"""
+        if self._skip is not None:
+            return True
+        if self._process is None:
+            return False
+        try:
+            self._process.stdin.close()
+        except OSError:
+            self.failed = True
+        self.failed = self._process.wait() != 0 or self.failed
+        self._reader.join()
+        return not self.failed
+
+    def abort(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+
+    def save_wav(self, path):
+        """Write the decoded samples as a 16 kHz mono WAV file"""
+        with self._lock:
+            pcm = bytes(self._pcm[:len(self._pcm) // 2 * 2])
+        with wave.open(path, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(SAMPLE_RATE)
+            f.writeframes(pcm)
+        return path